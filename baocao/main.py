@@ -6,12 +6,18 @@ Tính toán các chỉ tiêu khoán theo phương án khoán lương 2025
 
 import os
 import re
+import sys
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor
 from dataclasses import dataclass, asdict
 import json
 
+# Reader dùng chung với python-analytics (mmap, không copy cả file vào str)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'python-analytics'))
+from log_reader import MappedLogFile
+
 @dataclass
 class ProductionMetrics:
     """Chỉ tiêu sản xuất theo phương án khoán"""
@@ -76,6 +82,15 @@ class ProductionMetrics:
 class LogParser:
     """Parse log files từ cảm biến IoT"""
     
+    PATTERN = re.compile(rb'\[(.+?)\] Count: (\d+)')
+    
+    @staticmethod
+    def _to_record(match: re.Match) -> Tuple[datetime, int]:
+        timestamp_str = match.group(1).decode('utf-8')
+        count = int(match.group(2))
+        timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+        return timestamp, count
+    
     @staticmethod
     def parse_log_file(filepath: str) -> List[Tuple[datetime, int]]:
         """
@@ -83,22 +98,34 @@ class LogParser:
         Returns: List của (timestamp, count)
         """
         data = []
-        pattern = r'\[(.+?)\] Count: (\d+)'
         
         try:
-            with open(filepath, 'r') as f:
-                for line in f:
-                    match = re.search(pattern, line)
-                    if match:
-                        timestamp_str = match.group(1)
-                        count = int(match.group(2))
-                        timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                        data.append((timestamp, count))
+            with MappedLogFile(filepath) as log_file:
+                for match in LogParser.PATTERN.finditer(log_file.buffer):
+                    data.append(LogParser._to_record(match))
         except Exception as e:
             print(f"Error parsing {filepath}: {e}")
         
         return data
     
+    @staticmethod
+    def get_batch_bounds(filepath: str) -> Optional[Tuple[Tuple[datetime, int], Tuple[datetime, int]]]:
+        """
+        Lấy bản ghi đầu và cuối của 1 file log
+        Chỉ đọc dòng đầu / dòng cuối (không quét toàn bộ file)
+        Returns: ((timestamp, count) đầu, (timestamp, count) cuối) hoặc None
+        """
+        try:
+            with MappedLogFile(filepath) as log_file:
+                first = log_file.first_match(LogParser.PATTERN)
+                last = log_file.last_match(LogParser.PATTERN)
+                if first is None or last is None:
+                    return None
+                return LogParser._to_record(first), LogParser._to_record(last)
+        except Exception as e:
+            print(f"Error parsing {filepath}: {e}")
+            return None
+    
     @staticmethod
     def get_batch_total(data: List[Tuple[datetime, int]]) -> int:
         """
@@ -113,30 +140,55 @@ class LogParser:
         return data[-1][1] - data[0][1]
     
     @staticmethod
-    def get_all_batches_total(folder_path: str) -> int:
-        """Tổng tất cả các batch trong folder"""
+    def get_all_batches_total(folder_path: str, log: Callable[[str], None] = print) -> int:
+        """
+        Tổng tất cả các batch trong folder
+        log: hàm in log (worker process gom log lại để in theo thứ tự)
+        """
         total = 0
         txt_files = sorted(Path(folder_path).glob('*.txt'))
         
-        print(f"        📄 Found {len(txt_files)} log files")
+        log(f"        📄 Found {len(txt_files)} log files")
         
         for file in txt_files:
-            data = LogParser.parse_log_file(str(file))
-            if data:
-                batch_count = LogParser.get_batch_total(data)
+            bounds = LogParser.get_batch_bounds(str(file))
+            if bounds:
+                (_, first_count), (_, last_count) = bounds
+                # = get_batch_total: count cuối - count đầu
+                batch_count = last_count - first_count
                 total += batch_count
-                first_count = data[0][1] if data else 0
-                last_count = data[-1][1] if data else 0
-                print(f"           {file.name}: {last_count} - {first_count} = {batch_count} viên")
+                log(f"           {file.name}: {last_count} - {first_count} = {batch_count} viên")
         
         return total
 
 
+def _count_folder_task(folder: str) -> Tuple[str, int, List[str]]:
+    """Worker: đếm 1 folder vị trí, trả về (folder, tổng, log lines)"""
+    lines: List[str] = []
+    total = LogParser.get_all_batches_total(folder, log=lines.append)
+    return folder, total, lines
+
+
 class ProductionAnalyzer:
     """Phân tích sản xuất theo phương án khoán"""
     
     def __init__(self, log_root_dir: str):
         self.log_root = Path(log_root_dir)
+        # folder → (count, log lines) đã tính sẵn bởi process pool
+        self.folder_counts: Dict[str, Tuple[int, List[str]]] = {}
+    
+    def precount_folders(self, folders: List[Path], executor: Executor, workers: int):
+        """
+        Tính song song count của các folder (mỗi folder = 1 task)
+        Kết quả lưu vào folder_counts; _get_count dùng lại theo đúng thứ tự như chạy tuần tự
+        """
+        folder_keys = sorted(str(f) for f in folders)
+        if not folder_keys:
+            return
+        
+        chunksize = max(1, len(folder_keys) // (workers * 4))
+        for folder, total, lines in executor.map(_count_folder_task, folder_keys, chunksize=chunksize):
+            self.folder_counts[folder] = (total, lines)
         
     def analyze_daily_production(self, date: str, production_line: str) -> ProductionMetrics:
         """
@@ -351,7 +403,13 @@ class ProductionAnalyzer:
             print(f"        ⚠️  Folder not found: {folder}")
             return 0
         
-        count = LogParser.get_all_batches_total(str(folder))
+        cached = self.folder_counts.get(str(folder))
+        if cached is not None:
+            count, lines = cached
+            for line in lines:
+                print(line)
+        else:
+            count = LogParser.get_all_batches_total(str(folder))
         print(f"        📂 {folder.name}: {count} viên")
         return count
     
@@ -436,9 +494,14 @@ class KhoanCalculator:
         return result
 
 
-def generate_daily_report(date: str, log_root: str, output_file: str):
+def generate_daily_report(date: str, log_root: str, output_file: str,
+                          workers: int = 1, executor: Optional[Executor] = None):
     """
     Tạo báo cáo tổng hợp cuối ngày
+    
+    Args:
+        workers: Số process song song (1 = tuần tự như cũ)
+        executor: Process pool dùng chung (khi tạo báo cáo cho nhiều ngày)
     """
     analyzer = ProductionAnalyzer(log_root)
     
@@ -450,6 +513,21 @@ def generate_daily_report(date: str, log_root: str, output_file: str):
     # Phân tích từng dây chuyền
     lines = ["Dây chuyền 1", "Dây chuyền 2", "Dây chuyền 5", "Dây chuyền 6"]
     
+    # Song song: đọc log của mọi (dây chuyền, dòng gạch, vị trí) trên process pool,
+    # sau đó ghép kết quả tuần tự => báo cáo giống hệt chế độ tuần tự
+    if workers > 1 or executor is not None:
+        folders = []
+        for line in lines:
+            line_folder = Path(log_root) / "logs" / date / line
+            if line_folder.exists():
+                folders.extend(p for p in line_folder.rglob('*') if p.is_dir())
+        
+        if executor is not None:
+            analyzer.precount_folders(folders, executor, workers)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                analyzer.precount_folders(folders, pool, workers)
+    
     for line in lines:
         try:
             print(f"\n📊 Analyzing {line}...")
@@ -515,14 +593,8 @@ def generate_daily_report(date: str, log_root: str, output_file: str):
     return report
 
 
-if __name__ == "__main__":
-    # Example usage
-    date = "2025-11-19"
-    log_root = "./tile-production-management"
-    output = f"report_{date}.json"
-    
-    report = generate_daily_report(date, log_root, output)
-    
+def print_summary(date: str, report: Dict):
+    """In tóm tắt báo cáo"""
     # In tóm tắt
     print("\n" + "="*60)
     print("=== BÁO CÁO SẢN XUẤT ===")
@@ -540,7 +612,7 @@ if __name__ == "__main__":
             print(f"     - Sản lượng sau ép (100%): {metrics['sl_ep']} viên")
             print(f"     - Sản lượng trước lò: {metrics['sl_truoc_lo']} viên")
             print(f"     - Sản lượng sau lò: {metrics['sl_sau_lo']} viên")
-            print(f"     - Sản lượng sau mài: {metrics['sl_sau_mai']} viên")
+            print(f"     - Sản lượng sau mài: {metrics['sl_sau_mc']} viên")
             print(f"     - Sản lượng trước đóng hộp: {metrics['sl_truoc_dh']} viên")
             print(f"     ---")
             print(f"     - Hao phí mộc: {metrics['hp_moc']} viên")
@@ -553,4 +625,26 @@ if __name__ == "__main__":
             validation_icon = '✓' if data['validation']['is_valid'] else '✗'
             print(f"     - Validation: {validation_icon} (Tổng: {data['validation']['total_percentage']:.2f}%)")
     
-    print("\n" + "="*60)
\ No newline at end of file
+    print("\n" + "="*60)
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Báo cáo sản xuất cuối ngày")
+    parser.add_argument('dates', nargs='*', default=["2025-11-19"], help="Ngày (YYYY-MM-DD), có thể nhiều ngày")
+    parser.add_argument('--log-root', default="./tile-production-management")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('REPORT_WORKERS', 1)),
+                        help="Số process song song (mặc định: REPORT_WORKERS hoặc 1)")
+    args = parser.parse_args()
+    
+    # 1 process pool dùng chung cho tất cả các ngày
+    pool = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+    try:
+        for date in args.dates:
+            output = f"report_{date}.json"
+            report = generate_daily_report(date, args.log_root, output, args.workers, pool)
+            print_summary(date, report)
+    finally:
+        if pool is not None:
+            pool.shutdown()
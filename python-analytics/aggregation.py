@@ -0,0 +1,164 @@
+"""
+Incrementally maintained aggregates
+Plant → production line → brick type → position totals, updated by applying
+the difference between a device's old and new metrics to the nodes above it,
+so one device update touches O(depth) nodes instead of re-summing every device
+"""
+from typing import Dict, Iterable, Optional, Set, Tuple
+from models import DeviceMetrics, LineMetrics
+
+
+# (devices, running devices, produced today, sum of speed per hour) of one device
+Contribution = Tuple[int, int, int, float]
+
+# (production line, brick type, position, device ID): one log file location in the
+# LogIndex; a device with files in several brick-type folders is several leaves
+DeviceKey = Tuple[str, str, str, str]
+
+
+def contribution(metrics: DeviceMetrics) -> Contribution:
+    return (1, int(metrics.is_running), int(metrics.total_produced_today),
+            float(metrics.speed_per_hour))
+
+
+class AggregateNode:
+    """Totals of every device below one node"""
+    
+    __slots__ = ('name', 'parent', 'children', 'devices', 'running', 'produced', 'speed_sum')
+    
+    def __init__(self, name: str, parent: Optional['AggregateNode'] = None):
+        self.name = name
+        self.parent = parent
+        self.children: Dict[str, 'AggregateNode'] = {}
+        self.devices = 0
+        self.running = 0
+        self.produced = 0
+        self.speed_sum = 0.0
+    
+    def child(self, name: str) -> 'AggregateNode':
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = AggregateNode(name, self)
+        return node
+    
+    def apply(self, devices: int, running: int, produced: int, speed: float):
+        """Add a difference to this node and every ancestor"""
+        node = self
+        while node is not None:
+            node.devices += devices
+            node.running += running
+            node.produced += produced
+            node.speed_sum += speed
+            node = node.parent
+    
+    @property
+    def average_speed(self) -> float:
+        return self.speed_sum / self.devices if self.devices else 0.0
+
+
+class AggregationTree:
+    """Latest DeviceMetrics of every device location with their line / plant totals kept current"""
+    
+    def __init__(self):
+        self.plant = AggregateNode('plant')
+        # Device location -> (position node, contribution, metrics)
+        self.leaves: Dict[DeviceKey, Tuple[AggregateNode, Contribution, DeviceMetrics]] = {}
+        # Production line -> device location -> metrics, in the order locations were first seen
+        self.line_devices: Dict[str, Dict[DeviceKey, DeviceMetrics]] = {}
+    
+    def update(self, metrics: DeviceMetrics, brick_type: str = 'unknown') -> DeviceKey:
+        """
+        Replace a device's metrics and apply the difference up to the plant
+        
+        Args:
+            metrics: New metrics of the device
+            brick_type: Brick type directory of its log file
+        
+        Returns:
+            Location key of the device (for retain)
+        """
+        key = (metrics.production_line, brick_type, metrics.position, metrics.device_id)
+        new = contribution(metrics)
+        
+        leaf = self.leaves.get(key)
+        if leaf is not None:
+            position = leaf[0]
+            position.apply(*(n - o for n, o in zip(new, leaf[1])))
+        else:
+            position = (self.plant.child(metrics.production_line)
+                        .child(brick_type).child(metrics.position))
+            position.apply(*new)
+        
+        self.leaves[key] = (position, new, metrics)
+        self.line_devices.setdefault(metrics.production_line, {})[key] = metrics
+        return key
+    
+    def remove(self, key: DeviceKey):
+        """Forget a device location (log file gone or no longer owned)"""
+        leaf = self.leaves.pop(key, None)
+        if leaf is None:
+            return
+        self._detach(leaf[0], leaf[1])
+        
+        production_line = key[0]
+        devices = self.line_devices.get(production_line, {})
+        devices.pop(key, None)
+        if not devices:
+            self.line_devices.pop(production_line, None)
+    
+    def retain(self, keys: Iterable[DeviceKey]):
+        """Remove every device location not in keys"""
+        keep = set(keys)
+        for key in [key for key in self.leaves if key not in keep]:
+            self.remove(key)
+    
+    def _detach(self, position: AggregateNode, old: Contribution):
+        """Subtract a contribution and drop nodes left without devices"""
+        position.apply(*(-value for value in old))
+        node = position
+        while node.parent is not None and node.devices == 0:
+            node.parent.children.pop(node.name, None)
+            node = node.parent
+    
+    def node(self, production_line: str, brick_type: Optional[str] = None,
+             position: Optional[str] = None) -> Optional[AggregateNode]:
+        """Totals of a line, a brick type of a line or a position (None if unknown)"""
+        node = self.plant.children.get(production_line)
+        for name in (brick_type, position):
+            if node is None or name is None:
+                break
+            node = node.children.get(name)
+        return node
+    
+    def line_metrics(self, production_line: str) -> Optional[LineMetrics]:
+        """LineMetrics with the totals of the line node (nothing is re-summed)"""
+        node = self.plant.children.get(production_line)
+        if node is None or node.devices == 0:
+            return None
+        return LineMetrics(
+            production_line=production_line,
+            total_devices=node.devices,
+            running_devices=node.running,
+            stopped_devices=node.devices - node.running,
+            total_produced_today=node.produced,
+            average_speed_per_hour=node.average_speed,
+            devices=list(self.line_devices[production_line].values()),
+        )
+    
+    def all_line_metrics(self, lines: Optional[Set[str]] = None) -> Dict[str, LineMetrics]:
+        """LineMetrics of every line (or of the given lines)"""
+        names = self.plant.children if lines is None else lines
+        result = {}
+        for line_name in names:
+            metrics = self.line_metrics(line_name)
+            if metrics is not None:
+                result[line_name] = metrics
+        return result
+    
+    def plant_totals(self) -> Dict[str, int]:
+        """Plant-wide totals in the aggregate payload's field names"""
+        return {
+            'totalLines': len(self.plant.children),
+            'totalRunningDevices': self.plant.running,
+            'totalProducedToday': self.plant.produced,
+        }
@@ -2,50 +2,169 @@
 Main Analytics Service
 Monitors log files and calculates realtime metrics
 """
+import contextlib
+import os
+import socket
 import time
-import json
-from datetime import datetime, timezone
+import threading
+from collections import deque
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, List
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
 import redis
 from log_parser import LogParser
 from metrics_calculator import MetricsCalculator
-from models import DeviceMetrics, LineMetrics, LogEntry
-from file_monitor import FileMonitor, TailReader
+from device_accumulator import to_epoch_ms
+from models import DeviceMetrics, LineMetrics, LogColumns
+from file_monitor import FileMonitor
+from tail_cache import TailCache
+from parse_cache import ParseCache
+from metrics_delta import MetricsDeltaTracker
+from instrumentation import Instrumentation, start_metrics_server
+from sharding import ShardCoordinator
+from serializers import get_serializers
+from aggregation import AggregationTree, DeviceKey
+from metrics_history import MetricsHistory, RedisHistoryBackend, SQLiteHistoryBackend
 import config
 
 
+# TTL of the metrics:* snapshot keys (seconds)
+METRICS_TTL = 300
+
+# Number of per-tick publish latencies kept in memory
+PUBLISH_LATENCY_SAMPLES = 360
+
+# Accepted values of OUTPUT_MODE
+OUTPUT_MODES = ('pubsub', 'streams', 'both')
+
+# Streams written in OUTPUT_MODE=streams/both (entries: type=snapshot|delta, data=JSON)
+LINE_STREAM = 'analytics:stream:line:{}'
+AGGREGATE_STREAM = 'analytics:stream:aggregate'
+
+# Redis hash with the service's own instrumentation (see instrumentation.py)
+INSTRUMENTATION_KEY = 'metrics:analytics:instrumentation'
+
+
 class AnalyticsService:
     """Main service for realtime analytics"""
     
+    # Whether run() can use the event-driven loop (EVENT_DRIVEN)
+    supports_event_driven = True
+    
     def __init__(self, live_mode: bool = True):
         """
         Args:
             live_mode: If True, use file monitoring for realtime updates
         """
-        self.log_parser = LogParser(config.LOG_DIR)
+        parse_cache = None
+        if config.PARSE_CACHE_ENABLED:
+            parse_cache = ParseCache(Path(config.PARSE_CACHE_DIR) if config.PARSE_CACHE_DIR else None)
+        
+        self.log_parser = LogParser(config.LOG_DIR, parse_cache)
         self.calculator = MetricsCalculator(config.HISTORY_WINDOW)
         self.live_mode = live_mode
         
-        # Redis connection for publishing metrics
-        self.redis_client = redis.Redis(
+        # Incremental refresh: keep per-file offset + parsed tail in memory
+        self.tail_cache = None
+        if config.REFRESH_MODE == 'incremental':
+            self.tail_cache = TailCache(self.log_parser, config.TAIL_SIZE,
+                                        history_window=config.HISTORY_WINDOW)
+        
+        # Redis connection for publishing metrics (pooled, reused across ticks)
+        self.redis_pool = redis.ConnectionPool(
             host=config.REDIS_HOST,
             port=config.REDIS_PORT,
             decode_responses=True
         )
+        self.redis_client = redis.Redis(connection_pool=self.redis_pool)
+        
+        # Wall time of each publish (seconds), newest last
+        self.publish_latencies: Deque[float] = deque(maxlen=PUBLISH_LATENCY_SAMPLES)
+        
+        # Delta mode: publish only changed devices/fields between full snapshots
+        self.delta_tracker = None
+        if config.PUBLISH_MODE == 'delta':
+            self.delta_tracker = MetricsDeltaTracker(config.FULL_SNAPSHOT_INTERVAL)
+        
+        # Pub/sub (fire-and-forget) and/or bounded streams consumers read at their own pace
+        if config.OUTPUT_MODE not in OUTPUT_MODES:
+            # A typo would otherwise publish nothing at all
+            raise ValueError(f"Unknown OUTPUT_MODE '{config.OUTPUT_MODE}' "
+                             f"(choose from {', '.join(OUTPUT_MODES)})")
+        self.output_pubsub = config.OUTPUT_MODE in ('pubsub', 'both')
+        self.output_streams = config.OUTPUT_MODE in ('streams', 'both')
+        # Encodings of every payload (SERIALIZERS=json,msgpack publishes both)
+        self.serializers = get_serializers(config.SERIALIZERS.split(','))
         
         # For live mode
         if self.live_mode:
-            self.tail_reader = TailReader()
-            self.file_monitor = FileMonitor(config.LOG_DIR, self.on_file_modified)
-            # Cache to store incremental entries
-            self.device_entries_cache: Dict[str, List[LogEntry]] = {}
+            self.file_monitor = FileMonitor(config.LOG_DIR, self.on_file_modified,
+                                            config.FILE_EVENT_DELAY, config.FILE_EVENT_WORKERS,
+                                            config.FILE_MONITOR_MODE, config.POLL_INTERVAL)
+        
+        # Event-driven mode: file events mark devices dirty, only those are recomputed
+        self.event_driven = (config.EVENT_DRIVEN and self.supports_event_driven
+                             and self.live_mode and self.tail_cache is not None)
+        if config.EVENT_DRIVEN and not self.event_driven:
+            print("⚠️  EVENT_DRIVEN needs live mode, REFRESH_MODE=incremental and no --async, "
+                  "using the interval loop")
+        self.dirty_files: Set[Path] = set()
+        self.dirty_lock = threading.Lock()
+        self.dirty_event = threading.Event()
+        # Latest LineMetrics of every line (event-driven publishes)
+        self.line_metrics: Dict[str, LineMetrics] = {}
+        
+        # Latest metrics of every device with line / plant totals updated per device
+        self.aggregates = AggregationTree()
+        
+        # Sharded mode: only the production lines whose lease this worker holds
+        self.shard = None
+        if config.SHARDING_ENABLED:
+            worker_id = config.WORKER_ID or f'{socket.gethostname()}-{os.getpid()}'
+            # Own blocking client: the async subclass replaces redis_client
+            self.shard = ShardCoordinator(redis.Redis(connection_pool=self.redis_pool), worker_id,
+                                          config.SHARD_LEASE_TTL, config.SHARD_REPLICAS)
+        
+        # Downsampled per-device history served to charts (GET /history)
+        self.history = None
+        if config.METRICS_HISTORY == 'redis':
+            self.history = MetricsHistory(RedisHistoryBackend(redis.Redis(connection_pool=self.redis_pool)))
+        elif config.METRICS_HISTORY == 'sqlite':
+            self.history = MetricsHistory(SQLiteHistoryBackend(config.METRICS_HISTORY_PATH))
+        
+        # Stage timings, tick lag / overruns, I/O and watcher counters
+        self.instrumentation = Instrumentation()
+        self.metrics_server = None
+        if self.live_mode:
+            # Looked up on every read: subclasses replace the file monitor
+            self.instrumentation.register('watcher_events_total', 'counter',
+                                          'File change events received',
+                                          lambda: self.file_monitor.scheduler.events_received)
+            self.instrumentation.register('watcher_events_coalesced_total', 'counter',
+                                          'Events merged into an already pending callback',
+                                          lambda: self.file_monitor.scheduler.events_coalesced)
+            self.instrumentation.register('watcher_pending_paths', 'gauge',
+                                          'Files waiting for their change callback',
+                                          lambda: self.file_monitor.scheduler.pending)
+        if self.event_driven:
+            self.instrumentation.register('dirty_files', 'gauge', 'Files waiting for recompute',
+                                          lambda: len(self.dirty_files))
+        if self.shard is not None:
+            self.instrumentation.register('shard_workers', 'gauge', 'Live workers in the ring',
+                                          lambda: len(self.shard.workers))
+            self.instrumentation.register('shard_owned_lines', 'gauge',
+                                          'Production lines leased by this worker',
+                                          lambda: len(self.shard.owned_lines))
         
         print(f"📊 Analytics Service Started")
-        print(f"   Mode: {'LIVE (file monitoring)' if live_mode else 'POLLING'}")
+        print(f"   Mode: {'LIVE (file monitoring)' if live_mode else 'POLLING'}"
+              f"{' / EVENT-DRIVEN' if self.event_driven else ''}")
         print(f"   Log Directory: {config.LOG_DIR}")
         print(f"   Calculation Interval: {config.CALCULATION_INTERVAL}s")
+        print(f"   Refresh Mode: {config.REFRESH_MODE}")
         print(f"   History Window: {config.HISTORY_WINDOW}s")
+        if self.shard is not None:
+            print(f"   Shard Worker: {self.shard.worker_id}")
     
     def on_file_modified(self, file_path: Path):
         """
@@ -55,32 +174,16 @@ class AnalyticsService:
             file_path: Path to modified file
         """
         try:
-            # Get only new lines
-            new_lines = self.tail_reader.get_new_lines(file_path)
-            
-            if not new_lines:
-                return
+            # Keep the log index current (size / last timestamp, new files)
+            self.log_parser.index.update_file(file_path)
             
-            # Parse new entries
-            new_entries = self.log_parser.parse_lines(new_lines, file_path)
-            
-            if not new_entries:
+            if self.shard is not None and not self.shard.owns(self.shard.line_of(file_path)):
                 return
             
-            device_id = new_entries[0].device_id
-            
-            # Add to cache
-            if device_id not in self.device_entries_cache:
-                self.device_entries_cache[device_id] = []
-            
-            self.device_entries_cache[device_id].extend(new_entries)
-            
-            # Limit cache size (chỉ giữ 10 entries gần nhất)
-            max_cache_size = 10
-            if len(self.device_entries_cache[device_id]) > max_cache_size:
-                self.device_entries_cache[device_id] = self.device_entries_cache[device_id][-max_cache_size:]
-            
-            print(f"📝 Updated {device_id}: +{len(new_entries)} entries (cache: {len(self.device_entries_cache[device_id])})")
+            if self.event_driven:
+                # The tail cache reads the appended bytes when the device is recomputed
+                self.mark_dirty(file_path)
+            # Otherwise the next tick reads them (tail cache or full parse)
         
         except Exception as e:
             print(f"❌ Error processing file update {file_path}: {e}")
@@ -98,86 +201,376 @@ class AnalyticsService:
         if date is None:
             date = datetime.now()
         
-        # Find all log files for today
-        log_files = self.log_parser.find_device_logs(date)
+        # Find all log files for today (from the maintained log index)
+        with self.instrumentation.stage('discover'):
+            log_files = self.log_parser.find_device_logs(date)
+            self.log_parser.index.prune([date.strftime('%Y-%m-%d')])
         
         if not log_files:
             print(f"⚠️  No log files found for {date.strftime('%Y-%m-%d')}")
+            self.aggregates.retain(())
             return {}
         
         print(f"📁 Found {len(log_files)} device log files")
         
-        # Group by production line
-        lines: Dict[str, List[DeviceMetrics]] = {}
+        if self.shard is not None:
+            # Files of other shards' lines are dropped from the tail cache below
+            log_files = self.shard.assign(log_files)
+            print(f"🧩 {len(log_files)} files on {len(self.shard.owned_lines)} "
+                  f"production lines owned by {self.shard.worker_id}")
+        
+        # Forget files that are no longer the latest (rotation, day rollover)
+        if self.tail_cache is not None:
+            self.tail_cache.retain(log_files)
+        
+        # Location (line, brick type, position, device) of every device calculated this tick
+        seen: List[DeviceKey] = []
+        # Full mode: recent window of every device, calculated in one batch
+        windows: List[LogColumns] = []
+        
+        stage = self.instrumentation.stage
+        io_before = self._io_counters()
+        full_bytes = 0
         
         for log_file in log_files:
             # Get entries - Always read latest from file
             # (Watchdog may not trigger on Windows Docker mounts)
-            all_entries = self.log_parser.parse_log_file(log_file)
-            entries = all_entries[-10:] if len(all_entries) > 10 else all_entries
-            
-            # Update cache for watchdog mode (if it triggers)
-            if self.live_mode and entries:
-                device_id = log_file.stem.upper()
-                self.device_entries_cache[device_id] = entries
-            
-            if not entries:
-                continue
+            if self.tail_cache is not None:
+                # Only bytes appended since the last tick are read; metrics are
+                # read out of the per-device streaming accumulator
+                with stage('parse'):
+                    accumulator = self.tail_cache.get_accumulator(log_file)
+                with stage('compute'):
+                    device_metrics = self.calculator.calculate_device_metrics_streaming(accumulator)
+                    if device_metrics:
+                        seen.append(self.aggregates.update(device_metrics, self.brick_type_of(log_file)))
+            else:
+                # Whole file parsed in one pass into columnar arrays
+                with stage('parse'):
+                    columns = self.log_parser.parse_log_file_columnar(log_file)
+                    full_bytes += os.path.getsize(log_file)
+                if columns is None or len(columns) == 0:
+                    continue
+                # Metrics for all devices are calculated together after the loop
+                # (whole file kept for the last hour / last 10 min totals)
+                windows.append(columns)
+        
+        if self.tail_cache is not None:
+            files_read, bytes_read = (now - before for now, before in zip(self._io_counters(), io_before))
+            self.instrumentation.count_io(files_read, bytes_read)
+        else:
+            self.instrumentation.count_io(len(log_files), full_bytes)
+        
+        with stage('compute'):
+            if windows:
+                # Whole plant in a few array operations over a devices × samples grid
+                # Devices of each line come back in window order
+                line_windows: Dict[str, List[LogColumns]] = {}
+                for window in windows:
+                    line_windows.setdefault(window.production_line, []).append(window)
+                for line_name, metrics in self.calculator.calculate_batch(windows, config.TAIL_SIZE).items():
+                    for window, device in zip(line_windows[line_name], metrics.devices):
+                        seen.append(self.aggregates.update(device, window.brick_type))
             
-            # Calculate device metrics
-            device_metrics = self.calculator.calculate_device_metrics(entries)
+            # Devices of files that are gone (rotation, day rollover, other shards)
+            self.aggregates.retain(seen)
+            line_metrics = self.aggregates.all_line_metrics()
+        
+        self.record_history(item for devices in self.aggregates.line_devices.values()
+                            for item in devices.items())
+        return line_metrics
+    
+    @staticmethod
+    def brick_type_of(file_path: Path) -> str:
+        """Brick type directory of a log file ('unknown' in the old layout)"""
+        metadata = LogParser.extract_metadata(Path(file_path))
+        return metadata[1] if metadata else 'unknown'
+    
+    def _io_counters(self) -> Tuple[int, int]:
+        """Cumulative (files, bytes) read by the tail cache"""
+        if self.tail_cache is None:
+            return 0, 0
+        return self.tail_cache.files_read, self.tail_cache.bytes_read
+    
+    def mark_dirty(self, file_path: Path):
+        """Queue a changed log file for recompute (called from the watchdog thread)"""
+        # Watchdog reports paths relative to a relative LOG_DIR; the tail cache is keyed
+        # by the index's absolute paths
+        with self.dirty_lock:
+            self.dirty_files.add(Path(os.path.abspath(file_path)))
+        self.dirty_event.set()
+    
+    def take_dirty(self) -> Set[Path]:
+        """Files changed since the previous call"""
+        with self.dirty_lock:
+            dirty, self.dirty_files = self.dirty_files, set()
+            self.dirty_event.clear()
+        return dirty
+    
+    def remember_metrics(self, line_metrics: Dict[str, LineMetrics]):
+        """Keep the result of a full pass as the base for dirty-device updates"""
+        self.line_metrics = dict(line_metrics)
+    
+    def recompute_dirty(self, file_paths: Iterable[Path]) -> Set[str]:
+        """
+        Recompute only the devices of changed files and the LineMetrics they belong to
+        
+        Args:
+            file_paths: Changed log files
+        
+        Returns:
+            Names of the production lines that were recalculated
+        """
+        changed_lines: Set[str] = set()
+        recomputed: List[Tuple[DeviceKey, DeviceMetrics]] = []
+        
+        io_before = self._io_counters()
+        
+        for file_path in file_paths:
+            file_path = Path(os.path.abspath(file_path))
+            # Reads only the bytes appended since the previous read
+            with self.instrumentation.stage('parse'):
+                accumulator = self.tail_cache.get_accumulator(file_path)
+            with self.instrumentation.stage('compute'):
+                device_metrics = self.calculator.calculate_device_metrics_streaming(accumulator)
+                if device_metrics is None:
+                    continue
+                # O(depth): the device's change is applied to its position, brick type, line, plant
+                key = self.aggregates.update(device_metrics, self.brick_type_of(file_path))
             
-            if device_metrics:
-                production_line = device_metrics.production_line
-                
-                if production_line not in lines:
-                    lines[production_line] = []
-                
-                lines[production_line].append(device_metrics)
+            changed_lines.add(device_metrics.production_line)
+            recomputed.append((key, device_metrics))
         
-        # Calculate line metrics
-        line_metrics = {}
-        for line_name, devices in lines.items():
-            line_metrics[line_name] = self.calculator.calculate_line_metrics(devices)
+        with self.instrumentation.stage('compute'):
+            self.line_metrics.update(self.aggregates.all_line_metrics(changed_lines))
         
-        return line_metrics
+        files_read, bytes_read = (now - before for now, before in zip(self._io_counters(), io_before))
+        self.instrumentation.count_io(files_read, bytes_read)
+        self.record_history(recomputed)
+        return changed_lines
+    
+    def record_history(self, devices: Iterable[Tuple[DeviceKey, DeviceMetrics]]):
+        """Add the latest device snapshots, by location, to the metrics history (if enabled)"""
+        if self.history is None:
+            return
+        with self.instrumentation.stage('history'):
+            try:
+                self.history.record(devices, to_epoch_ms(self.calculator.clock()))
+            except Exception as e:
+                print(f"❌ Error writing metrics history: {e}")
     
-    def publish_metrics(self, line_metrics: Dict[str, LineMetrics]):
+    def history_route(self, query: Dict[str, str]) -> dict:
+        """
+        GET /history?line=DC-01&device=SAU-ME-01[&brick=300x600][&position=sau-me][&from=ms][&to=ms]
+        - chart series of one device (default: the last hour), from the finest tier covering
+        the range. brick / position are needed when the device ID is not unique on the line
+        or the device is not reporting now
+        """
+        line, device = query['line'], query['device'].upper()
+        brick_type, position = query.get('brick'), query.get('position')
+        if brick_type is not None and position is not None:
+            location = (line, brick_type, position, device)
+        else:
+            matches = [key for key in self.history.locations(line, device)
+                       if brick_type in (None, key[1]) and position in (None, key[2])]
+            if len(matches) != 1:
+                found = ', '.join(f'{key[1]}/{key[2]}' for key in matches) or 'none reporting'
+                raise ValueError(f"Pass brick and position for {line}/{device} ({found})")
+            location = matches[0]
+        
+        now_ms = int(time.time() * 1000)
+        start_ms = int(query.get('from', now_ms - 3600 * 1000))
+        end_ms = int(query['to']) if 'to' in query else None
+        series = self.history.series(location, start_ms, end_ms)
+        return {'productionLine': line, 'brickType': location[1], 'position': location[2],
+                'deviceId': device, **series}
+    
+    def publish_metrics(self, line_metrics: Dict[str, LineMetrics],
+                        changed_lines: Optional[Set[str]] = None):
         """
         Publish metrics to Redis
         
         Args:
             line_metrics: Dictionary of LineMetrics
+            changed_lines: Only publish these lines (default: all); the aggregate
+                           always covers every line
         """
         try:
-            # Publish each line's metrics
-            for line_name, metrics in line_metrics.items():
-                channel = f'analytics:line:{line_name}'
-                data = json.dumps(metrics.to_dict())
-                self.redis_client.publish(channel, data)
+            start_time = time.perf_counter()
+            # Sharded: no lease is released between the ownership check and the execute
+            with self.publish_fence():
+                with self.instrumentation.stage('serialize'):
+                    commands, summary = self.build_publish_commands(line_metrics, changed_lines)
                 
-                # Also store in Redis with TTL
-                key = f'metrics:line:{line_name}'
-                self.redis_client.setex(key, 300, data)  # 5 min TTL
+                # All writes of one tick go out in a single round trip
+                with self.instrumentation.stage('publish'):
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    self.queue_publish_commands(pipe, commands)
+                    pipe.execute()
+            
+            latency = self.record_publish_latency(start_time)
+            print(f"✅ Published {summary} ({latency * 1000:.1f} ms)")
+        
+        except Exception as e:
+            print(f"❌ Error publishing metrics: {e}")
+            self.on_publish_failed()
+    
+    def build_publish_commands(self, line_metrics: Dict[str, LineMetrics],
+                               changed_lines: Optional[Set[str]] = None) -> Tuple[List[tuple], str]:
+        """
+        Redis commands for one tick (shared by sync and async publishers)
+        Each payload is serialized exactly once
+        
+        Args:
+            line_metrics: Dictionary of LineMetrics
+            changed_lines: Only publish these lines (default: all); ignored when a
+                           delta-mode full snapshot is due
             
-            # Publish aggregate metrics
-            total_running = sum(m.running_devices for m in line_metrics.values())
-            total_produced = sum(m.total_produced_today for m in line_metrics.values())
+        Returns:
+            Tuple of (list of (command, *args), short description for the log)
+        """
+        publish_aggregate = True
+        commands = []
+        
+        if self.shard is not None:
+            # A lease lost since the calculation: the new owner publishes that line
+            line_metrics = {name: m for name, m in line_metrics.items() if self.shard.owns(name)}
+            publish_aggregate = self.shard.publishes_aggregate
+            commands.extend(self.shard.summary_commands(line_metrics))
+        
+        partial = changed_lines is not None and (
+            self.delta_tracker is None or not self.delta_tracker.snapshot_due())
+        published = [name for name in line_metrics if not partial or name in changed_lines]
+        # Timestamps stay datetimes until each serializer formats them
+        line_dicts = {line_name: line_metrics[line_name].to_dict(raw_timestamps=True)
+                      for line_name in published}
+        
+        aggregate = self.build_aggregate(line_metrics)
+        
+        if self.delta_tracker is not None and not self.delta_tracker.snapshot_due():
+            line_deltas, aggregate_changed = self.delta_tracker.diff(line_dicts, aggregate, partial)
             
-            aggregate = {
-                'totalLines': len(line_metrics),
-                'totalRunningDevices': total_running,
-                'totalProducedToday': total_produced,
-                'timestamp': datetime.now(timezone.utc).isoformat(),
-            }
+            for line_name, delta in line_deltas.items():
+                delta['productionLine'] = line_name
+                delta['timestamp'] = aggregate['timestamp']
+                # Not below analytics:line:* - those channels carry full LineMetrics
+                commands.extend(self.output_commands(f'analytics:delta:line:{line_name}',
+                                                     LINE_STREAM.format(line_name), 'delta', delta))
             
-            self.redis_client.publish('analytics:aggregate', json.dumps(aggregate))
-            self.redis_client.setex('metrics:aggregate', 300, json.dumps(aggregate))
+            if aggregate_changed and publish_aggregate:
+                commands.extend(self.output_commands('analytics:aggregate', AGGREGATE_STREAM,
+                                                     'snapshot', aggregate, 'metrics:aggregate'))
             
-            print(f"✅ Published metrics for {len(line_metrics)} production lines")
+            commands.append(self.instrumentation_command())
+            return commands, f"deltas for {len(line_deltas)}/{len(line_metrics)} production lines"
         
-        except Exception as e:
-            print(f"❌ Error publishing metrics: {e}")
+        # Full snapshot (always in full mode, periodically in delta mode)
+        for line_name, line_dict in line_dicts.items():
+            # Also stored in Redis with TTL
+            commands.extend(self.output_commands(f'analytics:line:{line_name}',
+                                                 LINE_STREAM.format(line_name), 'snapshot',
+                                                 line_dict, f'metrics:line:{line_name}'))
+        
+        if publish_aggregate:
+            commands.extend(self.output_commands('analytics:aggregate', AGGREGATE_STREAM,
+                                                 'snapshot', aggregate, 'metrics:aggregate'))
+        commands.append(self.instrumentation_command())
+        
+        if self.delta_tracker is not None:
+            self.delta_tracker.reset(line_dicts, aggregate)
+        
+        return commands, f"metrics for {len(line_dicts)}/{len(line_metrics)} production lines"
+    
+    def publish_fence(self):
+        """Lock held from building a publish until it was sent (no-op unless sharded)"""
+        return self.shard.publish_lock if self.shard is not None else contextlib.nullcontext()
+    
+    def output_commands(self, channel: str, stream: str, kind: str, payload: dict,
+                        key: Optional[str] = None) -> List[tuple]:
+        """
+        PUBLISH and/or XADD (OUTPUT_MODE) and SETEX of one payload, once per serializer
+        
+        Args:
+            channel: Pub/sub channel
+            stream: Stream key; entries get auto IDs (ms-seq), so consumer groups
+                    and XREAD can resume from the last ID they processed
+            kind: 'snapshot' (full payload) or 'delta'
+            payload: Dict to encode
+            key: Snapshot key stored with METRICS_TTL (optional)
+        
+        Non-JSON encodings go to names with their marker (analytics:msgpack:line:DC-01)
+        """
+        commands = []
+        for serializer in self.serializers:
+            data = serializer.dumps(payload)
+            if self.output_pubsub:
+                commands.append(('publish', serializer.mark(channel), data))
+            if self.output_streams:
+                # Approximate MAXLEN (~) trims whole macro-nodes: O(1) amortized per XADD
+                commands.append(('xadd', serializer.mark(stream), {'type': kind, 'data': data}, '*',
+                                 config.STREAM_MAXLEN, True))
+            if key is not None:
+                commands.append(('setex', serializer.mark(key), METRICS_TTL, data))
+        return commands
+    
+    def build_aggregate(self, line_metrics: Dict[str, LineMetrics]) -> dict:
+        """Plant-wide totals (sharded: merged with the totals published by the other shards)"""
+        if self.shard is not None:
+            totals = list(self.shard.merged_totals(line_metrics).values())
+            aggregate = {
+                'totalLines': len(totals),
+                'totalRunningDevices': sum(t['runningDevices'] for t in totals),
+                'totalProducedToday': sum(t['totalProducedToday'] for t in totals),
+            }
+        else:
+            # Plant node of the aggregation tree: nothing re-summed per publish
+            aggregate = self.aggregates.plant_totals()
+        
+        aggregate['timestamp'] = self.calculator.clock()
+        return aggregate
+    
+    def instrumentation_command(self) -> tuple:
+        """HSET of the service's own metrics, written along with every publish"""
+        return ('hset', INSTRUMENTATION_KEY, None, None, self.instrumentation.snapshot())
+    
+    @staticmethod
+    def queue_publish_commands(pipe, commands: List[tuple]):
+        """
+        Queue commands from build_publish_commands on a pipeline
+        
+        Args:
+            pipe: Redis pipeline (sync or asyncio)
+            commands: List of (command, *args)
+        """
+        for command, *args in commands:
+            getattr(pipe, command)(*args)
+    
+    def on_publish_failed(self):
+        """Subscribers may have missed deltas: resync with a full snapshot next tick"""
+        if self.delta_tracker is not None:
+            self.delta_tracker.force_snapshot()
+    
+    def record_publish_latency(self, start_time: float) -> float:
+        """Store the latency of a publish started at start_time (perf_counter)"""
+        latency = time.perf_counter() - start_time
+        self.publish_latencies.append(latency)
+        return latency
+    
+    def print_summary(self, line_metrics: Dict[str, LineMetrics]):
+        """Print per-line / per-device summary to stdout"""
+        for line_name, metrics in line_metrics.items():
+            print(f"\n📊 {line_name}:")
+            print(f"   Running: {metrics.running_devices}/{metrics.total_devices} devices")
+            
+            # In metrics cho từng device
+            for device in metrics.devices:
+                status_icon = "✅" if device.is_running else "⏸️"
+                print(f"   {status_icon} {device.device_id}:")
+                print(f"      Speed: {device.speed_per_minute:.2f} viên/phút ({device.speed_per_hour:.0f} viên/giờ)")
+                print(f"      Count: {device.current_count} viên")
+                print(f"      Trend: {device.trend}")
+                if device.idle_time_seconds > 0:
+                    print(f"      Idle: {device.idle_time_seconds:.0f}s")
     
     def run(self):
         """
@@ -188,38 +581,39 @@ class AnalyticsService:
         # Start file monitor if in live mode
         if self.live_mode:
             self.file_monitor.start()
+        if self.shard is not None:
+            self.shard.start()
+        self.start_metrics_endpoint()
         
         try:
+            if self.event_driven:
+                self.run_event_driven()
+                return
+            
+            scheduled = time.time()
             while True:
                 try:
                     start_time = time.time()
+                    lag = max(0.0, start_time - scheduled)
                     
                     # Calculate metrics
                     line_metrics = self.calculate_all_metrics()
                     
-                    # Publish to Redis
-                    if line_metrics:
+                    # Publish to Redis (a shard without lines may still own the aggregate)
+                    if line_metrics or self.shard is not None:
                         self.publish_metrics(line_metrics)
                         
                     # Print summary
-                    for line_name, metrics in line_metrics.items():
-                        print(f"\n📊 {line_name}:")
-                        print(f"   Running: {metrics.running_devices}/{metrics.total_devices} devices")
-                        
-                        # In metrics cho từng device
-                        for device in metrics.devices:
-                            status_icon = "✅" if device.is_running else "⏸️"
-                            print(f"   {status_icon} {device.device_id}:")
-                            print(f"      Speed: {device.speed_per_minute:.2f} viên/phút ({device.speed_per_hour:.0f} viên/giờ)")
-                            print(f"      Count: {device.current_count} viên")
-                            print(f"      Trend: {device.trend}")
-                            if device.idle_time_seconds > 0:
-                                print(f"      Idle: {device.idle_time_seconds:.0f}s")                    # Calculate elapsed time
+                    self.print_summary(line_metrics)
+                    
+                    # Calculate elapsed time
                     elapsed = time.time() - start_time
+                    self.instrumentation.end_tick(elapsed, config.CALCULATION_INTERVAL, lag)
                     print(f"\n⏱️  Calculation took {elapsed:.2f}s")
                     
                     # Sleep until next interval
                     sleep_time = max(0, config.CALCULATION_INTERVAL - elapsed)
+                    scheduled = start_time + max(config.CALCULATION_INTERVAL, elapsed)
                     if sleep_time > 0:
                         time.sleep(sleep_time)
                 
@@ -235,23 +629,104 @@ class AnalyticsService:
             # Clean up
             if self.live_mode:
                 self.file_monitor.stop()
+            if self.shard is not None:
+                self.shard.stop()
+            self.close_history()
+            if self.metrics_server is not None:
+                self.metrics_server.shutdown()
+    
+    def close_history(self):
+        """Write the buckets still open to the history backend"""
+        if self.history is None:
+            return
+        try:
+            self.history.flush(to_epoch_ms(self.calculator.clock()))
+        except Exception as e:
+            print(f"❌ Error flushing metrics history: {e}")
+    
+    def start_metrics_endpoint(self):
+        """Serve the instrumentation on METRICS_HOST:METRICS_PORT (0 = disabled)"""
+        if config.METRICS_PORT and self.metrics_server is None:
+            routes = {'/history': self.history_route} if self.history is not None else None
+            self.metrics_server = start_metrics_server(
+                self.instrumentation, config.METRICS_HOST, config.METRICS_PORT, routes)
+    
+    def run_event_driven(self):
+        """
+        Event loop - recompute and publish only lines with changed files,
+        with a full pass every FULL_REFRESH_INTERVAL (new files, day rollover,
+        idle devices and mounts where watchdog misses events)
+        """
+        next_full_refresh = 0.0
+        
+        while True:
+            try:
+                # Due refreshes run first: on a busy plant an event is always pending
+                timeout = next_full_refresh - time.monotonic()
+                if timeout <= 0 or not self.dirty_event.wait(timeout):
+                    start_time = time.time()
+                    # Pending events are covered by the full pass
+                    self.take_dirty()
+                    
+                    line_metrics = self.calculate_all_metrics()
+                    self.remember_metrics(line_metrics)
+                    if line_metrics or self.shard is not None:
+                        self.publish_metrics(line_metrics)
+                    self.print_summary(line_metrics)
+                    
+                    elapsed = time.time() - start_time
+                    self.instrumentation.end_tick(elapsed, config.FULL_REFRESH_INTERVAL)
+                    print(f"\n⏱️  Full refresh took {elapsed:.2f}s")
+                    next_full_refresh = time.monotonic() + config.FULL_REFRESH_INTERVAL
+                    continue
+                
+                # Let a burst of writes (several devices, several lines) settle into one publish
+                time.sleep(config.COALESCE_DELAY)
+                dirty = self.take_dirty()
+                
+                start_time = time.perf_counter()
+                changed_lines = self.recompute_dirty(dirty)
+                if changed_lines:
+                    self.publish_metrics(self.line_metrics, changed_lines)
+                elapsed = time.perf_counter() - start_time
+                # Dirty batches have no interval budget, so they never count as overruns
+                self.instrumentation.end_tick(elapsed, 0)
+                print(f"⚡ Recomputed {len(dirty)} devices on {len(changed_lines)} lines "
+                      f"in {elapsed * 1000:.1f} ms")
+            
+            except KeyboardInterrupt:
+                print("\n👋 Shutting down analytics service...")
+                break
+            
+            except Exception as e:
+                print(f"❌ Error in event loop: {e}")
+                time.sleep(config.COALESCE_DELAY)
 
 
 def main():
     """Entry point"""
     import sys
     
+    if '--replay' in sys.argv[1:]:
+        # Recorded day through the same pipeline on a virtual clock (replay.py)
+        from replay import main as replay_main
+        replay_main(sys.argv[1:], AnalyticsService)
+        return
+    
     # Check command line args
-    live_mode = True
-    if len(sys.argv) > 1 and sys.argv[1] == '--polling':
-        live_mode = False
+    live_mode = '--polling' not in sys.argv[1:]
+    async_mode = '--async' in sys.argv[1:]
     
     print(f"{'='*60}")
     print(f"  Analytics Service")
-    print(f"  Mode: {'LIVE (file monitoring)' if live_mode else 'POLLING'}")
+    print(f"  Mode: {'LIVE (file monitoring)' if live_mode else 'POLLING'}{' / ASYNC' if async_mode else ''}")
     print(f"{'='*60}\n")
     
-    service = AnalyticsService(live_mode=live_mode)
+    if async_mode:
+        from async_service import AsyncAnalyticsService
+        service = AsyncAnalyticsService(live_mode=live_mode)
+    else:
+        service = AnalyticsService(live_mode=live_mode)
     service.run()
 
 
@@ -0,0 +1,255 @@
+"""
+Asyncio-based Analytics Service
+File events, calculation and publishing run as separate tasks so a slow
+Redis or a burst of file events does not stall the whole loop
+"""
+import asyncio
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Set
+import redis.asyncio as aioredis
+from analytics_service import AnalyticsService
+from file_monitor import FileMonitor
+from models import LineMetrics
+import config
+
+
+class AsyncAnalyticsService(AnalyticsService):
+    """Analytics service running on an asyncio event loop"""
+    
+    supports_event_driven = False
+    
+    def __init__(self, live_mode: bool = True):
+        """
+        Args:
+            live_mode: If True, file change events are processed as they arrive
+        """
+        super().__init__(live_mode=live_mode)
+        
+        # Async Redis client replaces the blocking one
+        self.redis_pool = aioredis.ConnectionPool(
+            host=config.REDIS_HOST,
+            port=config.REDIS_PORT,
+            decode_responses=True
+        )
+        self.redis_client = aioredis.Redis(connection_pool=self.redis_pool)
+        
+        # Parsing / calculation stay synchronous; one worker thread keeps them
+        # off the event loop without running them concurrently with each other
+        self.file_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='analytics-io')
+        
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.event_queue: Optional[asyncio.Queue] = None
+        self.publish_queue: Optional[asyncio.Queue] = None
+        self.pending_paths: Set[Path] = set()
+        self.stop_event: Optional[asyncio.Event] = None
+        self.events_coalesced = 0
+        self.events_dropped = 0
+        
+        self.instrumentation.register('event_queue_depth', 'gauge', 'File events waiting in the queue',
+                                      lambda: self.event_queue.qsize() if self.event_queue else 0)
+        self.instrumentation.register('event_queue_coalesced_total', 'counter',
+                                      'Events for a file that was already queued',
+                                      lambda: self.events_coalesced)
+        self.instrumentation.register('event_queue_dropped_total', 'counter',
+                                      'Events dropped because the queue was full',
+                                      lambda: self.events_dropped)
+        
+        if self.live_mode:
+            # Watchdog callbacks only hand the path over to the event loop
+            self.file_monitor = FileMonitor(config.LOG_DIR, self._on_file_event,
+                                            config.FILE_EVENT_DELAY, config.FILE_EVENT_WORKERS,
+                                            config.FILE_MONITOR_MODE, config.POLL_INTERVAL)
+    
+    def _on_file_event(self, file_path: Path):
+        """Called on the watchdog observer thread"""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._enqueue_event, file_path)
+    
+    def _enqueue_event(self, file_path: Path):
+        """Queue a changed file (runs on the event loop); repeated events coalesce"""
+        if file_path in self.pending_paths:
+            self.events_coalesced += 1
+            return
+        
+        try:
+            self.event_queue.put_nowait(file_path)
+            self.pending_paths.add(file_path)
+        except asyncio.QueueFull:
+            # The next calculation tick re-reads every file anyway
+            self.events_dropped += 1
+            print(f"⚠️  Event queue full, dropping event for {file_path}")
+    
+    async def _run_in_executor(self, func, *args):
+        return await self.loop.run_in_executor(self.file_executor, func, *args)
+    
+    async def event_worker(self):
+        """Consume file change events"""
+        while True:
+            file_path = await self.event_queue.get()
+            self.pending_paths.discard(file_path)
+            try:
+                await self._run_in_executor(self.on_file_modified, file_path)
+            except Exception as e:
+                print(f"❌ Error processing file event {file_path}: {e}")
+            finally:
+                self.event_queue.task_done()
+    
+    async def calculation_loop(self):
+        """Calculate metrics every CALCULATION_INTERVAL and hand them to the publisher"""
+        scheduled = time.time()
+        while not self.stop_event.is_set():
+            start_time = time.time()
+            lag = max(0.0, start_time - scheduled)
+            
+            try:
+                line_metrics = await self._run_in_executor(self.calculate_all_metrics)
+                
+                if line_metrics or self.shard is not None:
+                    self._offer_for_publish(line_metrics)
+                
+                self.print_summary(line_metrics)
+            
+            except Exception as e:
+                print(f"❌ Error in calculation loop: {e}")
+            
+            elapsed = time.time() - start_time
+            self.instrumentation.end_tick(elapsed, config.CALCULATION_INTERVAL, lag)
+            print(f"\n⏱️  Calculation took {elapsed:.2f}s")
+            
+            # Sleep until next interval (wakes up early on shutdown)
+            sleep_time = max(0, config.CALCULATION_INTERVAL - elapsed)
+            scheduled = start_time + max(config.CALCULATION_INTERVAL, elapsed)
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout=sleep_time)
+            except asyncio.TimeoutError:
+                pass
+    
+    def _offer_for_publish(self, line_metrics: Dict[str, LineMetrics]):
+        """Latest metrics win: a result still waiting for a slow Redis is replaced"""
+        if self.publish_queue.full():
+            self.publish_queue.get_nowait()
+            self.publish_queue.task_done()
+            print("⚠️  Publisher is behind, replacing unpublished metrics")
+        self.publish_queue.put_nowait(line_metrics)
+    
+    async def publish_worker(self):
+        """Publish calculated metrics to Redis"""
+        while True:
+            line_metrics = await self.publish_queue.get()
+            try:
+                await self.publish_metrics_async(line_metrics)
+            finally:
+                self.publish_queue.task_done()
+    
+    async def publish_metrics_async(self, line_metrics: Dict[str, LineMetrics]):
+        """
+        Publish metrics to Redis without blocking the event loop
+        
+        Args:
+            line_metrics: Dictionary of LineMetrics
+        """
+        try:
+            start_time = time.perf_counter()
+            # Sharded: no lease is released between the ownership check and the execute.
+            # Polled so neither the loop blocks nor a cancelled task leaves it held
+            fence = self.shard.publish_lock if self.shard is not None else None
+            while fence is not None and not fence.acquire(blocking=False):
+                await asyncio.sleep(0.005)
+            try:
+                with self.instrumentation.stage('serialize'):
+                    commands, summary = self.build_publish_commands(line_metrics)
+                
+                with self.instrumentation.stage('publish'):
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    self.queue_publish_commands(pipe, commands)
+                    await pipe.execute()
+            finally:
+                if fence is not None:
+                    fence.release()
+            
+            latency = self.record_publish_latency(start_time)
+            print(f"✅ Published {summary} ({latency * 1000:.1f} ms)")
+        
+        except Exception as e:
+            print(f"❌ Error publishing metrics: {e}")
+            self.on_publish_failed()
+    
+    def request_stop(self):
+        """Ask the service to shut down (safe to call from signal handlers)"""
+        if self.stop_event is not None and not self.stop_event.is_set():
+            print("\n👋 Shutting down analytics service...")
+            self.stop_event.set()
+    
+    async def run_async(self):
+        """
+        Main coroutine - runs until SIGINT/SIGTERM, then drains pending work
+        """
+        print(f"🚀 Starting async analytics loop...")
+        
+        self.loop = asyncio.get_running_loop()
+        self.event_queue = asyncio.Queue(maxsize=config.EVENT_QUEUE_SIZE)
+        self.publish_queue = asyncio.Queue(maxsize=1)
+        self.stop_event = asyncio.Event()
+        
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(sig, self.request_stop)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: KeyboardInterrupt handled by asyncio.run
+        
+        workers = [
+            asyncio.create_task(self.event_worker(), name='event-worker'),
+            asyncio.create_task(self.publish_worker(), name='publish-worker'),
+        ]
+        calculation = asyncio.create_task(self.calculation_loop(), name='calculation')
+        
+        if self.live_mode:
+            self.file_monitor.start()
+        if self.shard is not None:
+            await self._run_in_executor(self.shard.start)
+        self.start_metrics_endpoint()
+        
+        try:
+            await self.stop_event.wait()
+        finally:
+            await self._shutdown(calculation, workers)
+    
+    async def _shutdown(self, calculation: asyncio.Task, workers: list):
+        """Bounded shutdown: stop intake, drain queues, then cancel what is left"""
+        self.stop_event.set()
+        
+        if self.live_mode:
+            self.file_monitor.stop()
+        
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(calculation, self.event_queue.join(), self.publish_queue.join()),
+                timeout=config.SHUTDOWN_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            print(f"⚠️  Shutdown timed out after {config.SHUTDOWN_TIMEOUT}s, "
+                  f"dropping {self.event_queue.qsize()} pending events")
+        
+        for task in [calculation] + workers:
+            task.cancel()
+        await asyncio.gather(calculation, *workers, return_exceptions=True)
+        
+        if self.shard is not None:
+            await asyncio.to_thread(self.shard.stop)
+        await self._run_in_executor(self.close_history)
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+        await self.redis_client.aclose()
+        await self.redis_pool.aclose()
+        self.file_executor.shutdown(wait=False, cancel_futures=True)
+        print("✅ Analytics service stopped")
+    
+    def run(self):
+        """Blocking entry point"""
+        try:
+            asyncio.run(self.run_async())
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,72 @@
+"""
+Calculation benchmark: per-device loop vs batch-vectorized MetricsCalculator
+
+Usage:
+    python benchmarks/bench_batch.py [--devices 10 100 1000] [--samples 10]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+from metrics_calculator import MetricsCalculator
+from models import LogColumns
+
+
+def build_windows(n_devices: int, samples: int, lines: int = 8):
+    rng = np.random.default_rng(0)
+    start_ms = 1763510400000
+    windows = []
+    for i in range(n_devices):
+        gaps = rng.choice([1000, 2000, 45000], size=samples, p=[0.7, 0.25, 0.05])
+        windows.append(LogColumns(
+            device_id=f'DEV-{i:04d}',
+            production_line=f'DC-{i % lines:02d}',
+            brick_type='300x600',
+            position='sau-me',
+            timestamps=start_ms + np.cumsum(gaps),
+            counts=np.cumsum(rng.integers(0, 4, size=samples)),
+        ))
+    return windows
+
+
+def per_device(calculator: MetricsCalculator, windows):
+    lines = {}
+    for window in windows:
+        metrics = calculator.calculate_device_metrics_columnar(window)
+        lines.setdefault(metrics.production_line, []).append(metrics)
+    return {name: calculator.calculate_line_metrics(devices) for name, devices in lines.items()}
+
+
+def timed(func, repeat: int) -> float:
+    """Best wall time of repeat runs (ms)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--devices', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--samples', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    calculator = MetricsCalculator()
+    
+    print(f"{'Devices':>8}{'Per-device ms':>16}{'Batch ms':>12}{'Speedup':>10}")
+    for n in args.devices:
+        windows = build_windows(n, args.samples)
+        loop_ms = timed(lambda: per_device(calculator, windows), args.repeat)
+        batch_ms = timed(lambda: calculator.calculate_batch(windows, args.samples), args.repeat)
+        print(f"{n:>8}{loop_ms:>16.2f}{batch_ms:>12.2f}{loop_ms / batch_ms:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Memory benchmark: bytes per log entry for each record representation
+
+Usage:
+    python benchmarks/bench_memory.py [--entries 100000]
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+from models import LogEntry, LogColumns
+
+
+@dataclass
+class DictLogEntry:
+    """Previous LogEntry layout: plain dataclass with a per-instance __dict__"""
+    timestamp: datetime
+    count: int
+    device_id: str
+    production_line: str
+    position: str
+
+
+def measure(build) -> int:
+    """Bytes still allocated after build() returns (result kept alive)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def build_dict_entries(n: int, start: datetime):
+    # Metadata strings shared within one file, as the old parser did
+    device_id, production_line, position = (
+        ''.join(['SAU-ME-', '01']), ''.join(['DC-', '01']), ''.join(['sau-', 'me']))
+    return [
+        DictLogEntry(
+            timestamp=start + timedelta(seconds=i),
+            count=i,
+            device_id=device_id,
+            production_line=production_line,
+            position=position,
+        )
+        for i in range(n)
+    ]
+
+
+def build_slotted_entries(n: int, start: datetime):
+    device_id, production_line, position = (
+        sys.intern('SAU-ME-01'), sys.intern('DC-01'), sys.intern('sau-me'))
+    return [
+        LogEntry(
+            timestamp=start + timedelta(seconds=i),
+            count=i,
+            device_id=device_id,
+            production_line=production_line,
+            position=position,
+        )
+        for i in range(n)
+    ]
+
+
+def build_columns(n: int, start: datetime):
+    start_ms = int(start.timestamp() * 1000)
+    return LogColumns(
+        device_id='SAU-ME-01',
+        production_line='DC-01',
+        brick_type='300x600',
+        position='sau-me',
+        timestamps=start_ms + np.arange(n, dtype=np.int64) * 1000,
+        counts=np.arange(n, dtype=np.int64),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100_000)
+    args = parser.parse_args()
+    
+    n = args.entries
+    start = datetime(2025, 11, 19, tzinfo=timezone.utc)
+    
+    results = [
+        ('dataclass + __dict__ (before)', measure(lambda: build_dict_entries(n, start))),
+        ('slots + interned metadata', measure(lambda: build_slotted_entries(n, start))),
+        ('LogColumns (int64 arrays)', measure(lambda: build_columns(n, start))),
+    ]
+    
+    print(f"Entries: {n:,}")
+    print(f"{'Representation':<32}{'Total MB':>12}{'Bytes/entry':>14}")
+    for name, total in results:
+        print(f"{name:<32}{total / 1e6:>12.2f}{total / n:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+Pipeline benchmark: parse, tail, calculate and publish on a synthetic log tree
+Reports throughput, p50/p99 latency and peak RSS per stage
+
+Usage:
+    python benchmarks/bench_pipeline.py [--devices 24] [--lines 4] [--hours 8] [--rate 1.0]
+    python benchmarks/bench_pipeline.py --log-dir LOG_DIR --date 2025-11-19 [--redis localhost:6379]
+"""
+import argparse
+import contextlib
+import io
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+from analytics_service import AnalyticsService
+from file_monitor import TailReader
+from log_parser import LogParser
+from metrics_calculator import MetricsCalculator
+from generate_logs import format_lines, generate_log_tree
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class RedisStandIn:
+    """In-process stand-in for the Redis client: pipelines record commands and payload bytes"""
+    
+    def __init__(self):
+        self.commands = 0
+        self.bytes = 0
+    
+    def pipeline(self, transaction: bool = True) -> 'RedisStandIn':
+        return self
+    
+    def publish(self, channel: str, data: str):
+        self.commands += 1
+        self.bytes += len(data)
+    
+    def setex(self, key: str, ttl: int, data: str):
+        self.commands += 1
+        self.bytes += len(data)
+    
+    def xadd(self, name: str, fields: dict, id: str = '*', maxlen=None, approximate=True):
+        self.commands += 1
+        self.bytes += sum(len(k) + len(v) for k, v in fields.items())
+    
+    def hset(self, name: str, key=None, value=None, mapping=None):
+        self.commands += 1
+        self.bytes += sum(len(k) + len(v) for k, v in (mapping or {}).items())
+    
+    def execute(self):
+        return []
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (MB), NaN if unavailable"""
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_timed(func: Callable, args: Iterable) -> List[float]:
+    """Latency (s) of func(arg) for each arg, with the service's progress output suppressed"""
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for arg in args:
+            start = time.perf_counter()
+            func(arg)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name: str, latencies: List[float], items: float, unit: str):
+    """One result row: items processed per second over all calls"""
+    total = sum(latencies)
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    throughput = items / total if total > 0 else float('inf')
+    print(f"{name:<28}{len(latencies):>7}{throughput:>14,.0f} {unit:<9}"
+          f"{p50:>10.3f}{p99:>10.3f}{peak_rss_mb():>10.1f}")
+
+
+def bench_parse(parser: LogParser, files: List[Path]):
+    entries = []
+    latencies = run_timed(lambda f: entries.append(len(parser.parse_log_file(f))), files)
+    report('LogParser.parse_log_file', latencies, sum(entries), 'entries/s')
+
+
+def bench_tail(files: List[Path], appends: int, lines_per_append: int):
+    reader = TailReader()
+    for file_path in files:
+        reader.get_new_lines(file_path)
+    
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+    batch = format_lines(now_ms + np.arange(lines_per_append, dtype=np.int64),
+                         np.arange(lines_per_append, dtype=np.int64))
+    latencies = []
+    for i in range(appends):
+        file_path = files[i % len(files)]
+        with open(file_path, 'a', encoding='utf-8') as f:
+            f.write(batch)
+        latencies.extend(run_timed(reader.get_new_lines, [file_path]))
+    report('TailReader.get_new_lines', latencies, appends * lines_per_append, 'lines/s')
+
+
+def bench_device_metrics(parser: LogParser, files: List[Path], window: int, calls: int):
+    calculator = MetricsCalculator()
+    windows = [parser.parse_log_file(f)[-window:] for f in files]
+    
+    latencies = run_timed(calculator.calculate_device_metrics,
+                          (windows[i % len(windows)] for i in range(calls)))
+    report('calculate_device_metrics', latencies, calls, 'devices/s')
+
+
+def bench_all_metrics(service: AnalyticsService, date: datetime, files: List[Path], ticks: int):
+    cold = run_timed(service.calculate_all_metrics, [date])
+    report('calculate_all_metrics cold', cold, len(files), 'devices/s')
+    
+    # Every tick, each device appends one reading (steady state)
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+    latencies = []
+    for tick in range(ticks):
+        line = format_lines(np.array([now_ms + tick * 1000]), np.array([tick]))
+        for file_path in files:
+            with open(file_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        latencies.extend(run_timed(service.calculate_all_metrics, [date]))
+    report('calculate_all_metrics tick', latencies, ticks * len(files), 'devices/s')
+
+
+def bench_publish(service: AnalyticsService, date: datetime, calls: int):
+    with contextlib.redirect_stdout(io.StringIO()):
+        line_metrics = service.calculate_all_metrics(date)
+    latencies = run_timed(service.publish_metrics, [line_metrics] * calls)
+    devices = sum(m.total_devices for m in line_metrics.values())
+    report('publish_metrics', latencies, calls * devices, 'devices/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--log-dir', type=Path,
+                        help='existing log tree, copied to a temporary directory (default: generate one)')
+    parser.add_argument('--date', default=datetime.now().strftime('%Y-%m-%d'))
+    parser.add_argument('--devices', type=int, default=24)
+    parser.add_argument('--lines', type=int, default=4)
+    parser.add_argument('--hours', type=float, default=8)
+    parser.add_argument('--rate', type=float, default=1.0, help='readings per second per device')
+    parser.add_argument('--ticks', type=int, default=20)
+    parser.add_argument('--window', type=int, default=10, help='entries per calculate_device_metrics call')
+    parser.add_argument('--redis', help='host:port of a real Redis (default: in-process stand-in)')
+    args = parser.parse_args()
+    
+    date = datetime.strptime(args.date, '%Y-%m-%d')
+    with tempfile.TemporaryDirectory() as tmp:
+        log_dir = Path(tmp)
+        if args.log_dir is None:
+            generate_log_tree(log_dir, date, args.devices, args.lines, args.hours, args.rate)
+        elif (args.log_dir / args.date).is_dir():
+            # The tail / tick stages append readings: never to the logs passed in
+            shutil.copytree(args.log_dir / args.date, log_dir / args.date)
+        
+        log_parser = LogParser(log_dir)
+        files = log_parser.find_device_logs(date)
+        if not files:
+            print(f"No log files for {args.date} in {args.log_dir or log_dir}")
+            return
+        size = sum(f.stat().st_size for f in files)
+        print(f"{len(files)} files, {size / 1e6:.1f} MB in {args.log_dir or log_dir}\n")
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            service = AnalyticsService(live_mode=False)
+        service.log_parser = log_parser
+        if service.tail_cache is not None:
+            service.tail_cache.log_parser = log_parser
+        if args.redis:
+            import redis
+            host, _, port = args.redis.partition(':')
+            service.redis_client = redis.Redis(host=host, port=int(port or 6379))
+        else:
+            service.redis_client = RedisStandIn()
+        
+        print(f"{'Stage':<28}{'Calls':>7}{'Throughput':>14} {'':<9}{'p50 ms':>10}{'p99 ms':>10}{'RSS MB':>10}")
+        bench_parse(log_parser, files)
+        bench_tail(files, appends=200, lines_per_append=5)
+        bench_device_metrics(log_parser, files, args.window, calls=1000)
+        bench_all_metrics(service, date, files, args.ticks)
+        bench_publish(service, date, calls=100)
+
+
+if __name__ == '__main__':
+    main()
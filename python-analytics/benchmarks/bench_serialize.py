@@ -0,0 +1,102 @@
+"""
+Serializer benchmark: to_dict + json.dumps (original path) vs the serializers.py encoders
+Reports time per LineMetrics payload and payload size
+
+Usage:
+    python benchmarks/bench_serialize.py [--lines 8] [--devices 6 24 96] [--repeat 200]
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+from models import DeviceMetrics, LineMetrics
+from serializers import SERIALIZERS, REQUIRED_MODULES
+
+
+def build_line(rng: np.random.Generator, line: str, devices: int) -> LineMetrics:
+    now = datetime.now(timezone.utc)
+    device_metrics = []
+    for i in range(devices):
+        speed = float(rng.uniform(0, 60))
+        device_metrics.append(DeviceMetrics(
+            device_id=f'SAU-ME-{i:02d}',
+            production_line=line,
+            position='sau-me',
+            current_count=int(rng.integers(0, 50000)),
+            last_update=now - timedelta(milliseconds=int(rng.integers(0, 60000))),
+            speed_per_minute=speed,
+            speed_per_hour=speed * 60,
+            total_produced_today=int(rng.integers(0, 50000)),
+            total_produced_last_hour=int(rng.integers(0, 3600)),
+            total_produced_last_10min=int(rng.integers(0, 600)),
+            is_running=speed > 1,
+            idle_time_seconds=float(rng.uniform(0, 120)),
+            uptime_seconds=float(rng.uniform(0, 28800)),
+            trend='stable',
+            efficiency_percent=float(rng.uniform(50, 100)),
+        ))
+    running = sum(d.is_running for d in device_metrics)
+    return LineMetrics(
+        production_line=line,
+        total_devices=devices,
+        running_devices=running,
+        stopped_devices=devices - running,
+        total_produced_today=sum(d.total_produced_today for d in device_metrics),
+        average_speed_per_hour=float(np.mean([d.speed_per_hour for d in device_metrics])),
+        devices=device_metrics,
+    )
+
+
+def timed(func, repeat: int) -> float:
+    """Median wall time of one call (µs)"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=8)
+    parser.add_argument('--devices', type=int, nargs='+', default=[6, 24, 96])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    
+    rng = np.random.default_rng(0)
+    serializers = [cls() for name, cls in SERIALIZERS.items()
+                   if REQUIRED_MODULES.get(name, True) is not None]
+    missing = [name for name, module in REQUIRED_MODULES.items() if module is None]
+    if missing:
+        print(f"Skipping {', '.join(missing)} (not installed)\n")
+    
+    print(f"{'Devices/line':>12}  {'Encoder':<32}{'µs/tick':>10}{'µs/line':>10}{'bytes/line':>12}{'vs json':>9}")
+    for devices in args.devices:
+        lines = [build_line(rng, f'DC-{i + 1:02d}', devices) for i in range(args.lines)]
+        
+        # Original path: to_dict() with isoformat() per device, then the stdlib encoder
+        baseline = timed(lambda: [json.dumps(m.to_dict()) for m in lines], args.repeat)
+        size = np.mean([len(json.dumps(m.to_dict())) for m in lines])
+        print(f"{devices:>12}  {'to_dict + json.dumps':<32}{baseline:>10.1f}"
+              f"{baseline / len(lines):>10.1f}{size:>12.0f}{1:>8.2f}x")
+        
+        for serializer in serializers:
+            def encode():
+                return [serializer.dumps(m.to_dict(raw_timestamps=True)) for m in lines]
+            elapsed = timed(encode, args.repeat)
+            size = np.mean([len(data) for data in encode()])
+            print(f"{devices:>12}  {serializer.name + ' (' + serializer.content_type + ')':<32}"
+                  f"{elapsed:>10.1f}{elapsed / len(lines):>10.1f}{size:>12.0f}"
+                  f"{baseline / elapsed:>8.2f}x")
+        print()
+
+
+if __name__ == '__main__':
+    main()
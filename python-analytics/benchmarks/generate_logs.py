@@ -0,0 +1,130 @@
+"""
+Synthetic log-tree generator
+Writes logs/{date}/{line}/{brick-type}/{position}/{device}_{ts}.txt files in the
+format written by the MQTT service, with counter resets and gaps
+
+Usage:
+    python benchmarks/generate_logs.py OUTPUT_DIR [--devices 12] [--lines 2] [--hours 8] [--rate 1.0]
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+from config import DEVICE_POSITIONS
+
+
+BRICK_TYPES = ['300x600', '600x600', '400x800']
+
+
+def generate_device_log(rng: np.random.Generator, start: datetime, hours: float, rate: float,
+                        reset_probability: float, gap_probability: float):
+    """
+    Readings of one device
+    
+    Args:
+        rng: Random generator
+        start: Time of the first reading (UTC)
+        hours: Length of the log
+        rate: Average readings per second
+        reset_probability: Chance per reading that the counter restarts from 0
+        gap_probability: Chance per reading of a stop of 1-10 minutes before it
+    
+    Returns:
+        Tuple of (int64 epoch-ms timestamps, int64 counts)
+    """
+    n = max(int(hours * 3600 * rate), 1)
+    intervals = rng.exponential(1000 / rate, size=n).astype(np.int64) + 1
+    stops = rng.random(n) < gap_probability
+    intervals[stops] += rng.integers(60000, 600000, size=int(stops.sum()))
+    timestamps = int(start.timestamp() * 1000) + np.cumsum(intervals)
+    
+    # Bricks per reading; stopped devices produce nothing
+    produced = rng.poisson(2, size=n)
+    produced[stops] = 0
+    counts = np.cumsum(produced)
+    
+    # Counter restarts from 0 after a reset
+    for reset in np.flatnonzero(rng.random(n) < reset_probability).tolist():
+        counts[reset:] -= counts[reset]
+    
+    end_ms = int((start + timedelta(hours=hours)).timestamp() * 1000)
+    keep = timestamps <= end_ms
+    return timestamps[keep], counts[keep]
+
+
+def format_lines(timestamps: np.ndarray, counts: np.ndarray) -> str:
+    """'[2025-11-19T08:00:00.123Z] Count: 42' lines"""
+    stamps = np.datetime_as_string(timestamps.astype('datetime64[ms]'), unit='ms')
+    return ''.join(f"[{stamp}Z] Count: {count}\n" for stamp, count in zip(stamps, counts.tolist()))
+
+
+def generate_log_tree(output_dir: Path, date: datetime, devices: int = 12, lines: int = 2,
+                      hours: float = 8, rate: float = 1.0, reset_probability: float = 1e-4,
+                      gap_probability: float = 5e-4, seed: int = 0) -> List[Path]:
+    """
+    Write one log file per device below output_dir/{date}
+    
+    Args:
+        output_dir: Root log directory
+        date: Day of the logs (readings start at 06:00 UTC)
+        devices: Number of devices (spread over lines and positions)
+        lines: Number of production lines
+        hours: Hours of readings per device
+        rate: Average readings per second per device
+        reset_probability: Chance per reading of a counter reset
+        gap_probability: Chance per reading of a production stop
+        seed: Random seed
+    
+    Returns:
+        Paths of the written files
+    """
+    rng = np.random.default_rng(seed)
+    positions = list(DEVICE_POSITIONS)
+    start = datetime(date.year, date.month, date.day, 6, tzinfo=timezone.utc)
+    day_dir = Path(output_dir) / date.strftime('%Y-%m-%d')
+    
+    files = []
+    for i in range(devices):
+        line = f'DC-{i % lines + 1:02d}'
+        position = positions[(i // lines) % len(positions)]
+        number = i // (lines * len(positions)) + 1
+        device = f'{position}-{number:02d}'
+        
+        timestamps, counts = generate_device_log(rng, start, hours, rate,
+                                                 reset_probability, gap_probability)
+        directory = day_dir / line / BRICK_TYPES[i % lines % len(BRICK_TYPES)] / position
+        directory.mkdir(parents=True, exist_ok=True)
+        file_path = directory / f"{device}_{start.strftime('%Y%m%dT%H%M%S')}.txt"
+        file_path.write_text(format_lines(timestamps, counts), encoding='utf-8')
+        files.append(file_path)
+    
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('output_dir', type=Path)
+    parser.add_argument('--date', default=datetime.now().strftime('%Y-%m-%d'))
+    parser.add_argument('--devices', type=int, default=12)
+    parser.add_argument('--lines', type=int, default=2)
+    parser.add_argument('--hours', type=float, default=8)
+    parser.add_argument('--rate', type=float, default=1.0, help='readings per second per device')
+    parser.add_argument('--resets', type=float, default=1e-4, help='counter reset probability per reading')
+    parser.add_argument('--gaps', type=float, default=5e-4, help='stop probability per reading')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    files = generate_log_tree(args.output_dir, datetime.strptime(args.date, '%Y-%m-%d'),
+                              args.devices, args.lines, args.hours, args.rate,
+                              args.resets, args.gaps, args.seed)
+    size = sum(f.stat().st_size for f in files)
+    print(f"Wrote {len(files)} files ({size / 1e6:.1f} MB) to {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
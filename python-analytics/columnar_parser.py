@@ -0,0 +1,141 @@
+"""
+Vectorized parser for device log buffers
+Decodes `[YYYY-MM-DDTHH:MM:SS.mmmZ] Count: N` lines with fixed-offset slicing
+"""
+import re
+from typing import Optional, Tuple
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# Fixed-width line prefix: `[2025-11-18T13:42:13.000Z] Count: `
+PREFIX_TEMPLATE = b'[0000-00-00T00:00:00.000Z] Count: '
+PREFIX_LEN = len(PREFIX_TEMPLATE)
+MAX_COUNT_DIGITS = 18  # Fits in int64
+
+# Offsets of digit characters inside the prefix
+_DIGIT_OFFSETS = np.array([i for i, c in enumerate(PREFIX_TEMPLATE) if c == ord('0')])
+_LITERAL_OFFSETS = np.array([i for i, c in enumerate(PREFIX_TEMPLATE) if c != ord('0')])
+_LITERAL_VALUES = np.frombuffer(PREFIX_TEMPLATE, dtype=np.uint8)[_LITERAL_OFFSETS]
+
+# Fallback for buffers that do not follow the fixed layout exactly
+BUFFER_PATTERN = re.compile(
+    rb'^[ \t]*\[(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3})Z\] Count: (\d+)',
+    re.MULTILINE,
+)
+
+# Lines decoded per chunk (bounds the size of temporary index arrays)
+CHUNK_LINES = 65536
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+def _digits_to_int(digits: np.ndarray) -> np.ndarray:
+    """Combine a (n, k) matrix of decimal digits into n integers"""
+    weights = 10 ** np.arange(digits.shape[1] - 1, -1, -1, dtype=np.int64)
+    return digits.astype(np.int64) @ weights
+
+
+def _decode_fixed(buf: np.ndarray, starts: np.ndarray,
+                  ends: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Decode lines [starts[i], ends[i]) that follow the fixed layout
+    
+    Returns:
+        Tuple of (timestamps in epoch ms, counts) or None if any line deviates
+    """
+    if np.any(ends - starts <= PREFIX_LEN):
+        return None
+    
+    # Row gathers over a strided view copy PREFIX_LEN bytes per line
+    prefix = sliding_window_view(buf, PREFIX_LEN)[starts]
+    
+    if not np.array_equal(prefix[:, _LITERAL_OFFSETS],
+                          np.broadcast_to(_LITERAL_VALUES, (len(starts), len(_LITERAL_OFFSETS)))):
+        return None
+    
+    digits = prefix[:, _DIGIT_OFFSETS] - ord('0')
+    if np.any(digits > 9):  # uint8 wraps below '0'
+        return None
+    
+    year = _digits_to_int(digits[:, 0:4])
+    month = _digits_to_int(digits[:, 4:6])
+    day = _digits_to_int(digits[:, 6:8])
+    hour = _digits_to_int(digits[:, 8:10])
+    minute = _digits_to_int(digits[:, 10:12])
+    second = _digits_to_int(digits[:, 12:14])
+    millis = _digits_to_int(digits[:, 14:17])
+    
+    months = (year - 1970) * 12 + (month - 1)
+    days = (months.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+            + day - 1)
+    timestamps = (((days * 24 + hour) * 60 + minute) * 60 + second) * 1000 + millis
+    
+    # Count: variable-width digits, right-aligned at the end of the line
+    widths = ends - starts - PREFIX_LEN
+    max_width = int(widths.max())
+    if max_width > MAX_COUNT_DIGITS:
+        return None
+    
+    # Window ending at each line end; columns left of the number are masked out
+    count_digits = sliding_window_view(buf, max_width)[ends - max_width] - ord('0')
+    present = np.arange(max_width - 1, -1, -1) < widths[:, None]
+    if np.any(present & (count_digits > 9)):
+        return None
+    
+    counts = _digits_to_int(np.where(present, count_digits, 0))
+    
+    return timestamps, counts
+
+
+def _parse_regex(data) -> Tuple[np.ndarray, np.ndarray]:
+    """Slower path: regex over the buffer, NumPy string casts for the columns"""
+    matches = BUFFER_PATTERN.findall(data)
+    if not matches:
+        return _EMPTY, _EMPTY
+    
+    timestamp_strs, count_strs = zip(*matches)
+    timestamps = np.array(timestamp_strs).astype('datetime64[ms]').astype(np.int64)
+    counts = np.array(count_strs).astype(np.int64)
+    return timestamps, counts
+
+
+def parse_buffer_arrays(data) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parse a whole log buffer into columnar arrays
+    
+    Args:
+        data: File contents (bytes, bytearray, mmap or memoryview)
+    
+    Returns:
+        Tuple of (int64 epoch-ms timestamps, int64 counts)
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if len(buf) == 0:
+        return _EMPTY, _EMPTY
+    
+    # Line boundaries (a last line without newline still counts)
+    newlines = np.flatnonzero(buf == ord('\n'))
+    ends = newlines
+    if buf[-1] != ord('\n'):
+        ends = np.append(ends, len(buf))
+    starts = np.concatenate(([0], newlines + 1))[:len(ends)]
+    
+    # Skip empty lines, strip '\r' from CRLF files
+    non_empty = ends > starts
+    starts, ends = starts[non_empty], ends[non_empty]
+    ends = ends - (buf[ends - 1] == ord('\r'))
+    
+    timestamp_chunks = []
+    count_chunks = []
+    for i in range(0, len(starts), CHUNK_LINES):
+        decoded = _decode_fixed(buf, starts[i:i + CHUNK_LINES], ends[i:i + CHUNK_LINES])
+        if decoded is None:
+            return _parse_regex(data)
+        timestamp_chunks.append(decoded[0])
+        count_chunks.append(decoded[1])
+    
+    if not timestamp_chunks:
+        return _EMPTY, _EMPTY
+    
+    return np.concatenate(timestamp_chunks), np.concatenate(count_chunks)
@@ -10,6 +10,7 @@ load_dotenv()
 
 # Paths
 BASE_DIR = Path(__file__).parent
+DATA_DIR = Path(os.getenv('DATA_DIR') or BASE_DIR / 'data')  # local state (metrics history)
 LOG_DIR = Path(os.getenv('LOG_DIR', '../tile-production-management/logs'))
 
 # Redis
@@ -31,6 +32,68 @@ DB_PASSWORD = os.getenv('DB_PASSWORD', '123456')
 CALCULATION_INTERVAL = int(os.getenv('CALCULATION_INTERVAL', 10))  # seconds
 HISTORY_WINDOW = int(os.getenv('HISTORY_WINDOW', 3600))  # seconds
 
+# Refresh mode: 'incremental' (read only appended bytes) or 'full' (re-parse whole file)
+REFRESH_MODE = os.getenv('REFRESH_MODE', 'incremental')
+TAIL_SIZE = int(os.getenv('TAIL_SIZE', 10))  # entries kept per device
+
+# Binary cache of parsed log columns (empty PARSE_CACHE_DIR = sidecar next to each log file)
+PARSE_CACHE_ENABLED = os.getenv('PARSE_CACHE_ENABLED', 'false').lower() == 'true'
+PARSE_CACHE_DIR = os.getenv('PARSE_CACHE_DIR', '')
+
+# Publishing: 'full' (whole LineMetrics every tick) or 'delta' (changed devices/fields
+# on analytics:delta:line:{line}, full snapshot every FULL_SNAPSHOT_INTERVAL seconds)
+PUBLISH_MODE = os.getenv('PUBLISH_MODE', 'full')
+FULL_SNAPSHOT_INTERVAL = int(os.getenv('FULL_SNAPSHOT_INTERVAL', 60))  # seconds
+
+# Output: 'pubsub' (PUBLISH on analytics:*), 'streams' (XADD to analytics:stream:line:{line}
+# and analytics:stream:aggregate, trimmed to ~STREAM_MAXLEN entries) or 'both'
+OUTPUT_MODE = os.getenv('OUTPUT_MODE', 'pubsub')
+STREAM_MAXLEN = int(os.getenv('STREAM_MAXLEN', 10000))  # entries per stream
+
+# Payload encodings, comma-separated: 'json' (stdlib), 'orjson' (same JSON, faster) and/or
+# 'msgpack' (epoch-ms timestamps, published as analytics:msgpack:*, metrics:msgpack:*)
+SERIALIZERS = os.getenv('SERIALIZERS', 'json')
+
+# File events: a burst of writes to one file is coalesced for FILE_EVENT_DELAY seconds,
+# callbacks run on FILE_EVENT_WORKERS threads off the watchdog observer thread
+FILE_EVENT_DELAY = float(os.getenv('FILE_EVENT_DELAY', 0.1))  # seconds
+FILE_EVENT_WORKERS = int(os.getenv('FILE_EVENT_WORKERS', 4))
+
+# Change detection: 'watchdog', 'polling' (scandir snapshots of today's directory every
+# POLL_INTERVAL) or 'auto' (watchdog, polling the production lines it misses)
+FILE_MONITOR_MODE = os.getenv('FILE_MONITOR_MODE', 'watchdog')
+POLL_INTERVAL = float(os.getenv('POLL_INTERVAL', 1.0))  # seconds
+
+# Event-driven mode (live + incremental only): a file change recomputes its device and
+# republishes its line after COALESCE_DELAY; all files are re-read every FULL_REFRESH_INTERVAL
+EVENT_DRIVEN = os.getenv('EVENT_DRIVEN', 'false').lower() == 'true'
+COALESCE_DELAY = float(os.getenv('COALESCE_DELAY', 0.2))  # seconds
+FULL_REFRESH_INTERVAL = int(os.getenv('FULL_REFRESH_INTERVAL', 60))  # seconds
+
+# Self-instrumentation: Prometheus text on http://METRICS_HOST:METRICS_PORT/metrics
+# (METRICS_PORT=0 disables the endpoint; the Redis hash is always written).
+# Unauthenticated, so local only by default: set 0.0.0.0 to scrape it from outside a container
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+
+# Sharding: workers split production lines by consistent hashing over the live workers,
+# holding Redis leases of SHARD_LEASE_TTL seconds (renewed every third of it); the worker
+# holding the aggregate lease merges every shard into analytics:aggregate
+SHARDING_ENABLED = os.getenv('SHARDING_ENABLED', 'false').lower() == 'true'
+WORKER_ID = os.getenv('WORKER_ID', '')  # default: {hostname}-{pid}
+SHARD_LEASE_TTL = float(os.getenv('SHARD_LEASE_TTL', 30))  # seconds
+SHARD_REPLICAS = int(os.getenv('SHARD_REPLICAS', 64))  # ring points per worker
+
+# Metrics history for charts ('' = off, 'redis' = sorted sets
+# history:{tier}:{line}:{brick}:{position}:{device}, 'sqlite' = METRICS_HISTORY_PATH):
+# 10 s points for 1 hour, 1 min for 1 day, 15 min for 1 month
+METRICS_HISTORY = os.getenv('METRICS_HISTORY', '')
+METRICS_HISTORY_PATH = Path(os.getenv('METRICS_HISTORY_PATH') or DATA_DIR / 'metrics_history.db')
+
+# Async mode (--async): bounded file event queue and graceful shutdown budget
+EVENT_QUEUE_SIZE = int(os.getenv('EVENT_QUEUE_SIZE', 1000))
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', 10))  # seconds
+
 # Device mapping (position name -> display name)
 DEVICE_POSITIONS = {
     'sau-me': 'Sau máy ép',
@@ -0,0 +1,238 @@
+"""
+Streaming per-device metrics state
+Each new reading updates a fixed-size ring buffer and running sums in O(1),
+so a calculation tick only reads out precomputed values
+"""
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+from models import LogEntry
+from production_buckets import MinuteBuckets
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Interval without count change longer than this is a stop point (ms)
+STOP_GAP_MS = 30000
+
+# Speeds below this (viên/giây) count as not moving
+MOVING_SPEED = 0.01
+
+# Running regression sums are recomputed from the ring every N readings
+# so floating-point error cannot build up
+RESYNC_EVERY = 1024
+
+
+def to_epoch_ms(timestamp: datetime) -> int:
+    """Exact epoch milliseconds of a timezone-aware datetime"""
+    delta = timestamp - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
+
+
+class DeviceAccumulator:
+    """
+    Last `capacity` readings of one device plus running aggregates:
+    - regression sums (Σy, Σi·y) over the per-interval speeds, for the trend slope
+    - number of speeds above MOVING_SPEED, for the 'stopped' trend
+    - running time since the last stop point, for uptime
+    - per-minute production buckets, for the last hour / last 10 min totals
+    """
+    
+    def __init__(self, capacity: int = 10, bucket_minutes: int = 60):
+        """
+        Args:
+            capacity: Number of most recent readings kept (window for speed/trend/uptime)
+            bucket_minutes: Minutes of per-minute production kept (HISTORY_WINDOW / 60)
+        """
+        self.capacity = max(capacity, 2)
+        self.buckets = MinuteBuckets(bucket_minutes)
+        self.device_id = ''
+        self.production_line = ''
+        self.position = ''
+        
+        # Point ring: reading p lives at p % capacity
+        self.timestamps = np.zeros(self.capacity, dtype=np.int64)
+        self.counts = np.zeros(self.capacity, dtype=np.int64)
+        
+        # Interval ring: interval p (reading p-1 → p) lives at p % (capacity - 1)
+        intervals = self.capacity - 1
+        self.gaps = np.zeros(intervals, dtype=np.int64)
+        self.speeds = np.zeros(intervals, dtype=np.float64)
+        self.valid = np.zeros(intervals, dtype=bool)
+        
+        self.size = 0    # readings currently in the window
+        self.pushes = 0  # readings ever pushed (sequence number of the next one)
+        self._reset_sums()
+    
+    def _reset_sums(self):
+        self.n_valid = 0      # intervals with a positive gap (have a speed)
+        self.n_moving = 0     # of which speed >= MOVING_SPEED
+        self.sum_y = 0.0      # Σ speed
+        self.sum_xy = 0.0     # Σ position·speed (position among valid speeds)
+        self.last_stop = -1   # sequence number of the newest stop interval
+        self.uptime_ms = 0    # Σ gaps after the newest stop interval in the window
+    
+    def __len__(self) -> int:
+        return self.size
+    
+    def push(self, timestamp_ms: int, count: int):
+        """
+        Add one reading (O(1) for in-order readings)
+        
+        Args:
+            timestamp_ms: Epoch milliseconds
+            count: Counter value
+        """
+        if self.size and timestamp_ms < self.latest()[0]:
+            # Out of order: rebuild the window sorted by timestamp (rare)
+            points = sorted(self.points() + [(timestamp_ms, count)], key=lambda p: p[0])
+            self.clear()
+            for point in points[-self.capacity:]:
+                self.push(*point)
+            return
+        
+        if self.size == self.capacity:
+            self._drop_interval(self.pushes - self.size + 1)
+            self.size -= 1
+        
+        seq = self.pushes
+        if self.size:
+            previous_ts, previous_count = self.latest()
+            self._add_interval(seq, timestamp_ms - previous_ts, count - previous_count)
+        
+        self.timestamps[seq % self.capacity] = timestamp_ms
+        self.counts[seq % self.capacity] = count
+        self.size += 1
+        self.pushes += 1
+        
+        if self.pushes % RESYNC_EVERY == 0:
+            self._resync()
+    
+    def push_entry(self, entry: LogEntry, buckets: bool = True):
+        """
+        Add one parsed log entry (also records the device metadata and production)
+        
+        Args:
+            entry: Parsed reading
+            buckets: Also count its production (False if the buckets already hold it)
+        """
+        self.device_id = entry.device_id
+        self.production_line = entry.production_line
+        self.position = entry.position
+        timestamp_ms = to_epoch_ms(entry.timestamp)
+        # Not in push: window rebuilds re-push readings that were already counted
+        if buckets:
+            self.buckets.push(timestamp_ms, entry.count)
+        self.push(timestamp_ms, entry.count)
+    
+    def extend_entries(self, entries: Iterable[LogEntry], buckets: bool = True):
+        """Add parsed log entries in file order (see push_entry)"""
+        for entry in entries:
+            self.push_entry(entry, buckets)
+    
+    def _add_interval(self, seq: int, gap_ms: int, count_change: int):
+        slot = seq % (self.capacity - 1)
+        self.gaps[slot] = gap_ms
+        self.valid[slot] = gap_ms > 0
+        
+        if gap_ms > 0:
+            speed = count_change / (gap_ms / 1000)
+            self.speeds[slot] = speed
+            self.sum_xy += self.n_valid * speed
+            self.sum_y += speed
+            self.n_valid += 1
+            if speed >= MOVING_SPEED:
+                self.n_moving += 1
+        
+        if count_change == 0 and gap_ms > STOP_GAP_MS:
+            self.last_stop = seq
+            self.uptime_ms = 0
+        else:
+            self.uptime_ms += gap_ms
+    
+    def _drop_interval(self, seq: int):
+        """Remove the oldest interval of the window"""
+        slot = seq % (self.capacity - 1)
+        
+        if self.valid[slot]:
+            speed = self.speeds[slot]
+            # Dropped speed had position 0; every remaining position shifts down by one
+            self.sum_y -= speed
+            self.sum_xy -= self.sum_y
+            self.n_valid -= 1
+            if speed >= MOVING_SPEED:
+                self.n_moving -= 1
+        
+        # Intervals before the newest stop were never part of uptime
+        if self.last_stop < seq:
+            self.uptime_ms -= int(self.gaps[slot])
+    
+    def _resync(self):
+        """Recompute the running sums exactly from the ring (not through push: no re-entry)"""
+        self._reset_sums()
+        for seq in range(self.pushes - self.size + 1, self.pushes):
+            previous, current = (seq - 1) % self.capacity, seq % self.capacity
+            self._add_interval(seq, int(self.timestamps[current] - self.timestamps[previous]),
+                               int(self.counts[current] - self.counts[previous]))
+    
+    def clear(self):
+        """Forget all readings of the window (metadata and production buckets are kept)"""
+        self.size = 0
+        self.pushes = 0
+        self._reset_sums()
+    
+    def points(self) -> List[Tuple[int, int]]:
+        """(timestamp ms, count) readings in the window, oldest first"""
+        return [
+            (int(self.timestamps[seq % self.capacity]), int(self.counts[seq % self.capacity]))
+            for seq in range(self.pushes - self.size, self.pushes)
+        ]
+    
+    def latest(self) -> Tuple[int, int]:
+        """Newest (timestamp ms, count) reading"""
+        slot = (self.pushes - 1) % self.capacity
+        return int(self.timestamps[slot]), int(self.counts[slot])
+    
+    def oldest(self) -> Tuple[int, int]:
+        """Oldest (timestamp ms, count) reading in the window"""
+        slot = (self.pushes - self.size) % self.capacity
+        return int(self.timestamps[slot]), int(self.counts[slot])
+    
+    @property
+    def uptime_seconds(self) -> float:
+        """Running time since the last stop point within the window"""
+        return self.uptime_ms / 1000
+    
+    def trend_slope(self) -> Optional[float]:
+        """Least-squares slope of the per-interval speeds, None if fewer than 2 speeds"""
+        n = self.n_valid
+        if n < 2:
+            return None
+        
+        sum_x = n * (n - 1) / 2
+        sum_xx = (n - 1) * n * (2 * n - 1) / 6
+        return (n * self.sum_xy - sum_x * self.sum_y) / (n * sum_xx - sum_x * sum_x)
+    
+    def trend(self) -> str:
+        """
+        Production trend over the window
+        
+        Returns:
+            'increasing', 'stable', 'decreasing', or 'stopped'
+        """
+        if self.size < 3:
+            return 'stable'
+        
+        if self.n_valid == 0 or self.n_moving == 0:
+            return 'stopped'
+        
+        slope = self.trend_slope()
+        if slope is None:
+            return 'stable'
+        
+        if slope > 0.01:
+            return 'increasing'
+        elif slope < -0.01:
+            return 'decreasing'
+        else:
+            return 'stable'
@@ -1,25 +1,249 @@
 """
 File monitor using watchdog for live updates
 """
+import heapq
+import json
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, Callable, Set
+from typing import Dict, Callable, List, Optional, Set, Tuple
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler, FileModifiedEvent
 import threading
 
 
+class CoalescingScheduler:
+    """
+    Run a callback once per burst of events for the same path
+    
+    The first event of a burst schedules the callback `delay` seconds later;
+    further events for that path only join the pending run. Events that arrive
+    while the callback is running schedule one more run afterwards, so the
+    final state of every file is always processed. Callbacks run on a bounded
+    worker pool, never concurrently for the same path.
+    """
+    
+    def __init__(self, callback: Callable[[Path], None], delay: float = 0.1,
+                 max_workers: int = 4):
+        """
+        Args:
+            callback: Function to call with the changed path
+            delay: Seconds between the first event of a burst and the callback
+            max_workers: Number of worker threads running callbacks
+        """
+        self.callback = callback
+        self.delay = delay
+        self.max_workers = max_workers
+        
+        self.condition = threading.Condition()
+        self.due: List[Tuple[float, str]] = []  # heap of (monotonic due time, path)
+        self.scheduled: Set[str] = set()
+        self.running: Set[str] = set()
+        self.rerun: Set[str] = set()
+        
+        self.executor = None
+        self.dispatcher = None
+        self.stopped = True
+        
+        # Events received / merged into an already pending run (for instrumentation)
+        self.events_received = 0
+        self.events_coalesced = 0
+    
+    def start(self):
+        """Start the dispatcher thread and the worker pool"""
+        with self.condition:
+            if not self.stopped:
+                return
+            self.stopped = False
+        
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                           thread_name_prefix='file-event')
+        self.dispatcher = threading.Thread(target=self._dispatch, name='file-event-dispatcher',
+                                           daemon=True)
+        self.dispatcher.start()
+    
+    def stop(self):
+        """Stop dispatching; callbacks already running are waited for"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        
+        if self.dispatcher is not None:
+            self.dispatcher.join()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+    
+    def submit(self, path: str):
+        """Record an event for path (called on the observer thread, never blocks)"""
+        with self.condition:
+            self.events_received += 1
+            if path in self.scheduled or path in self.rerun:
+                self.events_coalesced += 1
+                return
+            if path in self.running:
+                self.rerun.add(path)
+                return
+            self._schedule(path)
+    
+    def _schedule(self, path: str):
+        self.scheduled.add(path)
+        heapq.heappush(self.due, (time.monotonic() + self.delay, path))
+        self.condition.notify()
+    
+    def _dispatch(self):
+        """Hand due paths to the worker pool"""
+        with self.condition:
+            while not self.stopped:
+                if not self.due:
+                    self.condition.wait()
+                    continue
+                
+                wait = self.due[0][0] - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+                
+                _, path = heapq.heappop(self.due)
+                self.scheduled.discard(path)
+                self.running.add(path)
+                self.executor.submit(self._run, path)
+    
+    def _run(self, path: str):
+        try:
+            self.callback(Path(path))
+        except Exception as e:
+            print(f"Error in callback for {path}: {e}")
+        finally:
+            with self.condition:
+                self.running.discard(path)
+                if path in self.rerun:
+                    self.rerun.discard(path)
+                    if not self.stopped:
+                        self._schedule(path)
+    
+    @property
+    def pending(self) -> int:
+        """Paths waiting for a callback run"""
+        with self.condition:
+            return len(self.scheduled) + len(self.rerun)
+
+
+# (size, mtime ns, inode) of a log file
+FileStat = Tuple[int, int, int]
+
+
+def scan_log_files(directory: Path) -> Dict[str, FileStat]:
+    """
+    Stat every .txt file below directory with os.scandir (no per-file Path objects)
+    
+    Returns:
+        Path string -> (size, mtime ns, inode); empty if the directory does not exist
+    """
+    files: Dict[str, FileStat] = {}
+    pending = [str(directory)]
+    
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.name.endswith('.txt'):
+                        stat = entry.stat()
+                        files[entry.path] = (stat.st_size, stat.st_mtime_ns, entry.inode())
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+    
+    return files
+
+
+class PollingNotifier:
+    """
+    Detect log file changes by diffing (size, mtime, inode) snapshots of the
+    current day's directory, for mounts where watchdog sees no events
+    (e.g. Windows Docker bind mounts)
+    """
+    
+    def __init__(self, log_dir: Path, on_change: Callable[[str], None],
+                 interval: float = 1.0,
+                 on_scan: Optional[Callable[[List[str]], None]] = None):
+        """
+        Args:
+            log_dir: Root log directory (logs/{date}/...)
+            on_change: Called with the path of every new or changed file
+            interval: Seconds between scans
+            on_scan: Called with all changed paths after each scan
+        """
+        self.log_dir = Path(log_dir)
+        self.on_change = on_change
+        self.interval = interval
+        self.on_scan = on_scan
+        self.day: Optional[str] = None
+        self.snapshot: Dict[str, FileStat] = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+    
+    def start(self):
+        """Start the polling thread"""
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._loop, name='file-poller', daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        """Stop the polling thread"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+    
+    def _loop(self):
+        while not self.stop_event.wait(self.interval if self.day else 0):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error polling {self.log_dir}: {e}")
+    
+    def poll(self, now: Optional[datetime] = None) -> List[str]:
+        """
+        Scan the current day's directory once and report changed files
+        The first scan only records the baseline; after a day rollover every
+        file of the new day counts as new
+        
+        Returns:
+            Paths of new or changed files
+        """
+        day = (now or datetime.now()).strftime('%Y-%m-%d')
+        current = scan_log_files(self.log_dir / day)
+        
+        if self.day is None:
+            changed = []
+        else:
+            previous = self.snapshot if day == self.day else {}
+            changed = [path for path, stat in current.items() if previous.get(path) != stat]
+        
+        self.day = day
+        self.snapshot = current
+        for path in changed:
+            self.on_change(path)
+        if self.on_scan is not None:
+            self.on_scan(changed)
+        return changed
+
+
 class LogFileHandler(FileSystemEventHandler):
     """Handle file system events for log files"""
     
-    def __init__(self, callback: Callable[[Path], None]):
+    def __init__(self, submit: Callable[[str], None]):
         """
         Args:
-            callback: Function to call when file is modified
+            submit: Called with the path of every changed log file
         """
-        self.callback = callback
-        self.last_modified: Dict[str, float] = {}
-        self.debounce_seconds = 1.0  # Prevent duplicate events
+        self.submit = submit
     
     def on_modified(self, event):
         """Called when a file is modified"""
@@ -30,49 +254,131 @@ class LogFileHandler(FileSystemEventHandler):
         if not event.src_path.endswith('.txt'):
             return
         
-        # Debounce - ignore if modified very recently
-        now = time.time()
-        last_time = self.last_modified.get(event.src_path, 0)
-        
-        if now - last_time < self.debounce_seconds:
-            return
-        
-        self.last_modified[event.src_path] = now
-        
-        # Call callback
-        try:
-            self.callback(Path(event.src_path))
-        except Exception as e:
-            print(f"Error in callback for {event.src_path}: {e}")
+        # Bursts coalesce into one deferred callback, nothing is dropped
+        self.submit(event.src_path)
+
+
+# Consecutive scans with changes watchdog did not report before a subtree is polled
+MISSED_SCANS_BEFORE_FALLBACK = 2
 
 
 class FileMonitor:
-    """Monitor log directory for changes"""
+    """
+    Monitor log directory for changes
+    
+    Modes:
+    - 'watchdog': native file system events only
+    - 'polling': PollingNotifier only
+    - 'auto': native events, with a PollingNotifier checking that files which
+      grow also produce events; a production line directory where they do not
+      is switched to polling
+    """
     
-    def __init__(self, log_dir: Path, callback: Callable[[Path], None]):
+    def __init__(self, log_dir: Path, callback: Callable[[Path], None],
+                 delay: float = 0.1, max_workers: int = 4,
+                 mode: str = 'watchdog', poll_interval: float = 1.0):
         """
         Args:
             log_dir: Directory to monitor
             callback: Function to call when file changes
+            delay: Seconds a burst of events for one file is coalesced
+            max_workers: Number of threads running callbacks
+            mode: 'watchdog', 'polling' or 'auto'
+            poll_interval: Seconds between scans in polling / auto mode
         """
-        self.log_dir = log_dir
+        self.log_dir = Path(log_dir)
         self.callback = callback
+        self.mode = mode
+        self.scheduler = CoalescingScheduler(callback, delay, max_workers)
         self.observer = None
         self.is_running = False
+        
+        self.poller = None
+        if mode == 'polling':
+            self.poller = PollingNotifier(log_dir, self.scheduler.submit, poll_interval)
+        elif mode == 'auto':
+            self.poller = PollingNotifier(log_dir, self._on_polled_change, poll_interval,
+                                          on_scan=self._end_scan)
+        
+        # Auto mode bookkeeping (path strings)
+        self.lock = threading.Lock()
+        self.native_events: Set[str] = set()    # paths with a native event since the last scan
+        self.suspects: Set[str] = set()         # changed in the last scan, no native event yet
+        self.new_suspects: Set[str] = set()     # same, for the scan in progress
+        self.missed: Dict[str, int] = {}        # subtree -> consecutive scans with missed events
+        self.polled_subtrees: Set[str] = set()  # subtrees switched to polling
+    
+    def subtree(self, path: str) -> str:
+        """Production line directory of a log file (logs/{date}/{line})"""
+        parts = Path(path).relative_to(self.log_dir).parts
+        return str(Path(self.log_dir, *parts[:2]))
+    
+    def _on_native_event(self, path: str):
+        """Watchdog event (observer thread)"""
+        with self.lock:
+            self.native_events.add(path)
+        self.scheduler.submit(path)
+    
+    def _on_polled_change(self, path: str):
+        """Change found by a scan in auto mode (poller thread)"""
+        with self.lock:
+            polled = self.subtree(path) in self.polled_subtrees
+            if not polled and path not in self.native_events:
+                # Native events can trail the scan; judged at the end of the next scan
+                self.new_suspects.add(path)
+        
+        if polled:
+            self.scheduler.submit(path)
+    
+    def _end_scan(self, changed: List[str]):
+        """After a scan in auto mode: count changes watchdog never reported, fall back per subtree"""
+        with self.lock:
+            missed_paths = {p for p in self.suspects if p not in self.native_events}
+            missed_subtrees = {self.subtree(p) for p in missed_paths}
+            # Any change that did get a native event shows watchdog works for that subtree
+            reported = {p for p in changed if p not in self.new_suspects} | (self.suspects - missed_paths)
+            for subtree in {self.subtree(p) for p in reported} - missed_subtrees:
+                self.missed.pop(subtree, None)
+            
+            switched = set()
+            for subtree in missed_subtrees - self.polled_subtrees:
+                self.missed[subtree] = self.missed.get(subtree, 0) + 1
+                if self.missed[subtree] >= MISSED_SCANS_BEFORE_FALLBACK:
+                    switched.add(subtree)
+                    del self.missed[subtree]
+            self.polled_subtrees |= switched
+            
+            waiting = {p for p in self.new_suspects if p not in self.native_events}
+            # Missed changes are processed now; so are waiting files of switched subtrees
+            late = missed_paths | {p for p in waiting if self.subtree(p) in switched}
+            self.suspects = {p for p in waiting if self.subtree(p) not in switched}
+            self.new_suspects = set()
+            self.native_events.clear()
+        
+        for subtree in switched:
+            print(f"⚠️  No file system events for {subtree} while its files grow, switching it to polling")
+        for path in late:
+            self.scheduler.submit(path)
     
     def start(self):
         """Start monitoring"""
         if self.is_running:
             return
         
-        print(f"👀 Starting file monitor on {self.log_dir}")
+        print(f"👀 Starting file monitor on {self.log_dir} ({self.mode})")
         
-        event_handler = LogFileHandler(self.callback)
-        self.observer = Observer()
+        self.scheduler.start()
         
-        # Watch directory recursively
-        self.observer.schedule(event_handler, str(self.log_dir), recursive=True)
-        self.observer.start()
+        if self.mode != 'polling':
+            event_handler = LogFileHandler(self._on_native_event)
+            self.observer = Observer()
+            
+            # Watch directory recursively
+            self.observer.schedule(event_handler, str(self.log_dir), recursive=True)
+            self.observer.start()
+        
+        if self.poller is not None:
+            self.poller.start()
         
         self.is_running = True
         print("✅ File monitor started")
@@ -87,23 +393,61 @@ class FileMonitor:
         if self.observer:
             self.observer.stop()
             self.observer.join()
+        if self.poller is not None:
+            self.poller.stop()
+        self.scheduler.stop()
         
         self.is_running = False
         print("✅ File monitor stopped")
 
 
+@dataclass
+class TailPosition:
+    """Read position in one file"""
+    path: str
+    offset: int = 0
+    # Epoch seconds of the last read (positions of old files are dropped)
+    seen: float = 0.0
+
+
 class TailReader:
-    """Read only new lines from files (tail -f style)"""
+    """
+    Read only new lines from files (tail -f style)
     
-    def __init__(self):
-        """Initialize tail reader"""
-        # Track file positions
-        self.file_positions: Dict[str, int] = {}
+    Files are read in binary mode and a trailing line without newline is held
+    back until it is complete. Positions are keyed by (device, inode), so a
+    rotated or recreated file starts from byte 0; a file truncated or rewritten
+    below the stored offset is detected by the byte before the offset no longer
+    being a newline. With a checkpoint path, positions are written to disk at
+    most every checkpoint_interval seconds and on close(), and a restart
+    resumes from them instead of re-reading every file.
+    """
+    
+    # Positions of files not read for this long are dropped (previous days)
+    MAX_IDLE_SECONDS = 2 * 86400
+    
+    def __init__(self, checkpoint_path: Optional[Path] = None, checkpoint_interval: float = 5.0):
+        """
+        Args:
+            checkpoint_path: JSON file holding the positions (None = memory only)
+            checkpoint_interval: Minimum seconds between two checkpoint writes
+        """
+        self.positions: Dict[Tuple[int, int], TailPosition] = {}
         self.lock = threading.Lock()
+        
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        # Serializes snapshot + write, so an older snapshot never replaces a newer one
+        self.checkpoint_lock = threading.Lock()
+        self.dirty = False
+        self.last_checkpoint = time.monotonic()
+        
+        if checkpoint_path is not None:
+            self.load()
     
     def get_new_lines(self, file_path: Path) -> list[str]:
         """
-        Get only new lines since last read
+        Get only new complete lines since last read
         
         Args:
             file_path: Path to file
@@ -111,45 +455,119 @@ class TailReader:
         Returns:
             List of new lines
         """
-        file_key = str(file_path)
         new_lines = []
         
         try:
             with self.lock:
-                # Get current file size
-                if not file_path.exists():
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
                     return []
                 
-                file_size = file_path.stat().st_size
+                key = (stat.st_dev, stat.st_ino)
+                position = self.positions.get(key)
+                if position is None:
+                    position = self.positions[key] = TailPosition(str(file_path))
+                # A renamed file keeps its inode and its position
+                position.path = str(file_path)
                 
-                # Get last known position
-                last_pos = self.file_positions.get(file_key, 0)
+                with open(file_path, 'rb') as f:
+                    offset = self._resume_offset(f, position.offset, stat.st_size)
+                    f.seek(offset)
+                    data = f.read()
                 
-                # If file was truncated/reset, start from beginning
-                if file_size < last_pos:
-                    last_pos = 0
+                # Hold back a partially written last line until it is complete
+                last_newline = data.rfind(b'\n')
+                if last_newline != -1:
+                    data = data[:last_newline + 1]
+                    new_lines = data.decode('utf-8', errors='replace').splitlines(keepends=True)
+                    offset += len(data)
                 
-                # Read from last position
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    f.seek(last_pos)
-                    new_lines = f.readlines()
-                    
-                    # Update position
-                    self.file_positions[file_key] = f.tell()
+                if offset != position.offset:
+                    position.offset = offset
+                    self.dirty = True
+                position.seen = time.time()
         
         except Exception as e:
             print(f"Error reading {file_path}: {e}")
         
+        if self.dirty and time.monotonic() - self.last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+        
         return new_lines
     
+    @staticmethod
+    def _resume_offset(f, offset: int, file_size: int) -> int:
+        """Stored offset, or 0 if the file was truncated or rewritten below it"""
+        if offset == 0 or file_size < offset:
+            return 0
+        # Offsets always follow a newline
+        f.seek(offset - 1)
+        return offset if f.read(1) == b'\n' else 0
+    
+    def load(self):
+        """Resume from the checkpoint: positions of files that still have the same inode"""
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring tail checkpoint {self.checkpoint_path}: {e}")
+            return
+        
+        for item in saved.get('files', []):
+            try:
+                stat = os.stat(item['path'])
+            except OSError:
+                continue
+            key = (stat.st_dev, stat.st_ino)
+            if key == (item['device'], item['inode']):
+                self.positions[key] = TailPosition(item['path'], item['offset'], item['seen'])
+        
+        print(f"📌 Resuming {len(self.positions)} files from {self.checkpoint_path}")
+    
+    def checkpoint(self):
+        """Write every position to the checkpoint file (atomic replace)"""
+        if self.checkpoint_path is None:
+            return
+        
+        with self.checkpoint_lock:
+            with self.lock:
+                cutoff = time.time() - self.MAX_IDLE_SECONDS
+                for key in [k for k, p in self.positions.items() if p.seen < cutoff]:
+                    del self.positions[key]
+                files = [{'device': device, 'inode': inode, 'path': p.path,
+                          'offset': p.offset, 'seen': p.seen}
+                         for (device, inode), p in self.positions.items()]
+                self.dirty = False
+                self.last_checkpoint = time.monotonic()
+            
+            temp_path = self.checkpoint_path.with_name(self.checkpoint_path.name + '.tmp')
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'version': 1, 'files': files}, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.checkpoint_path)
+            except OSError as e:
+                print(f"❌ Error writing tail checkpoint {self.checkpoint_path}: {e}")
+                self.dirty = True
+    
+    def close(self):
+        """Checkpoint positions not written yet (shutdown)"""
+        if self.dirty:
+            self.checkpoint()
+    
     def reset_position(self, file_path: Path):
         """Reset position for a file (read from beginning next time)"""
-        file_key = str(file_path)
         with self.lock:
-            if file_key in self.file_positions:
-                del self.file_positions[file_key]
+            for key in [k for k, p in self.positions.items() if p.path == str(file_path)]:
+                del self.positions[key]
+                self.dirty = True
     
     def reset_all(self):
         """Reset all positions"""
         with self.lock:
-            self.file_positions.clear()
+            self.positions.clear()
+            self.dirty = True
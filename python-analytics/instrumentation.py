@@ -0,0 +1,254 @@
+"""
+Self-instrumentation of the analytics loop
+Stage timing histograms, tick lag / overruns, I/O and watcher counters,
+exposed in Prometheus text format over HTTP and as a Redis hash
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+
+# Pipeline stages timed every tick
+STAGES = ('discover', 'parse', 'compute', 'serialize', 'publish')
+
+# Histogram bucket upper bounds (seconds)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIX = 'analytics'
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics)"""
+    
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+    
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(le label, cumulative count) pairs including +Inf"""
+        total = 0
+        result = []
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            result.append((str(bound), total))
+        return result
+
+
+class Instrumentation:
+    """Counters, gauges and per-stage histograms of one service instance"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stage_histograms = {stage: Histogram() for stage in STAGES}
+        self.tick_histogram = Histogram()
+        # Stage time accumulated during the current tick (parse/compute run once per file)
+        self.pending: Dict[str, float] = {}
+        
+        self.counters: Dict[str, float] = {
+            'ticks_total': 0,
+            'tick_overruns_total': 0,
+            'files_read_total': 0,
+            'bytes_read_total': 0,
+        }
+        self.gauges: Dict[str, float] = {
+            'tick_lag_seconds': 0.0,
+            'last_tick_seconds': 0.0,
+            'files_read_last_tick': 0,
+            'bytes_read_last_tick': 0,
+        }
+        # name -> (type, help, callable) read at render time (e.g. queue depth)
+        self.collectors: Dict[str, Tuple[str, str, Callable[[], float]]] = {}
+        self.started = time.time()
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block as part of a stage of the current tick"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+    
+    def add_time(self, name: str, seconds: float):
+        with self.lock:
+            self.pending[name] = self.pending.get(name, 0.0) + seconds
+    
+    def count_io(self, files: int, bytes_read: int):
+        """Files / bytes read during the current tick"""
+        with self.lock:
+            self.counters['files_read_total'] += files
+            self.counters['bytes_read_total'] += bytes_read
+            self.gauges['files_read_last_tick'] = files
+            self.gauges['bytes_read_last_tick'] = bytes_read
+    
+    def register(self, name: str, kind: str, help_text: str, read: Callable[[], float]):
+        """
+        Add a value owned by another component
+        
+        Args:
+            name: Metric name without prefix
+            kind: 'counter' or 'gauge'
+            help_text: HELP line
+            read: Returns the current value
+        """
+        self.collectors[name] = (kind, help_text, read)
+    
+    def end_tick(self, duration: float, interval: float, lag: float = 0.0):
+        """
+        Close a tick: stage times accumulated since the last tick go into the histograms
+        
+        Args:
+            duration: Wall time of the tick (seconds)
+            interval: Tick budget; a longer tick counts as an overrun
+            lag: How late the tick started compared to its schedule
+        """
+        with self.lock:
+            for stage, seconds in self.pending.items():
+                self.stage_histograms.setdefault(stage, Histogram()).observe(seconds)
+            self.pending = {}
+            
+            self.tick_histogram.observe(duration)
+            self.counters['ticks_total'] += 1
+            if interval and duration > interval:
+                self.counters['tick_overruns_total'] += 1
+            self.gauges['tick_lag_seconds'] = lag
+            self.gauges['last_tick_seconds'] = duration
+    
+    def _collected(self) -> List[Tuple[str, str, str, float]]:
+        """(name, type, help, value) of registered collectors; failing ones are skipped"""
+        values = []
+        for name, (kind, help_text, read) in list(self.collectors.items()):
+            try:
+                values.append((name, kind, help_text, float(read())))
+            except Exception:
+                continue
+        return values
+    
+    def render_prometheus(self) -> str:
+        """All metrics in Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            lines.append(f'# HELP {PREFIX}_stage_seconds Time spent per stage in one tick')
+            lines.append(f'# TYPE {PREFIX}_stage_seconds histogram')
+            for stage, histogram in self.stage_histograms.items():
+                for le, count in histogram.cumulative():
+                    lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {count}')
+                lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+            
+            lines.append(f'# HELP {PREFIX}_tick_seconds Wall time of one calculation tick')
+            lines.append(f'# TYPE {PREFIX}_tick_seconds histogram')
+            for le, count in self.tick_histogram.cumulative():
+                lines.append(f'{PREFIX}_tick_seconds_bucket{{le="{le}"}} {count}')
+            lines.append(f'{PREFIX}_tick_seconds_sum {self.tick_histogram.sum:.6f}')
+            lines.append(f'{PREFIX}_tick_seconds_count {self.tick_histogram.count}')
+            
+            for name, value in self.counters.items():
+                lines.append(f'# TYPE {PREFIX}_{name} counter')
+                lines.append(f'{PREFIX}_{name} {value:g}')
+            for name, value in self.gauges.items():
+                lines.append(f'# TYPE {PREFIX}_{name} gauge')
+                lines.append(f'{PREFIX}_{name} {value:g}')
+        
+        for name, kind, help_text, value in self._collected():
+            lines.append(f'# HELP {PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {PREFIX}_{name} {kind}')
+            lines.append(f'{PREFIX}_{name} {value:g}')
+        
+        return '\n'.join(lines) + '\n'
+    
+    def snapshot(self) -> Dict[str, str]:
+        """Flat field -> value mapping for the Redis hash"""
+        with self.lock:
+            fields = {name: f'{value:g}' for name, value in {**self.counters, **self.gauges}.items()}
+            for stage, histogram in self.stage_histograms.items():
+                fields[f'{stage}_seconds_sum'] = f'{histogram.sum:.6f}'
+                fields[f'{stage}_seconds_count'] = str(histogram.count)
+                if histogram.count:
+                    fields[f'{stage}_seconds_avg'] = f'{histogram.sum / histogram.count:.6f}'
+        
+        for name, _, _, value in self._collected():
+            fields[name] = f'{value:g}'
+        fields['uptime_seconds'] = f'{time.time() - self.started:.0f}'
+        return fields
+
+
+def start_metrics_server(instrumentation: Instrumentation, host: str, port: int,
+                         routes: Optional[Dict[str, Callable[[Dict[str, str]], dict]]] = None
+                         ) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve GET /metrics in Prometheus text format on a daemon thread
+    
+    Args:
+        instrumentation: Metrics to serve
+        host: Bind address
+        port: Bind port
+        routes: Extra JSON endpoints: path -> handler(query parameters) returning
+                the response body (ValueError / KeyError = 400 Bad Request,
+                any other error = 500)
+    
+    Returns:
+        The server (call shutdown() to stop), or None if the port cannot be bound
+    """
+    routes = routes or {}
+    
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == '/metrics':
+                self._send(200, 'text/plain; version=0.0.4; charset=utf-8',
+                           instrumentation.render_prometheus())
+                return
+            
+            handler = routes.get(url.path)
+            if handler is None:
+                self.send_error(404)
+                return
+            try:
+                body = handler(dict(parse_qsl(url.query)))
+            except (ValueError, KeyError) as e:
+                self.send_error(400, str(e))
+                return
+            except Exception as e:
+                # e.g. the history backend is unreachable: answer rather than drop the connection
+                self.send_error(500, str(e))
+                return
+            self._send(200, 'application/json', json.dumps(body))
+        
+        def _send(self, status: int, content_type: str, text: str):
+            body = text.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass  # Scrapes would flood stdout
+    
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        print(f"⚠️  Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    print(f"📈 Metrics endpoint: http://{host}:{port}/metrics")
+    return server
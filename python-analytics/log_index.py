@@ -0,0 +1,283 @@
+"""
+Persistent index of the log directory tree
+date → line → brick type → position → device → ordered file list
+"""
+import bisect
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from log_reader import MappedLogFile
+
+
+# Key used for the old layout without a brick-type level
+UNKNOWN_BRICK_TYPE = 'unknown'
+
+
+@dataclass
+class IndexedFile:
+    """One log file in the index"""
+    path: Path
+    size: int
+    mtime_ns: int
+    first_ts: Optional[int] = None  # epoch ms of first record
+    last_ts: Optional[int] = None   # epoch ms of last record
+    
+    def overlaps(self, start_ms: int, end_ms: int) -> bool:
+        """Whether the file may hold records in [start_ms, end_ms]"""
+        if self.first_ts is None or self.last_ts is None:
+            return False
+        return self.first_ts <= end_ms and self.last_ts >= start_ms
+
+
+@dataclass
+class _DirState:
+    """Cached listing of one directory (reused while its mtime is unchanged)"""
+    mtime_ns: int
+    subdirs: List[str] = field(default_factory=list)
+    files: List[str] = field(default_factory=list)
+
+
+def device_id_from_name(filename: str) -> str:
+    """
+    Device ID from a log file name
+    - sau-me-01_20251118T142030.txt → SAU-ME-01
+    - sau-me-01.txt → SAU-ME-01
+    """
+    stem = filename[:-4] if filename.endswith('.txt') else filename
+    return stem.split('_')[0].upper()
+
+
+class LogIndex:
+    """Index of log files, kept up to date by scandir diffs and watcher events"""
+    
+    def __init__(self, log_dir: Path):
+        """
+        Args:
+            log_dir: Root log directory (logs/{date}/...)
+        """
+        # Absolute paths, so watcher events and scans produce the same keys
+        self.log_dir = Path(os.path.abspath(log_dir))
+        # date → line → brick type → position → device → files sorted by name
+        self.tree: Dict[str, Dict[str, Dict[str, Dict[str, Dict[str, List[IndexedFile]]]]]] = {}
+        self._files: Dict[str, IndexedFile] = {}
+        self._dirs: Dict[str, _DirState] = {}
+        self.lock = threading.RLock()
+    
+    def refresh(self, date_str: str):
+        """
+        Bring the index for one date up to date
+        
+        Directories whose mtime is unchanged are not listed again; only the
+        newest file of each device is re-stat'ed (older rotated files are final).
+        
+        Args:
+            date_str: Date folder name (YYYY-MM-DD)
+        """
+        date_dir = self.log_dir / date_str
+        
+        with self.lock:
+            if not date_dir.is_dir():
+                self._drop_date(date_str)
+                return
+            
+            seen = set()
+            for file_path in self._walk(str(date_dir)):
+                seen.add(file_path)
+                if file_path not in self._files:
+                    self.update_file(Path(file_path))
+            
+            # Files that disappeared since the last scan
+            prefix = str(date_dir) + os.sep
+            for file_key in [k for k in self._files if k.startswith(prefix) and k not in seen]:
+                self.remove_file(Path(file_key))
+            
+            # Appends do not change directory mtimes, so stat the active files
+            for files in self._iter_device_lists(date_str):
+                if files:
+                    self.update_file(files[-1].path)
+    
+    def _walk(self, directory: str) -> Iterator[str]:
+        """Yield .txt paths below directory, re-listing only changed directories"""
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            self._dirs.pop(directory, None)
+            return
+        
+        state = self._dirs.get(directory)
+        if state is None or state.mtime_ns != mtime_ns:
+            state = _DirState(mtime_ns=mtime_ns)
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        state.subdirs.append(entry.name)
+                    elif entry.name.endswith('.txt'):
+                        state.files.append(entry.name)
+            self._dirs[directory] = state
+        
+        for name in state.files:
+            yield os.path.join(directory, name)
+        for name in state.subdirs:
+            yield from self._walk(os.path.join(directory, name))
+    
+    def _locate(self, file_path: Path) -> Optional[Tuple[str, str, str, str, str]]:
+        """(date, line, brick type, position, device) for a path below log_dir"""
+        try:
+            parts = file_path.relative_to(self.log_dir).parts
+        except ValueError:
+            return None
+        
+        device_id = device_id_from_name(parts[-1])
+        if len(parts) == 5:  # {date}/{line}/{brick-type}/{position}/{file}
+            return parts[0], parts[1], parts[2], parts[3], device_id
+        if len(parts) == 4:  # {date}/{line}/{position}/{file}
+            return parts[0], parts[1], UNKNOWN_BRICK_TYPE, parts[2], device_id
+        return None
+    
+    def update_file(self, file_path: Path) -> Optional[IndexedFile]:
+        """
+        Add or refresh one file (called from refresh and watcher events)
+        
+        Args:
+            file_path: Path to log file
+        
+        Returns:
+            IndexedFile or None if the path is not a device log
+        """
+        file_path = Path(os.path.abspath(file_path))
+        location = self._locate(file_path)
+        if location is None:
+            return None
+        
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            self.remove_file(file_path)
+            return None
+        
+        with self.lock:
+            file_key = str(file_path)
+            entry = self._files.get(file_key)
+            
+            if entry is None:
+                entry = IndexedFile(path=file_path, size=-1, mtime_ns=0)
+                self._files[file_key] = entry
+                date_str, line, brick_type, position, device_id = location
+                files = (self.tree.setdefault(date_str, {})
+                         .setdefault(line, {})
+                         .setdefault(brick_type, {})
+                         .setdefault(position, {})
+                         .setdefault(device_id, []))
+                names = [f.path.name for f in files]
+                files.insert(bisect.bisect(names, file_path.name), entry)
+            
+            if stat.st_size != entry.size or stat.st_mtime_ns != entry.mtime_ns:
+                self._read_bounds(entry, stat.st_size < entry.size)
+                entry.size = stat.st_size
+                entry.mtime_ns = stat.st_mtime_ns
+            
+            return entry
+    
+    def _read_bounds(self, entry: IndexedFile, truncated: bool):
+        """Read first/last timestamps (first only once unless the file shrank)"""
+        try:
+            with MappedLogFile(entry.path) as log_file:
+                if entry.first_ts is None or truncated:
+                    first = log_file.first_record()
+                    entry.first_ts = first[0] if first else None
+                last = log_file.last_record()
+                entry.last_ts = last[0] if last else None
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error indexing {entry.path}: {e}")
+    
+    def remove_file(self, file_path: Path):
+        """Drop one file from the index"""
+        file_path = Path(os.path.abspath(file_path))
+        with self.lock:
+            entry = self._files.pop(str(file_path), None)
+            location = self._locate(file_path)
+            if entry is None or location is None:
+                return
+            
+            date_str, line, brick_type, position, device_id = location
+            devices = (self.tree.get(date_str, {}).get(line, {})
+                       .get(brick_type, {}).get(position, {}))
+            files = devices.get(device_id, [])
+            if entry in files:
+                files.remove(entry)
+            if not files:
+                devices.pop(device_id, None)
+    
+    def _drop_date(self, date_str: str):
+        """Forget everything below one date"""
+        self.tree.pop(date_str, None)
+        prefix = str(self.log_dir / date_str)
+        for file_key in [k for k in self._files if k.startswith(prefix + os.sep)]:
+            del self._files[file_key]
+        for dir_key in [k for k in self._dirs if k == prefix or k.startswith(prefix + os.sep)]:
+            del self._dirs[dir_key]
+    
+    def prune(self, keep_dates: List[str]):
+        """Forget dates that are no longer needed (e.g. after day rollover)"""
+        with self.lock:
+            for date_str in [d for d in self.tree if d not in keep_dates]:
+                self._drop_date(date_str)
+    
+    def _iter_device_lists(self, date_str: str) -> Iterator[List[IndexedFile]]:
+        for bricks in self.tree.get(date_str, {}).values():
+            for positions in bricks.values():
+                for devices in positions.values():
+                    yield from devices.values()
+    
+    def latest_files(self, date_str: str) -> List[Path]:
+        """
+        Latest file (by name, i.e. filename timestamp) of every device on a date
+        
+        Args:
+            date_str: Date folder name (YYYY-MM-DD)
+        
+        Returns:
+            List of Path objects
+        """
+        with self.lock:
+            return [files[-1].path for files in self._iter_device_lists(date_str) if files]
+    
+    def device_files(self, date_str: str, line: str, brick_type: str,
+                     position: str, device_id: str) -> List[IndexedFile]:
+        """Ordered file list of one device"""
+        with self.lock:
+            return list(self.tree.get(date_str, {}).get(line, {}).get(brick_type, {})
+                        .get(position, {}).get(device_id.upper(), []))
+    
+    def files_between(self, start: datetime, end: datetime) -> List[IndexedFile]:
+        """
+        Files that may contain records in [start, end]
+        Files outside the window are skipped without being opened
+        
+        Args:
+            start: Window start (timezone-aware)
+            end: Window end (timezone-aware)
+        
+        Returns:
+            List of IndexedFile objects
+        """
+        start_ms = int(start.timestamp() * 1000)
+        end_ms = int(end.timestamp() * 1000)
+        
+        # Date folders are local dates, records are UTC: widen by one day
+        day = start.date() - timedelta(days=1)
+        result = []
+        while day <= end.date() + timedelta(days=1):
+            date_str = day.strftime('%Y-%m-%d')
+            self.refresh(date_str)
+            with self.lock:
+                for files in self._iter_device_lists(date_str):
+                    result.extend(f for f in files if f.overlaps(start_ms, end_ms))
+            day += timedelta(days=1)
+        
+        return result
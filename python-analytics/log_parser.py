@@ -2,10 +2,16 @@
 Parse device log files
 """
 import re
+import sys
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
-from models import LogEntry
+from typing import List, Optional, Tuple
+import numpy as np
+from models import LogEntry, LogColumns
+from columnar_parser import parse_buffer_arrays
+from log_reader import MappedLogFile
+from log_index import LogIndex
+from parse_cache import ParseCache
 
 
 class LogParser:
@@ -13,8 +19,55 @@ class LogParser:
     
     LOG_PATTERN = re.compile(r'\[(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}Z)\] Count: (\d+)')
     
-    def __init__(self, log_dir: Path):
+    def __init__(self, log_dir: Path, parse_cache: Optional[ParseCache] = None):
+        """
+        Args:
+            log_dir: Root log directory
+            parse_cache: Optional binary cache of parsed columns
+        """
         self.log_dir = log_dir
+        self.index = LogIndex(log_dir)
+        self.parse_cache = parse_cache
+    
+    @staticmethod
+    def extract_metadata(file_path: Path) -> Optional[Tuple[str, str, str, str]]:
+        """
+        Extract metadata from a log file path
+        
+        Args:
+            file_path: Path to log file
+            
+        Returns:
+            Tuple of (production_line, brick_type, position, device_id) or None
+        """
+        # New structure: logs/{date}/{production-line}/{brick-type}/{device-position}/{deviceId}_timestamp.txt
+        # Old structure: logs/{date}/{production-line}/{device-position}/{deviceId}_timestamp.txt
+        parts = file_path.parts
+        
+        # Detect structure by number of parts
+        if len(parts) >= 6:  # New structure with brick-type
+            production_line = parts[-4]
+            brick_type = parts[-3]  # New level
+            position = parts[-2]
+        elif len(parts) >= 5:  # Old structure without brick-type
+            production_line = parts[-3]
+            brick_type = 'unknown'
+            position = parts[-2]
+        else:
+            return None
+        
+        # Extract device ID from filename (handle both formats)
+        # - sau-me-01_20251118T142030.txt → SAU-ME-01
+        # - sau-me-01.txt → SAU-ME-01
+        filename = file_path.stem
+        if '_' in filename:
+            device_id = filename.split('_')[0].upper()
+        else:
+            device_id = filename.upper()
+        
+        # Interned: every entry of every file shares one copy of each string
+        return (sys.intern(production_line), sys.intern(brick_type),
+                sys.intern(position), sys.intern(device_id))
     
     def parse_lines(self, lines: List[str], file_path: Path) -> List[LogEntry]:
         """
@@ -30,33 +83,11 @@ class LogParser:
         entries = []
         
         try:
-            # Extract metadata from path
-            # New structure: logs/{date}/{production-line}/{brick-type}/{device-position}/{deviceId}_timestamp.txt
-            # Old structure: logs/{date}/{production-line}/{device-position}/{deviceId}_timestamp.txt
-            parts = file_path.parts
-            
-            # Detect structure by number of parts
-            if len(parts) >= 6:  # New structure with brick-type
-                date_str = parts[-5]
-                production_line = parts[-4]
-                brick_type = parts[-3]  # New level
-                position = parts[-2]
-            elif len(parts) >= 5:  # Old structure without brick-type
-                date_str = parts[-4]
-                production_line = parts[-3]
-                brick_type = 'unknown'
-                position = parts[-2]
-            else:
+            metadata = self.extract_metadata(file_path)
+            if metadata is None:
                 return entries
             
-            # Extract device ID from filename (handle both formats)
-            # - sau-me-01_20251118T142030.txt → SAU-ME-01
-            # - sau-me-01.txt → SAU-ME-01
-            filename = file_path.stem
-            if '_' in filename:
-                device_id = filename.split('_')[0].upper()
-            else:
-                device_id = filename.upper()
+            production_line, _brick_type, position, device_id = metadata
             
             # Parse each line
             for line in lines:
@@ -89,16 +120,97 @@ class LogParser:
         Returns:
             List of LogEntry objects
         """
+        columns = self.parse_log_file_columnar(file_path)
+        return columns.to_entries() if columns is not None else []
+    
+    def parse_buffer(self, data, file_path: Path) -> Optional[LogColumns]:
+        """
+        Parse a whole log buffer in one pass into columnar arrays
+        
+        Args:
+            data: File contents (bytes, bytearray, mmap or memoryview)
+            file_path: Path to source file (for metadata)
+            
+        Returns:
+            LogColumns object or None if the path has no metadata
+        """
+        # No per-line strings, datetimes or LogEntry objects
+        timestamps, counts = parse_buffer_arrays(data)
+        
+        return self.build_columns(file_path, timestamps, counts)
+    
+    def build_columns(self, file_path: Path, timestamps: np.ndarray,
+                      counts: np.ndarray) -> Optional[LogColumns]:
+        """
+        Wrap parsed arrays with the metadata of their source file
+        
+        Args:
+            file_path: Path to source file (for metadata)
+            timestamps: int64 epoch-ms timestamps
+            counts: int64 counts
+            
+        Returns:
+            LogColumns object or None if the path has no metadata
+        """
+        metadata = self.extract_metadata(file_path)
+        if metadata is None:
+            return None
+        
+        production_line, brick_type, position, device_id = metadata
+        
+        return LogColumns(
+            device_id=device_id,
+            production_line=production_line,
+            brick_type=brick_type,
+            position=position,
+            timestamps=timestamps,
+            counts=counts,
+        )
+    
+    def parse_log_file_columnar(self, file_path: Path) -> Optional[LogColumns]:
+        """
+        Parse a single log file into columnar arrays
+        
+        Args:
+            file_path: Path to log file
+            
+        Returns:
+            LogColumns object or None on error
+        """
         try:
-            # Read all lines
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            # Cached columns: only bytes appended since the last parse are read
+            if self.parse_cache is not None:
+                timestamps, counts = self.parse_cache.load(file_path)
+                return self.build_columns(file_path, timestamps, counts)
             
-            return self.parse_lines(lines, file_path)
+            # Scan the mapped file in place (no read/decode copy)
+            with MappedLogFile(file_path) as log_file:
+                return self.parse_buffer(log_file.buffer, file_path)
         
         except Exception as e:
             print(f"Error parsing {file_path}: {e}")
-            return []
+            return None
+    
+    def parse_log_tail(self, file_path: Path, n: int) -> Optional[LogColumns]:
+        """
+        Parse only the last n lines of a log file
+        
+        Args:
+            file_path: Path to log file
+            n: Number of lines
+            
+        Returns:
+            LogColumns object or None on error
+        """
+        try:
+            with MappedLogFile(file_path) as log_file:
+                timestamps, counts = log_file.last_records(n)
+            
+            return self.build_columns(file_path, timestamps, counts)
+        
+        except Exception as e:
+            print(f"Error parsing {file_path}: {e}")
+            return None
     
     def get_latest_entry(self, file_path: Path) -> Optional[LogEntry]:
         """
@@ -110,8 +222,21 @@ class LogParser:
         Returns:
             Latest LogEntry or None
         """
-        entries = self.parse_log_file(file_path)
-        return entries[-1] if entries else None
+        try:
+            # Scan backwards from EOF, only the last matching line is parsed
+            with MappedLogFile(file_path) as log_file:
+                record = log_file.last_record()
+        
+        except Exception as e:
+            print(f"Error parsing {file_path}: {e}")
+            return None
+        
+        if record is None:
+            return None
+        
+        timestamp, count = record
+        columns = self.build_columns(file_path, np.array([timestamp]), np.array([count]))
+        return columns.to_entries()[0] if columns is not None else None
     
     def get_entries_since(self, file_path: Path, since: datetime) -> List[LogEntry]:
         """
@@ -124,13 +249,19 @@ class LogParser:
         Returns:
             List of LogEntry objects after the timestamp
         """
-        entries = self.parse_log_file(file_path)
-        return [e for e in entries if e.timestamp >= since]
+        columns = self.parse_log_file_columnar(file_path)
+        if columns is None:
+            return []
+        
+        # Filtered on the arrays: only the matching rows become LogEntry objects
+        since_ms = int(since.timestamp() * 1000)
+        return columns.select(columns.timestamps >= since_ms).to_entries()
     
     def find_device_logs(self, date: datetime) -> List[Path]:
         """
         Find all device log files for a specific date
         Returns only the latest file per device (sorted by filename timestamp)
+        Devices are keyed by line/brick type/position/device ID
         
         Args:
             date: Date to search for
@@ -139,43 +270,26 @@ class LogParser:
             List of Path objects (latest file per device)
         """
         date_str = date.strftime('%Y-%m-%d')
-        date_dir = self.log_dir / date_str
-        
-        if not date_dir.exists():
-            return []
         
-        # Find all .txt files recursively
-        all_files = list(date_dir.rglob('*.txt'))
+        # Index only re-lists directories that changed since the last call
+        self.index.refresh(date_str)
         
-        # Group by device (files have pattern: deviceid_timestamp.txt or deviceid.txt)
-        device_files: dict = {}
+        return self.index.latest_files(date_str)
+    
+    def find_logs_between(self, start: datetime, end: datetime) -> List[Path]:
+        """
+        Find log files that may contain entries in a time window
+        Files whose first/last timestamps fall outside the window are skipped
+        without being opened
         
-        for file_path in all_files:
-            # Extract device ID from filename
-            filename = file_path.stem  # Without .txt extension
-            
-            # Handle both formats:
-            # - sau-me-01_20251118T142030.txt (with timestamp)
-            # - sau-me-01.txt (old format without timestamp)
-            if '_' in filename:
-                device_id = filename.split('_')[0].upper()
-            else:
-                device_id = filename.upper()
-            
-            # Keep only the latest file per device (sorted by filename, newest last)
-            if device_id not in device_files:
-                device_files[device_id] = []
+        Args:
+            start: Window start (timezone-aware)
+            end: Window end (timezone-aware)
             
-            device_files[device_id].append(file_path)
-        
-        # Get the latest file for each device
-        latest_files = []
-        for device_id, files in device_files.items():
-            # Sort by filename (timestamp in filename) and take the last one
-            latest_file = sorted(files, key=lambda f: f.name)[-1]
-            latest_files.append(latest_file)
-        
-        return latest_files
+        Returns:
+            List of Path objects
+        """
+        return [f.path for f in self.index.files_between(start, end)]
     
     def find_device_log(self, date: datetime, production_line: str, 
                        position: str, device_id: str) -> Optional[Path]:
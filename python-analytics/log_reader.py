@@ -0,0 +1,190 @@
+"""
+Memory-mapped log file reader
+Scans device log files without copying them into Python strings
+Shared by python-analytics and the baocao daily report
+"""
+import mmap
+import re
+from pathlib import Path
+from typing import Optional, Pattern, Tuple
+import numpy as np
+from columnar_parser import BUFFER_PATTERN, parse_buffer_arrays
+
+
+class MappedLogFile:
+    """Read-only memory-mapped view of a log file"""
+    
+    def __init__(self, file_path: Path):
+        """
+        Args:
+            file_path: Path to log file
+        """
+        self.file_path = Path(file_path)
+        self._file = open(self.file_path, 'rb')
+        self._mmap = None
+        
+        try:
+            self.size = self._file.seek(0, 2)
+            # mmap cannot map an empty file
+            if self.size > 0:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+    
+    def __enter__(self) -> 'MappedLogFile':
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def close(self):
+        """Unmap and close the file"""
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # A slice is still referenced somewhere, leave it to GC
+                pass
+            self._mmap = None
+        self._file.close()
+    
+    @property
+    def buffer(self):
+        """Whole file as a buffer object (mmap, or b'' for empty files)"""
+        return self._mmap if self._mmap is not None else b''
+    
+    def view(self, start: int = 0, end: Optional[int] = None) -> memoryview:
+        """Zero-copy view of the bytes [start, end)"""
+        return memoryview(self.buffer)[start:end]
+    
+    def align(self, offset: int) -> int:
+        """Move offset forward to the start of the next line (no-op at line starts)"""
+        if offset <= 0:
+            return 0
+        if offset >= self.size:
+            return self.size
+        if self.buffer[offset - 1] == ord('\n'):
+            return offset
+        
+        newline = self.buffer.find(b'\n', offset)
+        return self.size if newline == -1 else newline + 1
+    
+    def complete_end(self) -> int:
+        """Offset right after the last complete (newline-terminated) line"""
+        if self.size == 0:
+            return 0
+        return self.buffer.rfind(b'\n') + 1
+    
+    def tail_offset(self, n: int, end: Optional[int] = None) -> int:
+        """
+        Offset of the first of the last n lines before end
+        
+        Args:
+            n: Number of lines
+            end: Upper bound (default: end of file)
+        """
+        end = self.size if end is None else end
+        pos = end
+        
+        # A trailing newline terminates the last line, it does not start one
+        if pos > 0 and self.buffer[pos - 1] == ord('\n'):
+            pos -= 1
+        
+        for _ in range(n):
+            newline = self.buffer.rfind(b'\n', 0, pos)
+            if newline == -1:
+                return 0
+            pos = newline
+        
+        return pos + 1
+    
+    def offset_since(self, timestamp_ms: int, end: Optional[int] = None) -> int:
+        """
+        Offset of the first line at or after timestamp_ms (binary search, lines are
+        in time order; lines without a record count as older)
+        
+        Args:
+            timestamp_ms: Epoch milliseconds
+            end: Upper bound (default: end of file)
+        """
+        low = 0
+        high = self.size if end is None else min(end, self.size)
+        
+        while low < high:
+            middle = self.align((low + high) // 2)
+            if middle >= high:
+                # No line starts between the middle and high: check the line at low
+                middle = low
+            
+            line_end = self.buffer.find(b'\n', middle, high)
+            record = self._match_to_record(
+                BUFFER_PATTERN.match(self.buffer, middle, high if line_end == -1 else line_end))
+            
+            if record is not None and record[0] >= timestamp_ms:
+                high = middle
+            else:
+                low = high if line_end == -1 else line_end + 1
+        
+        return low
+    
+    def records_between(self, start: int = 0,
+                        end: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Parse the lines between two byte offsets (start is aligned to a line start)
+        
+        Returns:
+            Tuple of (int64 epoch-ms timestamps, int64 counts)
+        """
+        start = self.align(start)
+        end = self.size if end is None else min(end, self.size)
+        if start >= end:
+            return parse_buffer_arrays(b'')
+        
+        view = self.view(start, end)
+        try:
+            return parse_buffer_arrays(view)
+        finally:
+            view.release()
+    
+    def last_records(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Parse only the last n lines of the file
+        
+        Returns:
+            Tuple of (int64 epoch-ms timestamps, int64 counts)
+        """
+        return self.records_between(self.tail_offset(n))
+    
+    def first_match(self, pattern: Pattern = BUFFER_PATTERN) -> Optional[re.Match]:
+        """First line matching pattern (scans forward from the start)"""
+        if self.size == 0:
+            return None
+        return pattern.search(self.buffer)
+    
+    def last_match(self, pattern: Pattern = BUFFER_PATTERN) -> Optional[re.Match]:
+        """Last line matching pattern (scans backwards from EOF, line by line)"""
+        end = self.size
+        while end > 0:
+            start = self.buffer.rfind(b'\n', 0, end - 1) + 1
+            match = pattern.search(self.buffer, start, end)
+            if match:
+                return match
+            end = start
+        return None
+    
+    def first_record(self) -> Optional[Tuple[int, int]]:
+        """First (epoch-ms timestamp, count) record in the file"""
+        return self._match_to_record(self.first_match())
+    
+    def last_record(self) -> Optional[Tuple[int, int]]:
+        """Last (epoch-ms timestamp, count) record in the file"""
+        return self._match_to_record(self.last_match())
+    
+    @staticmethod
+    def _match_to_record(match: Optional[re.Match]) -> Optional[Tuple[int, int]]:
+        if match is None:
+            return None
+        timestamp_str, count_str = match.groups()
+        timestamp = np.datetime64(timestamp_str.decode('ascii'), 'ms').astype(np.int64)
+        return int(timestamp), int(count_str)
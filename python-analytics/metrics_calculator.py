@@ -2,21 +2,32 @@
 Calculate realtime metrics from log entries
 """
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Tuple
 import numpy as np
-from models import LogEntry, DeviceMetrics, LineMetrics
+from models import LogEntry, LogColumns, DeviceMetrics, LineMetrics
+from device_accumulator import DeviceAccumulator, to_epoch_ms
+from production_buckets import (LAST_10MIN, LAST_HOUR, count_increments,
+                                produced_since, window_start)
 from config import HISTORY_WINDOW
 
 
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
 class MetricsCalculator:
     """Calculate various metrics from device logs"""
     
-    def __init__(self, history_window: int = HISTORY_WINDOW):
+    def __init__(self, history_window: int = HISTORY_WINDOW,
+                 clock: Callable[[], datetime] = utc_now):
         """
         Args:
             history_window: Time window in seconds to consider for calculations
+            clock: Current time (UTC) for idle detection and trailing windows;
+                   replay.py passes a virtual clock
         """
         self.history_window = history_window
+        self.clock = clock
     
     def calculate_device_metrics(self, entries: List[LogEntry], 
                                  target_speed: Optional[float] = None) -> Optional[DeviceMetrics]:
@@ -44,9 +55,15 @@ class MetricsCalculator:
         current_count = latest.count
         last_update = latest.timestamp
         
+        # Trailing-window production over all given entries
+        last_hour, last_10min = self._window_totals(
+            np.fromiter((to_epoch_ms(e.timestamp) for e in entries), dtype=np.int64, count=len(entries)),
+            np.fromiter((e.count for e in entries), dtype=np.int64, count=len(entries)),
+        )
+        
         if len(recent_entries) < 2:
             # Not enough data
-            now = datetime.now(timezone.utc)
+            now = self.clock()
             return DeviceMetrics(
                 device_id=latest.device_id,
                 production_line=latest.production_line,
@@ -56,8 +73,8 @@ class MetricsCalculator:
                 speed_per_minute=0.0,
                 speed_per_hour=0.0,
                 total_produced_today=current_count,
-                total_produced_last_hour=0,
-                total_produced_last_10min=0,
+                total_produced_last_hour=last_hour,
+                total_produced_last_10min=last_10min,
                 is_running=False,
                 idle_time_seconds=(now - last_update).total_seconds(),
                 uptime_seconds=0.0,
@@ -77,11 +94,8 @@ class MetricsCalculator:
             speed_per_minute = 0.0
             speed_per_hour = 0.0
         
-        # Calculate production from recent entries (số viên thực tế)
-        total_last_period = count_diff  # Số viên từ first -> last trong window
-        
         # Determine if running (no update in last 60 seconds = stopped)
-        now = datetime.now(timezone.utc)
+        now = self.clock()
         idle_time = (now - last_update).total_seconds()
         is_running = idle_time < 60
         
@@ -105,8 +119,8 @@ class MetricsCalculator:
             speed_per_minute=speed_per_minute,
             speed_per_hour=speed_per_hour,
             total_produced_today=current_count,
-            total_produced_last_hour=total_last_period,
-            total_produced_last_10min=total_last_period,
+            total_produced_last_hour=last_hour,
+            total_produced_last_10min=last_10min,
             is_running=is_running,
             idle_time_seconds=idle_time,
             uptime_seconds=uptime,
@@ -114,6 +128,202 @@ class MetricsCalculator:
             efficiency_percent=efficiency,
         )
     
+    def calculate_device_metrics_columnar(self, columns: LogColumns,
+                                          target_speed: Optional[float] = None) -> Optional[DeviceMetrics]:
+        """
+        Calculate metrics for a single device from columnar arrays
+        Same results as calculate_device_metrics, without per-entry objects
+        
+        Args:
+            columns: LogColumns for the device (sorted by timestamp)
+            target_speed: Target speed in units/hour for efficiency calculation
+        
+        Returns:
+            DeviceMetrics object or None if insufficient data
+        """
+        if columns is None or len(columns) == 0:
+            return None
+        
+        # Chỉ lấy 10 entries gần nhất để tính toán (giảm overhead)
+        timestamps = columns.timestamps[-10:]
+        counts = columns.counts[-10:]
+        
+        uptime = 0.0
+        trend = 'stopped'
+        
+        if len(counts) >= 2:
+            # Gaps (ms) / count changes between consecutive entries
+            gaps_ms = np.diff(timestamps)
+            count_changes = np.diff(counts)
+            
+            # Uptime: sum of gaps after the last stop point (no change for > 30s)
+            stops = np.flatnonzero((count_changes == 0) & (gaps_ms > 30000))
+            running_gaps = gaps_ms[stops[-1] + 1:] if len(stops) else gaps_ms
+            uptime = int(running_gaps.sum()) / 1000
+            
+            trend = self._calculate_trend_arrays(gaps_ms / 1000, count_changes)
+        
+        return self._build_device_metrics(
+            columns.device_id, columns.production_line, columns.position,
+            len(counts), (int(timestamps[0]), int(counts[0])), (int(timestamps[-1]), int(counts[-1])),
+            uptime, trend, target_speed,
+            self._window_totals(columns.timestamps, columns.counts),
+        )
+    
+    def calculate_device_metrics_streaming(self, accumulator: DeviceAccumulator,
+                                           target_speed: Optional[float] = None) -> Optional[DeviceMetrics]:
+        """
+        Read out metrics from a streaming DeviceAccumulator
+        Same results as calculate_device_metrics over the accumulator's window,
+        without touching the individual readings
+        
+        Args:
+            accumulator: DeviceAccumulator kept up to date as readings arrive
+            target_speed: Target speed in units/hour for efficiency calculation
+        
+        Returns:
+            DeviceMetrics object or None if insufficient data
+        """
+        if accumulator is None or len(accumulator) == 0:
+            return None
+        
+        size = len(accumulator)
+        return self._build_device_metrics(
+            accumulator.device_id, accumulator.production_line, accumulator.position,
+            size, accumulator.oldest(), accumulator.latest(),
+            accumulator.uptime_seconds if size >= 2 else 0.0,
+            accumulator.trend() if size >= 2 else 'stopped',
+            target_speed,
+            accumulator.buckets.totals(to_epoch_ms(self.clock())),
+        )
+    
+    def _build_device_metrics(self, device_id: str, production_line: str, position: str,
+                              n_points: int, first: Tuple[int, int], latest: Tuple[int, int],
+                              uptime: float, trend: str,
+                              target_speed: Optional[float],
+                              produced: Tuple[int, int]) -> DeviceMetrics:
+        """
+        DeviceMetrics from the window's first/latest (epoch ms, count) readings
+        
+        Args:
+            n_points: Number of readings in the window
+            first: Oldest reading in the window
+            latest: Newest reading
+            uptime: Uptime in seconds
+            trend: Trend label
+            target_speed: Target speed in units/hour for efficiency calculation
+            produced: Production in the last hour / last 10 minutes
+        """
+        last_hour, last_10min = produced
+        current_count = latest[1]
+        last_update = datetime.fromtimestamp(latest[0] / 1000, tz=timezone.utc)
+        now = self.clock()
+        idle_time = (now - last_update).total_seconds()
+        
+        if n_points < 2:
+            # Not enough data
+            return DeviceMetrics(
+                device_id=device_id,
+                production_line=production_line,
+                position=position,
+                current_count=current_count,
+                last_update=last_update,
+                speed_per_minute=0.0,
+                speed_per_hour=0.0,
+                total_produced_today=current_count,
+                total_produced_last_hour=last_hour,
+                total_produced_last_10min=last_10min,
+                is_running=False,
+                idle_time_seconds=idle_time,
+                uptime_seconds=0.0,
+                trend='stopped',
+                efficiency_percent=0.0 if target_speed else None,
+            )
+        
+        # Calculate speed (viên/phút)
+        time_diff_seconds = (latest[0] - first[0]) / 1000
+        count_diff = latest[1] - first[1]
+        
+        if time_diff_seconds > 0:
+            speed_per_minute = (count_diff / time_diff_seconds) * 60
+            speed_per_hour = speed_per_minute * 60
+        else:
+            speed_per_minute = 0.0
+            speed_per_hour = 0.0
+        
+        efficiency = None
+        if target_speed and speed_per_hour > 0:
+            efficiency = (speed_per_hour / target_speed) * 100
+        
+        return DeviceMetrics(
+            device_id=device_id,
+            production_line=production_line,
+            position=position,
+            current_count=current_count,
+            last_update=last_update,
+            speed_per_minute=speed_per_minute,
+            speed_per_hour=speed_per_hour,
+            total_produced_today=current_count,
+            total_produced_last_hour=last_hour,
+            total_produced_last_10min=last_10min,
+            is_running=idle_time < 60,
+            idle_time_seconds=idle_time,
+            uptime_seconds=uptime,
+            trend=trend,
+            efficiency_percent=efficiency,
+        )
+    
+    def _window_starts(self, now_ms: int) -> Tuple[int, int]:
+        """Start (epoch ms) of the last hour / last 10 min windows, clamped to history_window"""
+        oldest = window_start(max(self.history_window // 60, 1), now_ms)
+        return (max(window_start(LAST_HOUR, now_ms), oldest),
+                max(window_start(LAST_10MIN, now_ms), oldest))
+    
+    def _window_totals(self, timestamps: np.ndarray, counts: np.ndarray,
+                       now_ms: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Production in the last hour / last 10 minutes from raw readings
+        Same windows as the per-minute buckets of the streaming path
+        """
+        if len(counts) == 0:
+            return 0, 0
+        
+        now_ms = now_ms if now_ms is not None else to_epoch_ms(self.clock())
+        last_hour, last_10min = produced_since(timestamps, counts, np.array(self._window_starts(now_ms)))
+        return int(last_hour), int(last_10min)
+    
+    def _calculate_trend_arrays(self, time_gaps: np.ndarray, count_changes: np.ndarray) -> str:
+        """
+        Calculate production trend from consecutive gaps (seconds) and count changes
+        
+        Returns:
+            'increasing', 'stable', 'decreasing', or 'stopped'
+        """
+        if len(time_gaps) < 2:
+            return 'stable'
+        
+        valid = time_gaps > 0
+        speeds = count_changes[valid] / time_gaps[valid]
+        
+        if len(speeds) == 0:
+            return 'stopped'
+        
+        # Check if all speeds are near zero
+        if np.all(speeds < 0.01):
+            return 'stopped'
+        
+        if len(speeds) < 2:
+            return 'stable'
+        
+        slope, _ = np.polyfit(np.arange(len(speeds)), speeds, 1)
+        
+        if slope > 0.01:
+            return 'increasing'
+        elif slope < -0.01:
+            return 'decreasing'
+        else:
+            return 'stable'
+    
     def _calculate_uptime(self, entries: List[LogEntry]) -> float:
         """
         Calculate uptime (continuous running time)
@@ -194,6 +404,180 @@ class MetricsCalculator:
         else:
             return 'stable'
     
+    @staticmethod
+    def pad_windows(windows: List[LogColumns], samples: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Stack the last `samples` rows of every window into devices × samples arrays
+        
+        Rows are left-aligned; shorter windows are padded and masked out.
+        
+        Returns:
+            Tuple of (int64 timestamps, int64 counts, bool validity mask)
+        """
+        timestamps = np.zeros((len(windows), samples), dtype=np.int64)
+        counts = np.zeros((len(windows), samples), dtype=np.int64)
+        mask = np.zeros((len(windows), samples), dtype=bool)
+        
+        for row, window in enumerate(windows):
+            n = min(len(window), samples)
+            if n:
+                timestamps[row, :n] = window.timestamps[-n:]
+                counts[row, :n] = window.counts[-n:]
+                mask[row, :n] = True
+        
+        return timestamps, counts, mask
+    
+    def calculate_batch(self, windows: List[LogColumns], samples: int = 10,
+                        target_speed: Optional[float] = None,
+                        now: Optional[datetime] = None) -> Dict[str, LineMetrics]:
+        """
+        Calculate device and line metrics for all devices at once
+        Same results as calculate_device_metrics_columnar + calculate_line_metrics,
+        computed with whole-array NumPy operations over a padded devices × samples grid
+        
+        Args:
+            windows: LogColumns of every device (sorted by timestamp, may be empty);
+                     readings older than the last `samples` only feed the
+                     last hour / last 10 min totals
+            samples: Number of most recent entries per device to use
+            target_speed: Target speed in units/hour for efficiency calculation
+            now: Reference time for idle detection (default: current time)
+        
+        Returns:
+            Dictionary mapping production line -> LineMetrics
+        """
+        windows = [w for w in windows if w is not None and len(w) > 0]
+        if not windows:
+            return {}
+        
+        now = now or self.clock()
+        timestamps, counts, mask = self.pad_windows(windows, samples)
+        rows = np.arange(len(windows))
+        n_points = mask.sum(axis=1)
+        last = n_points - 1
+        
+        last_ts = timestamps[rows, last]
+        current_counts = counts[rows, last]
+        
+        # Speed over the window (viên/phút)
+        time_diff_s = (last_ts - timestamps[:, 0]) / 1000
+        count_diff = current_counts - counts[:, 0]
+        speed_per_minute = np.divide(count_diff, time_diff_s,
+                                     out=np.zeros(len(windows)), where=time_diff_s > 0) * 60
+        speed_per_minute[n_points < 2] = 0.0
+        
+        # Idle / running
+        idle_time = (now.timestamp() * 1000 - last_ts) / 1000
+        is_running = (idle_time < 60) & (n_points >= 2)
+        
+        # Consecutive intervals (valid where both ends are real samples)
+        gaps_ms = np.diff(timestamps, axis=1)
+        count_changes = np.diff(counts, axis=1)
+        intervals = mask[:, 1:]
+        columns = np.arange(samples - 1)
+        
+        # Uptime: gaps after the last stop point (no change for > 30s)
+        stops = intervals & (count_changes == 0) & (gaps_ms > 30000)
+        last_stop = np.where(stops.any(axis=1),
+                             samples - 2 - np.argmax(stops[:, ::-1], axis=1), -1)
+        running = intervals & (columns > last_stop[:, None])
+        uptime = np.where(running, gaps_ms, 0).sum(axis=1) / 1000
+        
+        # Trend: least-squares slope of the per-interval speeds (x = index among valid speeds)
+        has_speed = intervals & (gaps_ms > 0)
+        speeds = np.divide(count_changes, gaps_ms / 1000, out=np.zeros(gaps_ms.shape),
+                           where=has_speed)
+        x = np.cumsum(has_speed, axis=1) - 1
+        n = has_speed.sum(axis=1).astype(np.float64)
+        sum_x = np.where(has_speed, x, 0).sum(axis=1)
+        sum_xx = np.where(has_speed, x * x, 0).sum(axis=1)
+        sum_y = speeds.sum(axis=1)
+        sum_xy = (np.where(has_speed, x, 0) * speeds).sum(axis=1)
+        denominator = n * sum_xx - sum_x * sum_x
+        slope = np.divide(n * sum_xy - sum_x * sum_y, denominator,
+                          out=np.zeros(len(windows)), where=denominator > 0)
+        moving = (has_speed & (speeds >= 0.01)).any(axis=1)
+        
+        trend = np.where(slope > 0.01, 'increasing', np.where(slope < -0.01, 'decreasing', 'stable'))
+        trend = np.where(n < 2, 'stable', trend)
+        trend = np.where((n == 0) | ~moving, 'stopped', trend)
+        trend = np.where(n_points < 3, 'stable', trend)
+        trend = np.where(n_points < 2, 'stopped', trend)
+        
+        uptime[n_points < 2] = 0.0
+        
+        last_hour, last_10min = self._window_totals_batch(windows, to_epoch_ms(now))
+        
+        # Line aggregates via group codes
+        line_index = {name: i for i, name in enumerate(dict.fromkeys(w.production_line for w in windows))}
+        line_names = list(line_index)
+        line_codes = np.fromiter((line_index[w.production_line] for w in windows),
+                                 dtype=np.int64, count=len(windows))
+        n_lines = len(line_names)
+        devices_per_line = np.bincount(line_codes, minlength=n_lines)
+        running_per_line = np.bincount(line_codes, weights=is_running, minlength=n_lines)
+        produced_per_line = np.bincount(line_codes, weights=current_counts, minlength=n_lines)
+        speed_per_line = np.bincount(line_codes, weights=speed_per_minute * 60, minlength=n_lines)
+        
+        # Objects are only built for the output
+        devices_by_line: Dict[str, List[DeviceMetrics]] = {name: [] for name in line_names}
+        values = zip(windows, current_counts.tolist(), last_ts.tolist(), speed_per_minute.tolist(),
+                     last_hour.tolist(), last_10min.tolist(), is_running.tolist(), idle_time.tolist(),
+                     uptime.tolist(), trend.tolist(), n_points.tolist())
+        for window, count, ts, speed, hour, ten_min, running_flag, idle, up, trend_label, points in values:
+            speed_per_hour = speed * 60
+            if points < 2:
+                efficiency = 0.0 if target_speed else None
+            else:
+                efficiency = (speed_per_hour / target_speed) * 100 if target_speed and speed_per_hour > 0 else None
+            devices_by_line[window.production_line].append(DeviceMetrics(
+                device_id=window.device_id,
+                production_line=window.production_line,
+                position=window.position,
+                current_count=count,
+                last_update=datetime.fromtimestamp(ts / 1000, tz=timezone.utc),
+                speed_per_minute=speed,
+                speed_per_hour=speed_per_hour,
+                total_produced_today=count,
+                total_produced_last_hour=hour,
+                total_produced_last_10min=ten_min,
+                is_running=running_flag,
+                idle_time_seconds=idle,
+                uptime_seconds=up,
+                trend=trend_label,
+                efficiency_percent=efficiency,
+            ))
+        
+        return {
+            name: LineMetrics(
+                production_line=name,
+                total_devices=int(devices_per_line[i]),
+                running_devices=int(running_per_line[i]),
+                stopped_devices=int(devices_per_line[i] - running_per_line[i]),
+                total_produced_today=int(produced_per_line[i]),
+                average_speed_per_hour=float(speed_per_line[i] / devices_per_line[i]),
+                devices=devices_by_line[name],
+            )
+            for i, name in enumerate(line_names)
+        }
+    
+    def _window_totals_batch(self, windows: List[LogColumns],
+                             now_ms: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Last hour / last 10 min production of every window (one pass over all readings)"""
+        lengths = np.fromiter((len(w) for w in windows), dtype=np.int64, count=len(windows))
+        timestamps = np.concatenate([w.timestamps for w in windows])
+        increments = count_increments(np.concatenate([w.counts for w in windows]))
+        # The first reading of each device has no previous one
+        increments[np.cumsum(lengths) - lengths] = 0
+        devices = np.repeat(np.arange(len(windows)), lengths)
+        
+        hour_start, ten_min_start = self._window_starts(now_ms)
+        last_hour = np.bincount(devices, weights=np.where(timestamps >= hour_start, increments, 0),
+                                minlength=len(windows))
+        last_10min = np.bincount(devices, weights=np.where(timestamps >= ten_min_start, increments, 0),
+                                 minlength=len(windows))
+        return last_hour.astype(np.int64), last_10min.astype(np.int64)
+    
     def calculate_line_metrics(self, device_metrics: List[DeviceMetrics]) -> LineMetrics:
         """
         Calculate aggregated metrics for a production line
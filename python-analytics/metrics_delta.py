@@ -0,0 +1,125 @@
+"""
+Delta publishing support
+Remembers the last published metrics and reports only what changed
+"""
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+# Fields that move with the wall clock alone (an idle device's idle time grows
+# every tick); they are sent along with other changes and in snapshots only
+CLOCK_DRIVEN_FIELDS = frozenset({'idleTimeSeconds'})
+
+# Aggregate fields not compared between ticks
+AGGREGATE_VOLATILE_FIELDS = frozenset({'timestamp'})
+
+
+def _changed_fields(previous: Dict, current: Dict, ignored: frozenset) -> Dict:
+    """Fields of current that differ from previous (all of them when previous is empty)"""
+    changed = {
+        key: value for key, value in current.items()
+        if key not in ignored and previous.get(key) != value
+    }
+    if changed:
+        # Clock-driven fields ride along so subscribers stay consistent
+        for key in ignored:
+            if key in current:
+                changed[key] = current[key]
+    return changed
+
+
+class MetricsDeltaTracker:
+    """Last published state per line / device, with a periodic full snapshot"""
+    
+    def __init__(self, snapshot_interval: float):
+        """
+        Args:
+            snapshot_interval: Seconds between full snapshots
+        """
+        self.snapshot_interval = snapshot_interval
+        self.lines: Dict[str, Dict] = {}  # line -> line fields + {'devices': {device_id: fields}}
+        self.aggregate: Dict = {}
+        self.last_snapshot: Optional[float] = None
+    
+    def snapshot_due(self) -> bool:
+        """Whether the next publish must be a full snapshot"""
+        if self.last_snapshot is None:
+            return True
+        return time.monotonic() - self.last_snapshot >= self.snapshot_interval
+    
+    def force_snapshot(self):
+        """Make the next publish a full snapshot (e.g. after a failed publish)"""
+        self.last_snapshot = None
+    
+    @staticmethod
+    def _split(line_dict: Dict) -> Dict:
+        """Line dict with devices keyed by device ID"""
+        state = {key: value for key, value in line_dict.items() if key != 'devices'}
+        state['devices'] = {d['deviceId']: d for d in line_dict.get('devices', [])}
+        return state
+    
+    def reset(self, line_dicts: Dict[str, Dict], aggregate: Dict):
+        """
+        Record a full snapshot as the published state
+        
+        Args:
+            line_dicts: Line name -> LineMetrics.to_dict()
+            aggregate: Aggregate metrics dict
+        """
+        self.lines = {line: self._split(d) for line, d in line_dicts.items()}
+        self.aggregate = aggregate
+        self.last_snapshot = time.monotonic()
+    
+    def diff(self, line_dicts: Dict[str, Dict], aggregate: Dict,
+             partial: bool = False) -> Tuple[Dict[str, Dict], bool]:
+        """
+        Changes since the last publish; the new state becomes the published state
+        
+        Args:
+            line_dicts: Line name -> LineMetrics.to_dict()
+            aggregate: Aggregate metrics dict
+            partial: line_dicts only holds some lines; missing lines are unchanged, not removed
+        
+        Returns:
+            Tuple of (line name -> delta, whether the aggregate changed)
+            A delta holds the changed line fields, 'devices' (device ID -> changed
+            fields), 'removedDevices', or 'removed' for a line that disappeared
+        """
+        deltas: Dict[str, Dict] = {}
+        
+        for line, line_dict in line_dicts.items():
+            current = self._split(line_dict)
+            previous = self.lines.get(line, {'devices': {}})
+            
+            delta = _changed_fields(
+                {k: v for k, v in previous.items() if k != 'devices'},
+                {k: v for k, v in current.items() if k != 'devices'},
+                CLOCK_DRIVEN_FIELDS,
+            )
+            
+            devices = {}
+            for device_id, device in current['devices'].items():
+                changed = _changed_fields(previous['devices'].get(device_id, {}), device,
+                                          CLOCK_DRIVEN_FIELDS)
+                if changed:
+                    devices[device_id] = changed
+            removed: List[str] = [d for d in previous['devices'] if d not in current['devices']]
+            
+            if devices:
+                delta['devices'] = devices
+            if removed:
+                delta['removedDevices'] = removed
+            if delta:
+                deltas[line] = delta
+            
+            self.lines[line] = current
+        
+        for line in [l for l in self.lines if not partial and l not in line_dicts]:
+            deltas[line] = {'removed': True}
+            del self.lines[line]
+        
+        aggregate_changed = bool(_changed_fields(self.aggregate, aggregate,
+                                                 AGGREGATE_VOLATILE_FIELDS))
+        self.aggregate = aggregate
+        
+        return deltas, aggregate_changed
@@ -0,0 +1,262 @@
+"""
+Downsampled metrics history for dashboards
+Every device snapshot is folded into one open bucket per tier (10 s for the
+last hour, 1 min for the day, 15 min for the month); a bucket is written to
+the backend once it ended (on the next snapshot of any device), and old points
+are trimmed (Redis keys also expire) per tier.
+Backends: Redis sorted sets (score = bucket start) or a local SQLite file
+"""
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from aggregation import DeviceKey
+from models import DeviceMetrics
+
+
+@dataclass(frozen=True)
+class Tier:
+    name: str
+    resolution_ms: int
+    retention_ms: int
+
+
+TIERS = (
+    Tier('10s', 10 * 1000, 3600 * 1000),
+    Tier('1m', 60 * 1000, 86400 * 1000),
+    Tier('15m', 15 * 60 * 1000, 31 * 86400 * 1000),
+)
+
+# Redis sorted set per tier and device location; members are JSON points
+REDIS_KEY = 'history:{tier}:{line}:{brick_type}:{position}:{device}'
+
+# Point fields, in SQLite column order
+FIELDS = ('speedPerMinute', 'currentCount', 'totalProducedToday', 'running')
+
+
+class Bucket:
+    """Samples of one device within one bucket of one tier"""
+    
+    __slots__ = ('start', 'samples', 'speed_sum', 'running_sum', 'count', 'produced')
+    
+    def __init__(self, start: int):
+        self.start = start
+        self.samples = 0
+        self.speed_sum = 0.0
+        self.running_sum = 0
+        self.count = 0
+        self.produced = 0
+    
+    def add(self, metrics: DeviceMetrics):
+        self.samples += 1
+        self.speed_sum += float(metrics.speed_per_minute)
+        self.running_sum += int(metrics.is_running)
+        # Counters: the last value of the bucket
+        self.count = int(metrics.current_count)
+        self.produced = int(metrics.total_produced_today)
+    
+    def point(self) -> dict:
+        """Mean speed / share of samples running, last counter values"""
+        return {
+            't': self.start,
+            'speedPerMinute': round(self.speed_sum / self.samples, 2),
+            'currentCount': self.count,
+            'totalProducedToday': self.produced,
+            'running': round(self.running_sum / self.samples, 3),
+        }
+
+
+# (tier, device location, point); one location per log file, as in the AggregationTree
+HistoryPoint = Tuple[Tier, DeviceKey, dict]
+
+
+def redis_key(tier: Tier, location: DeviceKey) -> str:
+    line, brick_type, position, device = location
+    return REDIS_KEY.format(tier=tier.name, line=line, brick_type=brick_type,
+                            position=position, device=device)
+
+
+class RedisHistoryBackend:
+    """One sorted set per tier and device (ZRANGEBYSCORE reads a chart series)"""
+    
+    def __init__(self, redis_client):
+        """
+        Args:
+            redis_client: Blocking Redis client (decode_responses=True)
+        """
+        self.redis_client = redis_client
+    
+    def write(self, points: List[HistoryPoint], now_ms: int):
+        pipe = self.redis_client.pipeline(transaction=False)
+        trimmed = set()
+        for tier, location, point in points:
+            key = redis_key(tier, location)
+            # A bucket written again (restart within the bucket) replaces the old point
+            pipe.zremrangebyscore(key, point['t'], point['t'])
+            pipe.zadd(key, {json.dumps(point, separators=(',', ':')): point['t']})
+            if key not in trimmed:
+                pipe.zremrangebyscore(key, '-inf', now_ms - tier.retention_ms)
+                # Keys of devices that stopped reporting are not trimmed again
+                pipe.pexpire(key, tier.retention_ms)
+                trimmed.add(key)
+        pipe.execute()
+    
+    def read(self, tier: Tier, location: DeviceKey, start_ms: int, end_ms: int) -> List[dict]:
+        key = redis_key(tier, location)
+        return [json.loads(member) for member in self.redis_client.zrangebyscore(key, start_ms, end_ms)]
+
+
+class SQLiteHistoryBackend:
+    """Local SQLite file, one row per (tier, device, bucket)"""
+    
+    def __init__(self, path: Path):
+        """
+        Args:
+            path: Database file (created with its directory if missing)
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        # Written from the calculation thread, read from the HTTP endpoint
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS history ('
+                ' tier TEXT NOT NULL, line TEXT NOT NULL, brick_type TEXT NOT NULL,'
+                ' position TEXT NOT NULL, device TEXT NOT NULL, t INTEGER NOT NULL,'
+                ' speed REAL, count INTEGER, produced INTEGER, running REAL,'
+                ' PRIMARY KEY (tier, line, brick_type, position, device, t)) WITHOUT ROWID')
+    
+    def write(self, points: List[HistoryPoint], now_ms: int):
+        rows = [(tier.name, *location, point['t'], *(point[field] for field in FIELDS))
+                for tier, location, point in points]
+        tiers = {tier.name: tier for tier, _, _ in points}
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            for tier in tiers.values():
+                self.connection.execute('DELETE FROM history WHERE tier = ? AND t < ?',
+                                        (tier.name, now_ms - tier.retention_ms))
+    
+    def read(self, tier: Tier, location: DeviceKey, start_ms: int, end_ms: int) -> List[dict]:
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT t, speed, count, produced, running FROM history '
+                'WHERE tier = ? AND line = ? AND brick_type = ? AND position = ? AND device = ?'
+                ' AND t BETWEEN ? AND ? ORDER BY t',
+                (tier.name, *location, start_ms, end_ms)).fetchall()
+        return [dict(zip(('t',) + FIELDS, row)) for row in rows]
+    
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class MetricsHistory:
+    """Multi-resolution history of device snapshots over a pluggable backend"""
+    
+    def __init__(self, backend, tiers: Tuple[Tier, ...] = TIERS):
+        """
+        Args:
+            backend: RedisHistoryBackend or SQLiteHistoryBackend
+            tiers: Tiers from finest to coarsest
+        """
+        self.backend = backend
+        self.tiers = tiers
+        # Device location -> open bucket per tier
+        self.open: Dict[DeviceKey, List[Optional[Bucket]]] = {}
+        self.lock = threading.Lock()
+    
+    def record(self, devices: Iterable[Tuple[DeviceKey, DeviceMetrics]],
+               now_ms: Optional[int] = None):
+        """
+        Fold one snapshot of each device into its open buckets; buckets that
+        ended (of any device) are written to the backend in one batch
+        
+        Args:
+            devices: (location, latest metrics) of the devices; the same device ID under
+                     two brick types or positions is two series
+            now_ms: Snapshot time (default: now)
+        """
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        closed: List[HistoryPoint] = []
+        
+        with self.lock:
+            for key, metrics in devices:
+                buckets = self.open.setdefault(key, [None] * len(self.tiers))
+                for i, tier in enumerate(self.tiers):
+                    start = now_ms - now_ms % tier.resolution_ms
+                    bucket = buckets[i]
+                    if bucket is not None and bucket.start != start:
+                        closed.append((tier, key, bucket.point()))
+                        bucket = None
+                    if bucket is None:
+                        bucket = buckets[i] = Bucket(start)
+                    bucket.add(metrics)
+            
+            # Devices left out of this snapshot (stopped, removed, moved to another shard)
+            # would keep ended buckets open until shutdown
+            for key, buckets in list(self.open.items()):
+                for i, tier in enumerate(self.tiers):
+                    bucket = buckets[i]
+                    if bucket is not None and bucket.start + tier.resolution_ms <= now_ms:
+                        closed.append((tier, key, bucket.point()))
+                        buckets[i] = None
+                if all(bucket is None for bucket in buckets):
+                    del self.open[key]
+        
+        if closed:
+            self.backend.write(closed, now_ms)
+    
+    def flush(self, now_ms: Optional[int] = None):
+        """Write every open bucket (shutdown)"""
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        with self.lock:
+            points = [(tier, key, bucket.point())
+                      for key, buckets in self.open.items()
+                      for tier, bucket in zip(self.tiers, buckets) if bucket is not None]
+            self.open = {}
+        if points:
+            self.backend.write(points, now_ms)
+    
+    def tier_for(self, start_ms: int, now_ms: int) -> Tier:
+        """Finest tier still holding points as old as start_ms"""
+        for tier in self.tiers:
+            if now_ms - start_ms <= tier.retention_ms:
+                return tier
+        return self.tiers[-1]
+    
+    def locations(self, production_line: str, device_id: str) -> List[DeviceKey]:
+        """Locations of a device that have an open bucket (devices reporting now)"""
+        with self.lock:
+            return sorted(key for key in self.open
+                          if key[0] == production_line and key[3] == device_id)
+    
+    def series(self, location: DeviceKey, start_ms: int, end_ms: Optional[int] = None) -> dict:
+        """
+        Chart series of one device in one call
+        
+        Args:
+            location: (production line, brick type, position, device ID)
+            start_ms: Range start (epoch ms); picks the tier
+            end_ms: Range end (default: now)
+        
+        Returns:
+            {'tier', 'resolutionMs', 'points': [{'t', 'speedPerMinute', 'currentCount',
+            'totalProducedToday', 'running'}, ...]} including the bucket still open
+        """
+        now_ms = int(time.time() * 1000)
+        end_ms = now_ms if end_ms is None else end_ms
+        tier = self.tier_for(start_ms, now_ms)
+        points = self.backend.read(tier, location, start_ms, end_ms)
+        
+        with self.lock:
+            buckets = self.open.get(location)
+            bucket = buckets[self.tiers.index(tier)] if buckets else None
+            if bucket is not None and start_ms <= bucket.start <= end_ms:
+                points = [p for p in points if p['t'] != bucket.start] + [bucket.point()]
+        
+        return {'tier': tier.name, 'resolutionMs': tier.resolution_ms, 'points': points}
@@ -2,13 +2,14 @@
 Data models for analytics
 """
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional, List
+import numpy as np
 
 
-@dataclass
+@dataclass(slots=True)
 class LogEntry:
-    """Single log entry from device file"""
+    """Single log entry from device file (metadata strings are interned by LogParser)"""
     timestamp: datetime
     count: int
     device_id: str
@@ -16,7 +17,59 @@ class LogEntry:
     position: str
 
 
-@dataclass
+@dataclass(slots=True)
+class LogColumns:
+    """Columnar log data for one file (metadata stored once, values as NumPy arrays)"""
+    device_id: str
+    production_line: str
+    brick_type: str
+    position: str
+    
+    timestamps: np.ndarray  # int64 epoch milliseconds (UTC)
+    counts: np.ndarray      # int64 cumulative counts
+    
+    def __len__(self):
+        return len(self.counts)
+    
+    def tail(self, n: int) -> 'LogColumns':
+        """Return the last n rows (array views, no copy)"""
+        # [-0:] would be every row
+        start = max(len(self) - max(n, 0), 0)
+        return LogColumns(
+            device_id=self.device_id,
+            production_line=self.production_line,
+            brick_type=self.brick_type,
+            position=self.position,
+            timestamps=self.timestamps[start:],
+            counts=self.counts[start:],
+        )
+    
+    def select(self, mask: np.ndarray) -> 'LogColumns':
+        """Return the rows where mask is True (copies only those rows)"""
+        return LogColumns(
+            device_id=self.device_id,
+            production_line=self.production_line,
+            brick_type=self.brick_type,
+            position=self.position,
+            timestamps=self.timestamps[mask],
+            counts=self.counts[mask],
+        )
+    
+    def to_entries(self) -> List[LogEntry]:
+        """Convert to LogEntry objects (for code paths that still need them)"""
+        return [
+            LogEntry(
+                timestamp=datetime.fromtimestamp(ts / 1000, tz=timezone.utc),
+                count=count,
+                device_id=self.device_id,
+                production_line=self.production_line,
+                position=self.position,
+            )
+            for ts, count in zip(self.timestamps.tolist(), self.counts.tolist())
+        ]
+
+
+@dataclass(slots=True)
 class DeviceMetrics:
     """Calculated metrics for a device"""
     device_id: str
@@ -47,14 +100,19 @@ class DeviceMetrics:
     # Performance
     efficiency_percent: Optional[float] = None  # So với target nếu có
     
-    def to_dict(self):
-        """Convert to dictionary for JSON serialization"""
+    def to_dict(self, raw_timestamps: bool = False):
+        """
+        Convert to dictionary for JSON serialization
+        
+        Args:
+            raw_timestamps: Keep datetimes as objects (formatted by the serializer)
+        """
         return {
             'deviceId': self.device_id,
             'productionLine': self.production_line,
             'position': self.position,
             'currentCount': self.current_count,
-            'lastUpdate': self.last_update.isoformat(),
+            'lastUpdate': self.last_update if raw_timestamps else self.last_update.isoformat(),
             'speedPerMinute': round(self.speed_per_minute, 2),
             'speedPerHour': round(self.speed_per_hour, 2),
             'totalProducedToday': self.total_produced_today,
@@ -68,7 +126,7 @@ class DeviceMetrics:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class LineMetrics:
     """Aggregated metrics for entire production line"""
     production_line: str
@@ -81,8 +139,13 @@ class LineMetrics:
     
     devices: List[DeviceMetrics]
     
-    def to_dict(self):
-        """Convert to dictionary for JSON serialization"""
+    def to_dict(self, raw_timestamps: bool = False):
+        """
+        Convert to dictionary for JSON serialization
+        
+        Args:
+            raw_timestamps: Keep datetimes as objects (formatted by the serializer)
+        """
         return {
             'productionLine': self.production_line,
             'totalDevices': self.total_devices,
@@ -90,5 +153,5 @@ class LineMetrics:
             'stoppedDevices': self.stopped_devices,
             'totalProducedToday': self.total_produced_today,
             'averageSpeedPerHour': round(self.average_speed_per_hour, 2),
-            'devices': [d.to_dict() for d in self.devices],
+            'devices': [d.to_dict(raw_timestamps) for d in self.devices],
         }
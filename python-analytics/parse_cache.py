@@ -0,0 +1,190 @@
+"""
+Binary sidecar cache for parsed log files
+Stores (timestamp, count) columns so restarts load arrays instead of re-parsing text
+"""
+import hashlib
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Optional, Set, Tuple
+import numpy as np
+from log_reader import MappedLogFile
+
+
+# magic, version, source size, source mtime (ns), source inode, parsed offset, records
+HEADER = struct.Struct('<8sIqqqqq')
+MAGIC = b'BRKCOLS\0'
+VERSION = 1
+
+RECORD_DTYPE = np.dtype([('timestamp', '<i8'), ('count', '<i8')])
+
+SIDECAR_SUFFIX = '.cols'
+
+
+class ParseCache:
+    """On-disk cache of parsed log columns, validated by size/mtime and extended on growth"""
+    
+    def __init__(self, cache_dir: Optional[Path] = None):
+        """
+        Args:
+            cache_dir: Directory for cache files (None = sidecar next to each log file)
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.lock = threading.Lock()
+        # Cache files that could not be written (warned about once)
+        self.unwritable: Set[Path] = set()
+        
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+    
+    def cache_path(self, file_path: Path) -> Path:
+        """Location of the cache file for a log file"""
+        file_path = Path(file_path)
+        if self.cache_dir is None:
+            return file_path.with_name(f".{file_path.name}{SIDECAR_SUFFIX}")
+        
+        digest = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:16]
+        return self.cache_dir / f"{digest}_{file_path.name}{SIDECAR_SUFFIX}"
+    
+    def load(self, file_path: Path) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get parsed columns for a log file, parsing only what the cache lacks
+        
+        A last line without a newline is included, as in LogParser.parse_buffer,
+        but not cached: it may still be being written.
+        
+        Args:
+            file_path: Path to log file
+        
+        Returns:
+            Tuple of (int64 epoch-ms timestamps, int64 counts)
+        """
+        file_path = Path(file_path)
+        cache_path = self.cache_path(file_path)
+        stat = file_path.stat()
+        
+        with self.lock:
+            timestamps, counts, offset = self._load_complete(file_path, cache_path, stat)
+        
+        if offset < stat.st_size:
+            with MappedLogFile(file_path) as log_file:
+                tail_timestamps, tail_counts = log_file.records_between(offset)
+            if len(tail_timestamps):
+                timestamps = np.concatenate((timestamps, tail_timestamps))
+                counts = np.concatenate((counts, tail_counts))
+        
+        return timestamps, counts
+    
+    def _load_complete(self, file_path: Path, cache_path: Path,
+                       stat: os.stat_result) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Columns of the complete lines and the offset they end at"""
+        header = self._read_header(cache_path)
+        
+        if header is not None:
+            _, _, size, mtime_ns, inode, offset, n_records = header
+            same_file = inode == stat.st_ino
+            
+            try:
+                # Unchanged source: pure array load
+                if same_file and size == stat.st_size and mtime_ns == stat.st_mtime_ns:
+                    return (*self._read_records(cache_path, n_records), offset)
+                
+                # Grown source (append-only logs): parse only the appended bytes
+                if same_file and stat.st_size > size:
+                    return self._extend(file_path, cache_path, stat, offset, n_records)
+            
+            except ValueError as e:
+                print(f"⚠️  Invalid parse cache {cache_path}: {e}")
+        
+        return self._rebuild(file_path, cache_path, stat)
+    
+    @staticmethod
+    def _read_header(cache_path: Path) -> Optional[tuple]:
+        try:
+            with open(cache_path, 'rb') as f:
+                header = HEADER.unpack(f.read(HEADER.size))
+        except (FileNotFoundError, struct.error):
+            return None
+        
+        if header[0] != MAGIC or header[1] != VERSION:
+            return None
+        return header
+    
+    @staticmethod
+    def _read_records(cache_path: Path, n_records: int) -> Tuple[np.ndarray, np.ndarray]:
+        records = np.fromfile(cache_path, dtype=RECORD_DTYPE, count=n_records,
+                              offset=HEADER.size)
+        if len(records) != n_records:
+            raise ValueError(f"Truncated cache file {cache_path}")
+        return (np.ascontiguousarray(records['timestamp']),
+                np.ascontiguousarray(records['count']))
+    
+    @staticmethod
+    def _parse(file_path: Path, start: int) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Parse complete lines from start; returns arrays and the new parsed offset"""
+        with MappedLogFile(file_path) as log_file:
+            # A partially written last line is left for the next load
+            end = log_file.complete_end()
+            timestamps, counts = log_file.records_between(start, end)
+        return timestamps, counts, max(end, start)
+    
+    @staticmethod
+    def _pack(timestamps: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        records = np.empty(len(timestamps), dtype=RECORD_DTYPE)
+        records['timestamp'] = timestamps
+        records['count'] = counts
+        return records
+    
+    def _write_failed(self, cache_path: Path, error: OSError):
+        # Cache is optional: a read-only log mount must not break parsing (nor flood the log)
+        if cache_path not in self.unwritable:
+            self.unwritable.add(cache_path)
+            print(f"⚠️  Could not write parse cache {cache_path}: {error}")
+    
+    def _rebuild(self, file_path: Path, cache_path: Path,
+                 stat: os.stat_result) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Parse the whole file and write a fresh cache file (atomic replace)"""
+        timestamps, counts, offset = self._parse(file_path, 0)
+        
+        tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, stat.st_size, stat.st_mtime_ns,
+                                    stat.st_ino, offset, len(timestamps)))
+                self._pack(timestamps, counts).tofile(f)
+            os.replace(tmp_path, cache_path)
+            self.unwritable.discard(cache_path)
+        except OSError as e:
+            self._write_failed(cache_path, e)
+        
+        return timestamps, counts, offset
+    
+    def _extend(self, file_path: Path, cache_path: Path, stat: os.stat_result,
+                offset: int, n_records: int) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Append records parsed from the bytes after offset"""
+        old_timestamps, old_counts = self._read_records(cache_path, n_records)
+        new_timestamps, new_counts, new_offset = self._parse(file_path, offset)
+        
+        try:
+            with open(cache_path, 'r+b') as f:
+                # Records first, header last: a crash in between leaves the old header valid
+                f.seek(HEADER.size + n_records * RECORD_DTYPE.itemsize)
+                f.truncate()
+                self._pack(new_timestamps, new_counts).tofile(f)
+                f.flush()
+                f.seek(0)
+                f.write(HEADER.pack(MAGIC, VERSION, stat.st_size, stat.st_mtime_ns,
+                                    stat.st_ino, new_offset, n_records + len(new_timestamps)))
+        except OSError as e:
+            self._write_failed(cache_path, e)
+        
+        return (np.concatenate((old_timestamps, new_timestamps)),
+                np.concatenate((old_counts, new_counts)), new_offset)
+    
+    def invalidate(self, file_path: Path):
+        """Delete the cache file of a log file"""
+        try:
+            self.cache_path(file_path).unlink()
+        except FileNotFoundError:
+            pass
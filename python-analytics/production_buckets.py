@@ -0,0 +1,171 @@
+"""
+Per-minute production buckets
+Counter increments are pre-aggregated per minute, so any trailing window
+(1/10/60 minutes, shift-to-date) is a sum over at most HISTORY_WINDOW/60 buckets
+"""
+from typing import Tuple
+import numpy as np
+
+
+MINUTE_MS = 60000
+
+# Trailing windows reported in DeviceMetrics (minutes)
+LAST_HOUR = 60
+LAST_10MIN = 10
+
+
+def window_start(minutes: int, now_ms: int) -> int:
+    """Epoch ms where a trailing window of whole minutes (current one included) starts"""
+    return (now_ms // MINUTE_MS - minutes + 1) * MINUTE_MS
+
+
+def count_increments(counts: np.ndarray, previous: int = None) -> np.ndarray:
+    """
+    Production of every reading since the one before it
+    
+    A counter that goes down was reset (device restart / new shift) and
+    restarted from 0, so the reading itself is the production since the reset.
+    
+    Args:
+        counts: Cumulative counts in time order
+        previous: Count of the reading before counts[0] (None: first reading produces 0)
+    
+    Returns:
+        int64 array with one increment per reading
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    if len(counts) == 0:
+        return np.zeros(0, dtype=np.int64)
+    
+    first = counts[0] if previous is None else previous
+    increments = np.diff(counts, prepend=first)
+    resets = increments < 0
+    increments[resets] = counts[resets]
+    return increments
+
+
+def produced_since(timestamps: np.ndarray, counts: np.ndarray, since_ms) -> np.ndarray:
+    """
+    Production at or after since_ms, straight from raw readings
+    (for code paths that already hold the whole file; same totals as
+    MinuteBuckets when since_ms comes from window_start)
+    
+    Args:
+        timestamps: int64 epoch ms in time order
+        counts: Cumulative counts
+        since_ms: Window start (scalar or array of window starts)
+    
+    Returns:
+        Production per window start (int64, same shape as since_ms)
+    """
+    increments = count_increments(counts)
+    # Running total after each reading, so every window is one lookup
+    totals = np.concatenate(([0], np.cumsum(increments)))
+    first = np.searchsorted(timestamps, since_ms, side='left')
+    return totals[-1] - totals[first]
+
+
+class MinuteBuckets:
+    """Ring of per-minute production totals covering the last `capacity` minutes"""
+    
+    def __init__(self, capacity: int = 60):
+        """
+        Args:
+            capacity: Number of minutes kept (HISTORY_WINDOW / 60)
+        """
+        self.capacity = max(capacity, 1)
+        # Slot m % capacity holds minute m; a stale minute id means the slot is empty
+        self.minutes = np.full(self.capacity, -1, dtype=np.int64)
+        self.produced = np.zeros(self.capacity, dtype=np.int64)
+        self.last_timestamp = None
+        self.last_count = None
+    
+    def push(self, timestamp_ms: int, count: int):
+        """
+        Add one reading (O(1))
+        Readings older than the newest one are ignored; their production is
+        already included in the newer cumulative count
+        """
+        if self.last_timestamp is not None and timestamp_ms < self.last_timestamp:
+            return
+        
+        if self.last_count is None:
+            increment = 0
+        elif count < self.last_count:
+            increment = count  # Counter reset
+        else:
+            increment = count - self.last_count
+        
+        self._add(timestamp_ms // MINUTE_MS, increment)
+        self.last_timestamp = timestamp_ms
+        self.last_count = count
+    
+    def extend(self, timestamps: np.ndarray, counts: np.ndarray):
+        """
+        Add many readings at once (e.g. the history window on cold start)
+        Same result as calling push for each reading
+        
+        Args:
+            timestamps: int64 epoch ms in time order
+            counts: Cumulative counts
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.int64)
+        if self.last_timestamp is not None:
+            newer = timestamps >= self.last_timestamp
+            timestamps, counts = timestamps[newer], counts[newer]
+        if len(timestamps) == 0:
+            return
+        
+        increments = count_increments(counts, self.last_count)
+        
+        # Only minutes that can still be inside the ring
+        minutes = timestamps // MINUTE_MS
+        recent = minutes > minutes[-1] - self.capacity
+        unique, codes = np.unique(minutes[recent], return_inverse=True)
+        sums = np.bincount(codes, weights=increments[recent], minlength=len(unique))
+        for minute, produced in zip(unique.tolist(), sums.astype(np.int64).tolist()):
+            self._add(minute, produced)
+        
+        self.last_timestamp = int(timestamps[-1])
+        self.last_count = int(counts[-1])
+    
+    def _add(self, minute: int, produced: int):
+        slot = minute % self.capacity
+        if self.minutes[slot] != minute:
+            if self.minutes[slot] > minute:
+                return  # Older than the ring
+            self.minutes[slot] = minute
+            self.produced[slot] = 0
+        self.produced[slot] += produced
+    
+    def total(self, minutes: int, now_ms: int) -> int:
+        """
+        Production in the trailing window of `minutes` minutes ending at now_ms
+        (whole minutes, the current one included; clamped to the ring)
+        """
+        return self.total_since(window_start(minutes, now_ms), now_ms)
+    
+    def total_since(self, start_ms: int, now_ms: int) -> int:
+        """
+        Production from the minute of start_ms up to now_ms (e.g. shift-to-date)
+        Starts older than the ring are clamped to its oldest minute
+        """
+        now_minute = now_ms // MINUTE_MS
+        first = max(start_ms // MINUTE_MS, now_minute - self.capacity + 1)
+        return self._sum_between(first, now_minute)
+    
+    def totals(self, now_ms: int) -> Tuple[int, int]:
+        """(last hour, last 10 minutes) production for DeviceMetrics"""
+        return self.total(LAST_HOUR, now_ms), self.total(LAST_10MIN, now_ms)
+    
+    def _sum_between(self, first_minute: int, last_minute: int) -> int:
+        inside = (self.minutes >= first_minute) & (self.minutes <= last_minute)
+        return int(self.produced[inside].sum())
+    
+    def clear(self):
+        """Forget all buckets"""
+        self.minutes.fill(-1)
+        self.produced.fill(0)
+        self.last_timestamp = None
+        self.last_count = None
@@ -0,0 +1,342 @@
+"""
+Accelerated replay of a recorded day
+Readings of historical log files (or the telemetryLogs of the NestJS hourly
+backups) are appended to a scratch log tree tick by tick on a virtual clock,
+and every tick runs the service's own discover/parse/calculate/publish path.
+A day replays in minutes: a reproducible load test of the hot loop and a way
+to backfill the metrics history (METRICS_HISTORY)
+
+Usage:
+    python analytics_service.py --replay 2025-11-19 [--speed 100x|max] [--source logs|backups]
+"""
+import argparse
+import contextlib
+import io
+import json
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from log_parser import LogParser
+import config
+
+
+# NestJS backups: backups/production/{date}/backup_{timestamp}.json
+BACKUP_DIR = config.BASE_DIR.parent / 'tile-production-management' / 'backups' / 'production'
+
+
+class VirtualClock:
+    """Replay time: advanced by the replay loop, read by the calculator"""
+    
+    def __init__(self, now_ms: int):
+        self.now_ms = now_ms
+    
+    def advance(self, milliseconds: int):
+        self.now_ms += milliseconds
+    
+    def __call__(self) -> datetime:
+        return datetime.fromtimestamp(self.now_ms / 1000, tz=timezone.utc)
+
+
+@dataclass
+class ReplayFile:
+    """Readings of one device log file, appended as the virtual clock passes them"""
+    relative_path: Path
+    # Epoch ms at which each line is due: running maximum of its timestamps,
+    # so out-of-order lines are written in file order
+    due: np.ndarray
+    lines: List[str]
+    written: int = 0
+    
+    def __len__(self) -> int:
+        return len(self.lines)
+
+
+def replay_file(relative_path: Path, timestamps: List[str], lines: List[str]) -> ReplayFile:
+    """ReplayFile from ISO 8601 'Z' timestamps and the matching log lines"""
+    stamps = np.array([stamp.rstrip('Z') for stamp in timestamps], dtype='datetime64[ms]')
+    due = np.maximum.accumulate(stamps.astype(np.int64))
+    return ReplayFile(relative_path, due, lines)
+
+
+def load_log_files(log_dir: Path, date_str: str) -> List[ReplayFile]:
+    """
+    Readings of every log file of one day (rotated files included)
+    
+    Args:
+        log_dir: Root log directory
+        date_str: Day to replay (YYYY-MM-DD)
+    """
+    files = []
+    day_dir = log_dir / date_str
+    for file_path in sorted(day_dir.rglob('*.txt')):
+        timestamps, lines = [], []
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                match = LogParser.LOG_PATTERN.match(line.strip())
+                if match:
+                    timestamps.append(match.group(1))
+                    lines.append(f'[{match.group(1)}] Count: {match.group(2)}\n')
+        if lines:
+            files.append(replay_file(file_path.relative_to(log_dir), timestamps, lines))
+    return files
+
+
+def load_backups(backup_dir: Path, date_str: str, production_line: str,
+                 brick_type: str) -> List[ReplayFile]:
+    """
+    Readings of one day from the telemetryLogs of the hourly NestJS backups
+    
+    Backups overlap and a backup taken after midnight holds the previous day's
+    last readings, so the day's directory and the next one are read and records
+    are de-duplicated by ID. Telemetry records carry no production line or
+    brick type; files are laid out like the MQTT service writes them.
+    
+    Args:
+        backup_dir: backups/production directory
+        date_str: Day to replay (YYYY-MM-DD, UTC like the log directories)
+        production_line: Line of every device (the MQTT service's default is DC-01)
+        brick_type: Brick type directory of every device
+    """
+    next_day = (datetime.strptime(date_str, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    records: Dict[str, dict] = {}
+    for day in (date_str, next_day):
+        for backup in sorted((backup_dir / day).glob('backup_*.json')):
+            with open(backup, 'r', encoding='utf-8') as f:
+                data = json.load(f).get('data', {})
+            for record in data.get('telemetryLogs') or []:
+                if record.get('recordedAt', '').startswith(date_str) and record.get('count') is not None:
+                    records[record['id']] = record
+    
+    by_device: Dict[str, List[dict]] = {}
+    for record in records.values():
+        by_device.setdefault(record['deviceId'], []).append(record)
+    
+    files = []
+    for device_id, device_records in sorted(by_device.items()):
+        device_records.sort(key=lambda r: r['recordedAt'])
+        # SAU-ME-01 -> sau-me (mqtt.service.ts writeDeviceLog)
+        parts = device_id.split('-')
+        position = '-'.join(parts[:-1]).lower() if len(parts) >= 2 else device_id.lower()
+        relative_path = (Path(date_str) / production_line / brick_type / position /
+                         f'{device_id.lower()}.txt')
+        timestamps = [r['recordedAt'] for r in device_records]
+        lines = [f"[{r['recordedAt']}] Count: {r['count']}\n" for r in device_records]
+        files.append(replay_file(relative_path, timestamps, lines))
+    return files
+
+
+def parse_speed(value: str) -> float:
+    """'100x' / '100' -> 100.0, 'max' -> inf (no sleeping between ticks)"""
+    value = value.strip().lower()
+    if value == 'max':
+        return float('inf')
+    speed = float(value.rstrip('x'))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError(f"speed must be positive, got '{value}'")
+    return speed
+
+
+class Replayer:
+    """Drives an AnalyticsService over one recorded day on a virtual clock"""
+    
+    def __init__(self, service, files: List[ReplayFile], log_dir: Path, date: datetime,
+                 interval: float, speed: float, publish: bool = False, verbose: bool = False):
+        """
+        Args:
+            service: AnalyticsService reading log_dir
+            files: Readings to replay
+            log_dir: Scratch log directory the readings are appended to
+            date: Day being replayed
+            interval: Virtual seconds per tick (CALCULATION_INTERVAL)
+            speed: Virtual seconds per wall second (inf = as fast as possible)
+            publish: Publish every tick to the live Redis channels / keys
+                     (default: calculate / history only)
+            verbose: Keep the service's per-tick output
+        """
+        self.service = service
+        self.files = files
+        self.log_dir = log_dir
+        self.date = date
+        self.interval_ms = int(interval * 1000)
+        self.speed = speed
+        self.publish = publish
+        self.verbose = verbose
+        
+        first = min(int(f.due[0]) for f in files)
+        # First tick on the interval boundary after the first reading
+        self.start_ms = first - first % self.interval_ms + self.interval_ms
+        self.end_ms = max(int(f.due[-1]) for f in files) + self.interval_ms
+        self.clock = VirtualClock(self.start_ms)
+        service.calculator.clock = self.clock
+        
+        self.tick_seconds: List[float] = []
+        self.publish_seconds: List[float] = []
+        self.readings = 0
+    
+    def feed(self) -> int:
+        """Append every reading due at the virtual time; returns the number of lines"""
+        now_ms = self.clock.now_ms
+        appended = 0
+        for replay in self.files:
+            if replay.written == len(replay):
+                continue
+            end = int(np.searchsorted(replay.due, now_ms, side='right'))
+            if end == replay.written:
+                continue
+            file_path = self.log_dir / replay.relative_path
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(file_path, 'a', encoding='utf-8') as f:
+                f.write(''.join(replay.lines[replay.written:end]))
+            appended += end - replay.written
+            replay.written = end
+        return appended
+    
+    def tick(self):
+        """One calculation tick at the current virtual time"""
+        start_time = time.perf_counter()
+        self.readings += self.feed()
+        
+        output = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            line_metrics = self.service.calculate_all_metrics(self.date)
+            if line_metrics and self.publish:
+                publish_start = time.perf_counter()
+                self.service.publish_metrics(line_metrics)
+                self.publish_seconds.append(time.perf_counter() - publish_start)
+        
+        elapsed = time.perf_counter() - start_time
+        self.tick_seconds.append(elapsed)
+        return line_metrics, elapsed
+    
+    def run(self, progress_every: float = 3600):
+        """
+        Replay until the last reading has been calculated
+        
+        Args:
+            progress_every: Virtual seconds between progress lines
+        """
+        budget = self.interval_ms / 1000 / self.speed
+        next_progress = self.start_ms + int(progress_every * 1000)
+        wall_start = time.perf_counter()
+        scheduled = wall_start
+        
+        while self.clock.now_ms <= self.end_ms:
+            lag = max(0.0, time.perf_counter() - scheduled)
+            line_metrics, elapsed = self.tick()
+            self.service.instrumentation.end_tick(elapsed, budget, lag)
+            
+            if self.clock.now_ms >= next_progress:
+                wall = time.perf_counter() - wall_start
+                devices = sum(m.total_devices for m in line_metrics.values())
+                print(f"⏩ {self.clock().strftime('%H:%M:%S')} | {devices} devices | "
+                      f"{self.readings:,} readings | {len(self.tick_seconds):,} ticks in {wall:.1f}s")
+                next_progress += int(progress_every * 1000)
+            
+            self.clock.advance(self.interval_ms)
+            scheduled += budget
+            sleep_time = scheduled - time.perf_counter()
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+        
+        self.service.close_history()
+        self.report(time.perf_counter() - wall_start)
+    
+    def report(self, wall: float):
+        """Throughput of the replay"""
+        virtual = (self.end_ms - self.start_ms) / 1000
+        ticks = len(self.tick_seconds)
+        tick_ms = np.array(self.tick_seconds) * 1000
+        p50, p99 = np.percentile(tick_ms, [50, 99])
+        
+        print(f"\n📼 Replayed {self.date.strftime('%Y-%m-%d')}: {virtual / 3600:.2f} h in "
+              f"{wall:.1f}s ({virtual / wall:,.0f}x real time)")
+        print(f"   Readings: {self.readings:,} ({self.readings / wall:,.0f}/s) "
+              f"from {len(self.files)} files")
+        print(f"   Ticks: {ticks:,} ({ticks / wall:,.1f}/s), p50 {p50:.2f} ms, "
+              f"p99 {p99:.2f} ms, max {tick_ms.max():.2f} ms")
+        
+        stages = self.service.instrumentation.stage_histograms
+        timings = ', '.join(f'{name} {h.sum / h.count * 1000:.2f}'
+                            for name, h in stages.items() if h.count)
+        print(f"   Stage avg ms/tick: {timings}")
+        
+        overruns = self.service.instrumentation.counters['tick_overruns_total']
+        if self.speed != float('inf'):
+            print(f"   Ticks slower than {self.speed:g}x allows: {overruns:g}")
+        if self.publish_seconds:
+            publish_ms = np.array(self.publish_seconds) * 1000
+            print(f"   Publish: p50 {np.percentile(publish_ms, 50):.2f} ms, "
+                  f"p99 {np.percentile(publish_ms, 99):.2f} ms")
+
+
+def main(argv: Optional[List[str]] = None, service_class=None):
+    """
+    Entry point of analytics_service.py --replay
+    
+    Args:
+        argv: Command line arguments (default: sys.argv[1:])
+        service_class: AnalyticsService (or a subclass) to replay through
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--replay', required=True, metavar='DATE', help='day to replay (YYYY-MM-DD)')
+    parser.add_argument('--speed', type=parse_speed, default=parse_speed('100x'),
+                        help="virtual seconds per wall second, e.g. 100x, or 'max'")
+    parser.add_argument('--source', choices=('logs', 'backups'), default='logs')
+    parser.add_argument('--log-dir', type=Path, default=config.LOG_DIR,
+                        help='recorded logs (--source logs)')
+    parser.add_argument('--backup-dir', type=Path, default=BACKUP_DIR,
+                        help='NestJS backups/production directory (--source backups)')
+    parser.add_argument('--line', default='DC-01', help='production line of backup telemetry')
+    parser.add_argument('--brick-type', default='unknown', help='brick type of backup telemetry')
+    parser.add_argument('--interval', type=float, default=config.CALCULATION_INTERVAL,
+                        help='virtual seconds per tick')
+    parser.add_argument('--workdir', type=Path, help='scratch log tree (default: temporary)')
+    parser.add_argument('--publish', action='store_true',
+                        help='publish to the live analytics:* channels and metrics:* keys '
+                             '(overwrites the running plant\'s dashboard state)')
+    parser.add_argument('--verbose', action='store_true', help="keep the service's per-tick output")
+    args, _ = parser.parse_known_args(argv)
+    
+    date = datetime.strptime(args.replay, '%Y-%m-%d')
+    if args.source == 'logs':
+        files = load_log_files(args.log_dir, args.replay)
+        source = args.log_dir / args.replay
+    else:
+        files = load_backups(args.backup_dir, args.replay, args.line, args.brick_type)
+        source = args.backup_dir
+    if not files:
+        print(f"⚠️  Nothing to replay for {args.replay} in {source}")
+        return
+    
+    with contextlib.ExitStack() as stack:
+        workdir = args.workdir
+        if workdir is None:
+            workdir = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix='analytics-replay-')))
+        
+        # The service reads the scratch tree; one process replays every line
+        config.LOG_DIR = workdir
+        config.SHARDING_ENABLED = False
+        if service_class is None:
+            from analytics_service import AnalyticsService as service_class
+        service = service_class(live_mode=False)
+        
+        replayer = Replayer(service, files, workdir, date, args.interval, args.speed,
+                            publish=args.publish, verbose=args.verbose)
+        readings = sum(len(f) for f in files)
+        print(f"\n📼 Replaying {readings:,} readings of {len(files)} files from {source} "
+              f"at {'max' if args.speed == float('inf') else f'{args.speed:g}x'} speed, "
+              f"{args.interval:g}s ticks")
+        
+        try:
+            replayer.run()
+        except KeyboardInterrupt:
+            print("\n👋 Replay interrupted")
+            service.close_history()
+
+
+if __name__ == '__main__':
+    main()
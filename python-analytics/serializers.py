@@ -0,0 +1,116 @@
+"""
+Payload serializers for published metrics
+Metrics dicts are built once per tick (timestamps left as datetime objects)
+and encoded by every configured serializer. Non-JSON encodings are published
+under names carrying their content-type marker, e.g. analytics:msgpack:line:DC-01,
+so JSON consumers keep their channels and keys unchanged
+"""
+import json
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Iterable, List, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _iso_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _epoch_ms_default(value):
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    raise TypeError(f'{type(value).__name__} is not msgpack serializable')
+
+
+class Serializer(ABC):
+    """Encodes one payload dict"""
+    
+    name = ''
+    content_type = ''
+    # Segment inserted after the first one of channel / key names ('' = names unchanged)
+    marker = ''
+    
+    @abstractmethod
+    def dumps(self, payload: dict) -> Union[str, bytes]:
+        """Encoded payload (str for JSON text, bytes otherwise)"""
+    
+    def mark(self, name: str) -> str:
+        """Channel / key / stream name for this encoding"""
+        if not self.marker:
+            return name
+        namespace, _, rest = name.partition(':')
+        return f'{namespace}:{self.marker}:{rest}' if rest else f'{namespace}:{self.marker}'
+
+
+class JsonSerializer(Serializer):
+    """Standard library json, ISO 8601 timestamps (the original format)"""
+    
+    name = 'json'
+    content_type = 'application/json'
+    
+    def dumps(self, payload: dict) -> str:
+        return json.dumps(payload, default=_iso_default)
+
+
+class OrjsonSerializer(Serializer):
+    """orjson: same JSON document (datetimes as ISO 8601), encoded in C"""
+    
+    name = 'orjson'
+    content_type = 'application/json'
+    
+    def dumps(self, payload: dict) -> bytes:
+        # Calculator results may hold NumPy scalars (float64 subclasses float for json)
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+class MsgpackSerializer(Serializer):
+    """MessagePack, timestamps as epoch milliseconds"""
+    
+    name = 'msgpack'
+    content_type = 'application/msgpack'
+    marker = 'msgpack'
+    
+    def dumps(self, payload: dict) -> bytes:
+        return msgpack.packb(payload, default=_epoch_ms_default)
+
+
+SERIALIZERS = {cls.name: cls for cls in (JsonSerializer, OrjsonSerializer, MsgpackSerializer)}
+
+# Module backing each optional serializer (pip package of the same name)
+REQUIRED_MODULES = {'orjson': orjson, 'msgpack': msgpack}
+
+
+def get_serializers(names: Iterable[str]) -> List[Serializer]:
+    """
+    Serializers for a list of names (e.g. from SERIALIZERS=json,msgpack)
+    
+    Raises:
+        ValueError: Unknown name, missing package, or two encoders of one content type
+    """
+    serializers = []
+    for name in (n.strip().lower() for n in names):
+        if not name:
+            continue
+        if name not in SERIALIZERS:
+            raise ValueError(f"Unknown serializer '{name}' (choose from {', '.join(SERIALIZERS)})")
+        if name in REQUIRED_MODULES and REQUIRED_MODULES[name] is None:
+            raise ValueError(f"Serializer '{name}' needs the {name} package (pip install {name})")
+        
+        serializer = SERIALIZERS[name]()
+        if any(s.content_type == serializer.content_type for s in serializers):
+            raise ValueError(f"Serializer '{name}' publishes {serializer.content_type} "
+                             f"on the same names as another configured serializer")
+        serializers.append(serializer)
+    
+    return serializers or [JsonSerializer()]
@@ -0,0 +1,320 @@
+"""
+Sharded analytics workers
+Production lines are split over worker processes by consistent hashing of the
+live workers; ownership is held as Redis leases and moves when a worker joins,
+leaves or stops renewing. One worker also holds the aggregate lease and merges
+the per-line totals of all shards into analytics:aggregate
+"""
+import bisect
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+from log_parser import LogParser
+from models import LineMetrics
+
+
+# Sorted set: worker ID -> lease expiry (epoch ms)
+WORKERS_KEY = 'analytics:shard:workers'
+
+# String holding the worker ID that owns one production line
+LEASE_KEY = 'analytics:shard:lease:{}'
+
+# Hash: production line -> totals of that line, read by the aggregate owner
+SUMMARY_KEY = 'metrics:shard:lines'
+
+# Ring key (and lease) of the worker that publishes analytics:aggregate
+AGGREGATE_SHARD = '__aggregate__'
+
+# Take the lease if it is free or already ours, extending it
+ACQUIRE_LEASE = """
+local owner = redis.call('get', KEYS[1])
+if owner == false or owner == ARGV[1] then
+    redis.call('set', KEYS[1], ARGV[1], 'px', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Drop the lease only if we still hold it
+RELEASE_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Drop the totals of lines (ARGV[2..]) only if worker ARGV[1] still wrote them last
+DROP_SUMMARIES = """
+local dropped = 0
+for i = 2, #ARGV do
+    local data = redis.call('hget', KEYS[1], ARGV[i])
+    if data and cjson.decode(data).worker == ARGV[1] then
+        dropped = dropped + redis.call('hdel', KEYS[1], ARGV[i])
+    end
+end
+return dropped
+"""
+
+
+def ring_hash(key: str) -> int:
+    """Stable 64-bit hash (Python's hash() is salted per process)"""
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring: adding or removing a worker only moves that worker's keys"""
+    
+    def __init__(self, members: Iterable[str] = (), replicas: int = 64):
+        """
+        Args:
+            members: Worker IDs
+            replicas: Points per worker on the ring (more = more even split)
+        """
+        self.members = frozenset(members)
+        points = sorted((ring_hash(f'{member}#{i}'), member)
+                        for member in self.members for i in range(replicas))
+        self.hashes = [point for point, _ in points]
+        self.owners = [member for _, member in points]
+    
+    def owner(self, key: str) -> Optional[str]:
+        """Worker responsible for key (None for an empty ring)"""
+        if not self.hashes:
+            return None
+        i = bisect.bisect(self.hashes, ring_hash(key)) % len(self.hashes)
+        return self.owners[i]
+
+
+class ShardCoordinator:
+    """
+    Lease-based ownership of production lines for one worker
+    
+    A heartbeat thread renews the worker's membership and line leases every
+    third of the lease TTL. A line moves only after its previous owner released
+    it (on its next heartbeat) or the lease expired (the owner died). Leases are
+    only released while no publish is in flight (publish_lock), and a worker
+    stops publishing a third of the TTL before its leases would expire, so a
+    line is not published by two workers at once unless a publish stalls for
+    longer than that.
+    """
+    
+    def __init__(self, redis_client, worker_id: str, lease_ttl: float = 30,
+                 replicas: int = 64):
+        """
+        Args:
+            redis_client: Blocking Redis client (decode_responses=True)
+            worker_id: Unique ID of this worker
+            lease_ttl: Seconds a lease survives without renewal
+            replicas: Ring points per worker
+        """
+        self.redis_client = redis_client
+        self.worker_id = worker_id
+        self.lease_ttl = lease_ttl
+        self.replicas = replicas
+        
+        self.ring = HashRing((), replicas)
+        self.workers: List[str] = []
+        # Production lines seen in today's log directory / lines whose lease we hold
+        self.lines: Set[str] = set()
+        self.owned: Set[str] = set()
+        # Line -> totals published by the other shards (from the last heartbeat)
+        self.summaries: Dict[str, dict] = {}
+        # Lines whose totals this worker wrote to SUMMARY_KEY on its last publish
+        self.reported: Set[str] = set()
+        # Monotonic time until which the held leases are valid
+        self.valid_until = 0.0
+        
+        self.lock = threading.Lock()
+        # Held from building a publish until it was executed; leases are released under it
+        self.publish_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        
+        self.acquire_script = redis_client.register_script(ACQUIRE_LEASE)
+        self.release_script = redis_client.register_script(RELEASE_LEASE)
+    
+    def start(self):
+        """Join the ring and start renewing leases"""
+        if self.thread is not None:
+            return
+        try:
+            self.heartbeat()
+        except Exception as e:
+            print(f"❌ Shard heartbeat failed: {e}")
+        
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._loop, name='shard-heartbeat', daemon=True)
+        self.thread.start()
+        print(f"🧩 Worker {self.worker_id}: {len(self.workers)} workers, "
+              f"lease TTL {self.lease_ttl:.0f}s")
+    
+    def stop(self):
+        """Leave the ring: release every lease so the other workers take over at once"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        
+        with self.lock, self.publish_lock:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for line in self.owned:
+                    self.release_script(keys=[LEASE_KEY.format(line)], args=[self.worker_id],
+                                        client=pipe)
+                pipe.zrem(WORKERS_KEY, self.worker_id)
+                pipe.execute()
+            except Exception as e:
+                print(f"❌ Error releasing shard leases: {e}")
+            self.owned = set()
+    
+    def _loop(self):
+        while not self.stop_event.wait(self.lease_ttl / 3):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"❌ Shard heartbeat failed: {e}")
+            
+            # Leases not renewed in time have expired in Redis: stop acting on them
+            if time.monotonic() > self.valid_until and self.owned:
+                print(f"⚠️  Shard leases expired, dropping {len(self.owned)} production lines")
+                self.owned = set()
+    
+    def heartbeat(self):
+        """Renew membership, rebuild the ring and acquire / release line leases"""
+        with self.lock:
+            started = time.monotonic()
+            now_ms = int(time.time() * 1000)
+            ttl_ms = int(self.lease_ttl * 1000)
+            
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.zadd(WORKERS_KEY, {self.worker_id: now_ms + ttl_ms})
+            pipe.zremrangebyscore(WORKERS_KEY, '-inf', now_ms)
+            pipe.zrange(WORKERS_KEY, 0, -1)
+            pipe.hgetall(SUMMARY_KEY)
+            _, _, workers, summaries = pipe.execute()
+            
+            if set(workers) != self.ring.members:
+                if self.ring.members:
+                    print(f"🧩 Rebalancing: {len(self.ring.members)} -> {len(workers)} workers")
+                self.ring = HashRing(workers, self.replicas)
+            self.workers = sorted(workers)
+            
+            wanted = sorted(line for line in self.lines | {AGGREGATE_SHARD}
+                            if self.ring.owner(line) == self.worker_id)
+            released = sorted(self.owned - set(wanted))
+            
+            pipe = self.redis_client.pipeline(transaction=False)
+            for line in wanted:
+                self.acquire_script(keys=[LEASE_KEY.format(line)], args=[self.worker_id, ttl_ms],
+                                    client=pipe)
+            for line in released:
+                self.release_script(keys=[LEASE_KEY.format(line)], args=[self.worker_id],
+                                    client=pipe)
+            
+            # Totals of dead workers' lines no longer count towards the aggregate
+            live = set(workers)
+            parsed = {line: json.loads(data) for line, data in summaries.items()}
+            stale = [line for line, summary in parsed.items() if summary.get('worker') not in live]
+            if stale and AGGREGATE_SHARD in self.owned:
+                pipe.hdel(SUMMARY_KEY, *stale)
+            
+            # Released lines must not be in a publish that is still being sent
+            with self.publish_lock:
+                results = pipe.execute()[:len(wanted)]
+                self.owned = {line for line, acquired in zip(wanted, results) if acquired}
+            self.summaries = {line: summary for line, summary in parsed.items() if line not in stale}
+            self.valid_until = started + self.lease_ttl
+    
+    def refresh_summaries(self):
+        """Re-read the other shards' line totals (dead workers' lines are left out)"""
+        summaries = self.redis_client.hgetall(SUMMARY_KEY)
+        live = set(self.workers)
+        parsed = {line: json.loads(data) for line, data in summaries.items()}
+        self.summaries = {line: summary for line, summary in parsed.items()
+                          if summary.get('worker') in live}
+    
+    def assign(self, log_files: List[Path]) -> List[Path]:
+        """
+        Files of the production lines owned by this worker
+        
+        Args:
+            log_files: All device log files of the day
+        """
+        by_line: Dict[str, List[Path]] = {}
+        for log_file in log_files:
+            line = self.line_of(log_file)
+            if line is not None:
+                by_line.setdefault(line, []).append(log_file)
+        
+        try:
+            if set(by_line) != self.lines:
+                # New lines get an owner now rather than at the next heartbeat
+                self.lines = set(by_line)
+                self.heartbeat()
+            elif self.publishes_aggregate:
+                # The aggregate merges the other shards' latest totals, not the heartbeat's
+                self.refresh_summaries()
+        except Exception as e:
+            print(f"❌ Shard heartbeat failed: {e}")
+        
+        owned = self.owned
+        return [log_file for line, files in by_line.items() if line in owned for log_file in files]
+    
+    @staticmethod
+    def line_of(file_path: Path) -> Optional[str]:
+        """Production line of a log file path"""
+        metadata = LogParser.extract_metadata(Path(file_path))
+        return metadata[0] if metadata else None
+    
+    def owns(self, production_line: str) -> bool:
+        """Whether the line is leased, with a third of the TTL left as safety margin"""
+        return (production_line in self.owned
+                and time.monotonic() < self.valid_until - self.lease_ttl / 3)
+    
+    @property
+    def owned_lines(self) -> Set[str]:
+        """Production lines leased by this worker"""
+        return self.owned - {AGGREGATE_SHARD}
+    
+    @property
+    def publishes_aggregate(self) -> bool:
+        """Whether this worker merges all shards into analytics:aggregate"""
+        return self.owns(AGGREGATE_SHARD)
+    
+    def summary_commands(self, line_metrics: Dict[str, LineMetrics]) -> List[tuple]:
+        """
+        HSET of this shard's line totals, and removal of the lines it reported
+        before but no longer has (gone for the day, stopped logging, moved away)
+        """
+        commands = []
+        if line_metrics:
+            mapping = {
+                line_name: json.dumps({
+                    'runningDevices': metrics.running_devices,
+                    'totalProducedToday': metrics.total_produced_today,
+                    'worker': self.worker_id,
+                })
+                for line_name, metrics in line_metrics.items()
+            }
+            commands.append(('hset', SUMMARY_KEY, None, None, mapping))
+        
+        gone = sorted(self.reported - set(line_metrics))
+        if gone:
+            # Not if the new owner of a moved line already wrote it
+            commands.append(('eval', DROP_SUMMARIES, 1, SUMMARY_KEY, self.worker_id, *gone))
+        self.reported = set(line_metrics)
+        return commands
+    
+    def merged_totals(self, line_metrics: Dict[str, LineMetrics]) -> Dict[str, dict]:
+        """Line -> totals over all shards; local results replace the published ones"""
+        # Lines this worker reported earlier but no longer has are not carried over
+        totals = {line: summary for line, summary in self.summaries.items()
+                  if summary.get('worker') != self.worker_id}
+        for line_name, metrics in line_metrics.items():
+            totals[line_name] = {
+                'runningDevices': metrics.running_devices,
+                'totalProducedToday': metrics.total_produced_today,
+            }
+        return totals
@@ -0,0 +1,257 @@
+"""
+Incremental tail cache for device log files
+Keeps the parsed tail of each file in memory and only reads appended bytes
+"""
+import os
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+from models import LogEntry
+from log_parser import LogParser
+from log_reader import MappedLogFile
+from device_accumulator import DeviceAccumulator, to_epoch_ms
+from production_buckets import MinuteBuckets, window_start
+
+
+def read_last_lines(f, file_size: int, max_lines: int,
+                    block_size: int = 4096) -> Tuple[List[bytes], int]:
+    """
+    Read the last complete lines of a binary file by seeking backwards from EOF
+    
+    A trailing line without newline is treated as still being written and is
+    not returned.
+    
+    Args:
+        f: File object opened in binary mode
+        file_size: Current size of the file
+        max_lines: Number of lines to return
+        block_size: Size of each backwards read
+    
+    Returns:
+        Tuple of (lines without newline, offset right after the last complete line)
+    """
+    buffer = b''
+    pos = file_size
+    end_offset = None
+    
+    while pos > 0:
+        read_size = min(block_size, pos)
+        pos -= read_size
+        f.seek(pos)
+        buffer = f.read(read_size) + buffer
+        
+        if end_offset is None:
+            last_newline = buffer.rfind(b'\n')
+            if last_newline == -1:
+                continue
+            # Drop the partial line at EOF (if any)
+            end_offset = pos + last_newline + 1
+            buffer = buffer[:last_newline + 1]
+        
+        # One extra newline is needed to know the oldest line is complete
+        if buffer.count(b'\n') > max_lines:
+            break
+    
+    if end_offset is None:
+        return [], 0
+    
+    lines = buffer.splitlines()
+    return lines[-max_lines:], end_offset
+
+
+@dataclass
+class _TailState:
+    """Per-file read state"""
+    offset: int = 0
+    # (device, inode) of the file read: a rotated / recreated file is read cold
+    identity: Tuple[int, int] = (0, 0)
+    entries: Deque[LogEntry] = field(default_factory=deque)
+    accumulator: DeviceAccumulator = field(default_factory=DeviceAccumulator)
+
+
+class TailCache:
+    """Cache the last N parsed entries of each log file"""
+    
+    def __init__(self, log_parser: LogParser, tail_size: int = 10,
+                 block_size: int = 4096, history_window: int = 3600):
+        """
+        Args:
+            log_parser: Parser used to turn raw lines into LogEntry objects
+            tail_size: Number of most recent entries to keep per file
+            block_size: Block size for backwards reads on cold start
+            history_window: Seconds of per-minute production kept per file
+        """
+        self.log_parser = log_parser
+        self.tail_size = tail_size
+        self.bucket_minutes = max(history_window // 60, 1)
+        self.block_size = block_size
+        self.states: Dict[str, _TailState] = {}
+        self.lock = threading.Lock()
+        
+        # Cumulative reads (for instrumentation)
+        self.files_read = 0
+        self.bytes_read = 0
+    
+    def get_entries(self, file_path: Path) -> List[LogEntry]:
+        """
+        Get the latest entries of a file, reading only bytes appended since
+        the previous call
+        
+        Args:
+            file_path: Path to log file
+        
+        Returns:
+            Up to tail_size most recent LogEntry objects (oldest first)
+        """
+        state = self._refresh(file_path)
+        return list(state.entries) if state is not None else []
+    
+    def get_accumulator(self, file_path: Path) -> Optional[DeviceAccumulator]:
+        """
+        Get the streaming metrics state of a file, after feeding it the
+        entries appended since the previous call
+        
+        Args:
+            file_path: Path to log file
+        
+        Returns:
+            DeviceAccumulator over the last tail_size entries, or None if unreadable
+        """
+        state = self._refresh(file_path)
+        return state.accumulator if state is not None else None
+    
+    def get_tail(self, file_path: Path) -> Tuple[Optional[DeviceAccumulator], List[LogEntry]]:
+        """
+        Both views of a file after a single refresh (the file is read once)
+        
+        Args:
+            file_path: Path to log file
+        
+        Returns:
+            Tuple of (DeviceAccumulator or None if unreadable, latest entries)
+        """
+        state = self._refresh(file_path)
+        if state is None:
+            return None, []
+        return state.accumulator, list(state.entries)
+    
+    def _refresh(self, file_path: Path) -> Optional[_TailState]:
+        """Bring the state of one file up to date (reads appended bytes only)"""
+        file_key = str(file_path)
+        
+        try:
+            with self.lock:
+                stat = os.stat(file_path)
+                identity = (stat.st_dev, stat.st_ino)
+                state = self.states.get(file_key)
+                
+                # Appended bytes only, unless the file was rotated or rewritten in place
+                if (state is not None and state.identity == identity
+                        and stat.st_size >= state.offset):
+                    if stat.st_size == state.offset or self._read_appended(file_path, state):
+                        return state
+                
+                # Cold start, or file was truncated/recreated/rewritten
+                state = self._cold_read(file_path, stat.st_size)
+                state.identity = identity
+                self.states[file_key] = state
+                return state
+        
+        except FileNotFoundError:
+            self.discard(file_path)
+            return None
+        
+        except Exception as e:
+            print(f"Error reading tail of {file_path}: {e}")
+            return None
+    
+    def _cold_read(self, file_path: Path, file_size: int) -> _TailState:
+        """Load the last tail_size entries without scanning the whole file"""
+        with open(file_path, 'rb') as f:
+            raw_lines, offset = read_last_lines(
+                f, file_size, self.tail_size, self.block_size)
+        
+        self.files_read += 1
+        self.bytes_read += sum(len(line) + 1 for line in raw_lines)
+        
+        lines = [line.decode('utf-8', errors='replace') for line in raw_lines]
+        entries = self.log_parser.parse_lines(lines, file_path)
+        
+        accumulator = DeviceAccumulator(self.tail_size, self.bucket_minutes)
+        if entries:
+            self._seed_buckets(file_path, accumulator.buckets,
+                               to_epoch_ms(entries[-1].timestamp), offset)
+        # Tail readings are already in the buckets: pushed again, a reading with the
+        # last seeded timestamp but a lower count would be counted as a reset
+        accumulator.extend_entries(entries, buckets=False)
+        
+        return _TailState(offset=offset,
+                          entries=deque(entries, maxlen=self.tail_size),
+                          accumulator=accumulator)
+    
+    def _seed_buckets(self, file_path: Path, buckets: MinuteBuckets,
+                      latest_ms: int, end: int):
+        """Fill production buckets from the history window before end (seek, no full scan)"""
+        with MappedLogFile(file_path) as log_file:
+            start = log_file.offset_since(window_start(buckets.capacity, latest_ms), end)
+            # One reading before the window, so production of its first reading is known
+            start = log_file.tail_offset(1, start) if start > 0 else 0
+            timestamps, counts = log_file.records_between(start, end)
+        
+        buckets.extend(timestamps, counts)
+    
+    def _read_appended(self, file_path: Path, state: _TailState) -> bool:
+        """
+        Parse complete lines appended after state.offset
+        
+        Returns:
+            False if the file was rewritten below the offset (read it cold instead)
+        """
+        # The offset always follows a newline: read from the byte before it to check
+        start = state.offset - 1 if state.offset > 0 else 0
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            data = f.read()
+        
+        self.files_read += 1
+        self.bytes_read += len(data)
+        
+        if state.offset > 0:
+            if data[:1] != b'\n':
+                return False
+            data = data[1:]
+        
+        # Hold back a partially written last line until it is complete
+        last_newline = data.rfind(b'\n')
+        if last_newline == -1:
+            return True
+        
+        data = data[:last_newline + 1]
+        state.offset += len(data)
+        
+        lines = data.decode('utf-8', errors='replace').splitlines()
+        new_entries = self.log_parser.parse_lines(lines, file_path)
+        state.entries.extend(new_entries)
+        # O(1) per entry: the accumulator never rescans the tail
+        state.accumulator.extend_entries(new_entries)
+        return True
+    
+    def retain(self, file_paths: Iterable[Path]):
+        """Drop state for files that are no longer tracked (e.g. after day rollover)"""
+        keep = {str(p) for p in file_paths}
+        with self.lock:
+            for file_key in list(self.states):
+                if file_key not in keep:
+                    del self.states[file_key]
+    
+    def discard(self, file_path: Path):
+        """Forget a single file"""
+        with self.lock:
+            self.states.pop(str(file_path), None)
+    
+    def clear(self):
+        """Forget all files"""
+        with self.lock:
+            self.states.clear()
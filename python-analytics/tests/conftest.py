@@ -0,0 +1,5 @@
+"""Shared fixtures: the service modules live one directory up"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
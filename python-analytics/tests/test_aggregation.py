@@ -0,0 +1,108 @@
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+import config
+from aggregation import AggregationTree
+from analytics_service import AnalyticsService
+from metrics_calculator import MetricsCalculator
+from models import DeviceMetrics
+
+
+def device(line, position, device_id, produced, speed, running=True):
+    return DeviceMetrics(
+        device_id=device_id, production_line=line, position=position,
+        current_count=produced, last_update=datetime(2025, 11, 19, tzinfo=timezone.utc),
+        speed_per_minute=speed / 60, speed_per_hour=speed, total_produced_today=produced,
+        total_produced_last_hour=0, total_produced_last_10min=0, is_running=running,
+        idle_time_seconds=0.0, uptime_seconds=0.0, trend='stable', efficiency_percent=None,
+    )
+
+
+def assert_matches(tree, expected):
+    """Tree totals equal calculate_line_metrics over the same devices"""
+    calculator = MetricsCalculator()
+    by_line = {}
+    for (line, _, _, _), metrics in expected.items():
+        by_line.setdefault(line, []).append(metrics)
+    
+    result = tree.all_line_metrics()
+    assert set(result) == set(by_line)
+    for line, devices in by_line.items():
+        reference = calculator.calculate_line_metrics(devices)
+        assert result[line].total_devices == reference.total_devices
+        assert result[line].running_devices == reference.running_devices
+        assert result[line].total_produced_today == reference.total_produced_today
+        assert result[line].average_speed_per_hour == pytest.approx(reference.average_speed_per_hour)
+        assert sorted(d.device_id for d in result[line].devices) == sorted(d.device_id for d in devices)
+    
+    assert tree.plant_totals() == {
+        'totalLines': len(by_line),
+        'totalRunningDevices': sum(int(m.is_running) for m in expected.values()),
+        'totalProducedToday': sum(m.total_produced_today for m in expected.values()),
+    }
+
+
+def test_random_updates_match_calculate_line_metrics():
+    rng = np.random.default_rng(0)
+    tree = AggregationTree()
+    expected = {}
+    for _ in range(2000):
+        line = f'DC-{rng.integers(1, 4):02d}'
+        brick = ['300x600', '600x600'][rng.integers(0, 2)]
+        position = ['sau-me', 'truoc-ln'][rng.integers(0, 2)]
+        device_id = f'{position.upper()}-0{rng.integers(1, 4)}'
+        key = (line, brick, position, device_id)
+        if rng.random() < 0.1:
+            tree.remove(key)
+            expected.pop(key, None)
+        else:
+            metrics = device(line, position, device_id, int(rng.integers(0, 5000)),
+                             float(rng.uniform(0, 3000)), bool(rng.random() < 0.7))
+            assert tree.update(metrics, brick) == key
+            expected[key] = metrics
+    assert_matches(tree, expected)
+    
+    tree.retain([key for key in expected if key[0] == 'DC-01'])
+    assert_matches(tree, {key: m for key, m in expected.items() if key[0] == 'DC-01'})
+
+
+def test_same_device_in_two_brick_types_counts_twice():
+    tree = AggregationTree()
+    tree.update(device('DC-01', 'sau-me', 'SAU-ME-01', 100, 60), '300x600')
+    tree.update(device('DC-01', 'sau-me', 'SAU-ME-01', 200, 120), '600x600')
+    totals = tree.line_metrics('DC-01')
+    assert totals.total_devices == 2
+    assert totals.total_produced_today == 300
+    assert tree.node('DC-01', '300x600', 'sau-me').produced == 100
+
+
+@pytest.mark.parametrize('refresh_mode', ['full', 'incremental'])
+def test_service_matches_calculate_batch(tmp_path, monkeypatch, refresh_mode):
+    """A device logging under two brick types keeps both files in the line totals"""
+    day = tmp_path / '2025-11-19'
+    start = 1763539200000
+    for brick in ('300x600', '600x600'):
+        for position, device_id in (('sau-me', 'sau-me-01'), ('truoc-ln', 'truoc-ln-01')):
+            directory = day / 'DC-01' / brick / position
+            directory.mkdir(parents=True)
+            stamps = np.datetime_as_string(
+                (start + np.arange(0, 600000, 1000)).astype('datetime64[ms]'), unit='ms')
+            counts = np.arange(len(stamps)) * (2 if brick == '300x600' else 3)
+            (directory / f'{device_id}.txt').write_text(
+                ''.join(f'[{s}Z] Count: {c}\n' for s, c in zip(stamps, counts.tolist())))
+    
+    monkeypatch.setattr(config, 'LOG_DIR', tmp_path)
+    monkeypatch.setattr(config, 'REFRESH_MODE', refresh_mode)
+    service = AnalyticsService(live_mode=False)
+    date = datetime(2025, 11, 19)
+    now = datetime.fromtimestamp((start + 600000) / 1000, tz=timezone.utc)
+    service.calculator.clock = lambda: now
+    
+    line = service.calculate_all_metrics(date)['DC-01']
+    
+    windows = [service.log_parser.parse_log_file_columnar(f)
+               for f in service.log_parser.find_device_logs(date)]
+    reference = service.calculator.calculate_batch(windows, config.TAIL_SIZE, now=now)['DC-01']
+    assert line.total_devices == reference.total_devices == 4
+    assert line.total_produced_today == reference.total_produced_today
+    assert line.running_devices == reference.running_devices
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from device_accumulator import (DeviceAccumulator, MOVING_SPEED, RESYNC_EVERY,
+                                STOP_GAP_MS)
+
+
+def readings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    gaps = rng.choice([0, 1000, 2000, 45000], size=n, p=[0.02, 0.7, 0.25, 0.03])
+    produced = rng.poisson(2, size=n)
+    produced[gaps == 45000] = 0
+    return 1763510400000 + np.cumsum(gaps), np.cumsum(produced)
+
+
+def expected(timestamps, counts):
+    """Window aggregates recomputed from scratch"""
+    gaps = np.diff(timestamps)
+    changes = np.diff(counts)
+    valid = gaps > 0
+    speeds = changes[valid] / (gaps[valid] / 1000)
+    
+    stops = np.flatnonzero((changes == 0) & (gaps > STOP_GAP_MS))
+    uptime = int(gaps[stops[-1] + 1:].sum()) if len(stops) else int(gaps.sum())
+    slope = np.polyfit(np.arange(len(speeds)), speeds, 1)[0] if len(speeds) >= 2 else None
+    return speeds, uptime, slope
+
+
+@pytest.mark.parametrize('capacity', [10, 100, RESYNC_EVERY, 2000])
+def test_matches_full_recompute(capacity):
+    timestamps, counts = readings(3 * RESYNC_EVERY + 17)
+    accumulator = DeviceAccumulator(capacity)
+    for ts, count in zip(timestamps.tolist(), counts.tolist()):
+        accumulator.push(ts, count)
+    
+    window_ts, window_counts = timestamps[-capacity:], counts[-capacity:]
+    speeds, uptime, slope = expected(window_ts, window_counts)
+    
+    assert accumulator.points() == list(zip(window_ts.tolist(), window_counts.tolist()))
+    assert accumulator.n_valid == len(speeds)
+    assert accumulator.n_moving == int((speeds >= MOVING_SPEED).sum())
+    assert accumulator.sum_y == pytest.approx(speeds.sum())
+    assert accumulator.uptime_ms == uptime
+    assert accumulator.trend_slope() == pytest.approx(slope, rel=1e-6, abs=1e-9)
+
+
+def test_large_window_resync_does_not_recurse():
+    accumulator = DeviceAccumulator(2000)
+    for i in range(5000):
+        accumulator.push(1763510400000 + i * 1000, i)
+    assert len(accumulator) == 2000
+    assert accumulator.latest() == (1763510400000 + 4999 * 1000, 4999)
+
+
+def test_out_of_order_reading_rebuilds_window():
+    accumulator = DeviceAccumulator(5)
+    for ts, count in [(1000, 1), (2000, 2), (4000, 4)]:
+        accumulator.push(ts, count)
+    accumulator.push(3000, 3)
+    assert accumulator.points() == [(1000, 1), (2000, 2), (3000, 3), (4000, 4)]
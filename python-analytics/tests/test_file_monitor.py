@@ -0,0 +1,229 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from file_monitor import (MISSED_SCANS_BEFORE_FALLBACK, CoalescingScheduler, FileMonitor,
+                          PollingNotifier, TailReader)
+
+
+DAY = datetime(2025, 11, 19, 8)
+
+
+def append(path, text):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(text)
+
+
+def test_partial_line_is_held_back(tmp_path):
+    log_file = tmp_path / 'sau-me-01.txt'
+    log_file.write_text('a\nb')
+    reader = TailReader()
+    
+    assert reader.get_new_lines(log_file) == ['a\n']
+    assert reader.get_new_lines(log_file) == []
+    append(log_file, 'c\nd\n')
+    assert reader.get_new_lines(log_file) == ['bc\n', 'd\n']
+
+
+def test_truncated_and_rewritten_files_are_read_from_the_start(tmp_path):
+    log_file = tmp_path / 'sau-me-01.txt'
+    log_file.write_text('one\ntwo\n')
+    reader = TailReader()
+    reader.get_new_lines(log_file)
+    
+    # Shorter than the offset
+    with open(log_file, 'w') as f:
+        f.write('x\n')
+    assert reader.get_new_lines(log_file) == ['x\n']
+    
+    # Rewritten in place past the offset: the byte before it is no longer a newline
+    with open(log_file, 'w') as f:
+        f.write('longer\n')
+    assert reader.get_new_lines(log_file) == ['longer\n']
+
+
+def test_rotated_file_starts_from_zero(tmp_path):
+    log_file = tmp_path / 'sau-me-01.txt'
+    log_file.write_text('old 1\nold 2\n')
+    reader = TailReader()
+    reader.get_new_lines(log_file)
+    
+    replacement = tmp_path / 'new.txt'
+    replacement.write_text('new 1\n')
+    # Kept open so the new file cannot reuse the old inode
+    with open(log_file):
+        os.replace(replacement, log_file)
+        assert reader.get_new_lines(log_file) == ['new 1\n']
+
+
+def test_checkpoint_resumes_after_restart(tmp_path):
+    log_file = tmp_path / 'sau-me-01.txt'
+    other_file = tmp_path / 'sau-me-02.txt'
+    log_file.write_text('a\nb\n')
+    other_file.write_text('c\n')
+    checkpoint = tmp_path / 'tail_offsets.json'
+    
+    reader = TailReader(checkpoint, checkpoint_interval=3600)
+    reader.get_new_lines(log_file)
+    reader.get_new_lines(other_file)
+    assert not checkpoint.exists()
+    reader.close()
+    saved = json.loads(checkpoint.read_text())
+    assert sorted(item['offset'] for item in saved['files']) == [2, 4]
+    
+    append(log_file, 'c\n')
+    # Same path, different inode (old one kept open, not reused): that position is not trusted
+    with open(other_file):
+        other_file.unlink()
+        other_file.write_text('d\n')
+        
+        resumed = TailReader(checkpoint)
+        assert resumed.get_new_lines(log_file) == ['c\n']
+        assert resumed.get_new_lines(other_file) == ['d\n']
+
+
+def test_unreadable_checkpoint_is_ignored(tmp_path):
+    log_file = tmp_path / 'sau-me-01.txt'
+    log_file.write_text('a\n')
+    checkpoint = tmp_path / 'tail_offsets.json'
+    checkpoint.write_text('{not json')
+    
+    reader = TailReader(checkpoint)
+    assert reader.positions == {}
+    assert reader.get_new_lines(log_file) == ['a\n']
+
+
+def device_log(log_dir, line='DC-01', name='sau-me-01.txt', day='2025-11-19'):
+    directory = log_dir / day / line / '300x600' / 'sau-me'
+    directory.mkdir(parents=True, exist_ok=True)
+    log_file = directory / name
+    log_file.write_text('0\n')
+    return log_file
+
+
+def auto_monitor(log_dir):
+    """FileMonitor in auto mode driven by hand: no threads, submitted paths recorded"""
+    monitor = FileMonitor(log_dir, lambda path: None, mode='auto')
+    submitted = []
+    monitor.scheduler.submit = submitted.append
+    return monitor, submitted
+
+
+def test_polling_notifier_reports_changes_after_the_baseline(tmp_path):
+    log_file = device_log(tmp_path)
+    changes = []
+    notifier = PollingNotifier(tmp_path, changes.append)
+    
+    assert notifier.poll(DAY) == []
+    assert notifier.poll(DAY) == []
+    append(log_file, '1\n')
+    new_file = device_log(tmp_path, name='sau-me-02.txt')
+    assert sorted(notifier.poll(DAY)) == sorted([str(log_file), str(new_file)])
+    
+    # Day rollover: every file of the new day is new
+    tomorrow = device_log(tmp_path, day='2025-11-20')
+    assert notifier.poll(datetime(2025, 11, 20)) == [str(tomorrow)]
+    assert sorted(changes) == sorted([str(log_file), str(new_file), str(tomorrow)])
+
+
+def test_auto_mode_polls_a_line_watchdog_misses(tmp_path):
+    silent = device_log(tmp_path, line='DC-01')
+    reported = device_log(tmp_path, line='DC-02')
+    monitor, submitted = auto_monitor(tmp_path)
+    monitor.poller.poll(DAY)
+    
+    for scan in range(MISSED_SCANS_BEFORE_FALLBACK + 1):
+        append(silent, f'{scan}\n')
+        append(reported, f'{scan}\n')
+        # Watchdog only sees DC-02, sometimes after the scan
+        if scan % 2:
+            monitor.poller.poll(DAY)
+            monitor._on_native_event(str(reported))
+        else:
+            monitor._on_native_event(str(reported))
+            monitor.poller.poll(DAY)
+    
+    assert monitor.polled_subtrees == {str(tmp_path / '2025-11-19' / 'DC-01')}
+    # Missed changes were still processed, late
+    assert submitted.count(str(silent)) == MISSED_SCANS_BEFORE_FALLBACK
+    
+    # From now on every change in DC-01 is submitted by the poller as it is found
+    submitted.clear()
+    append(silent, 'x\n')
+    monitor.poller.poll(DAY)
+    assert submitted == [str(silent)]
+
+
+def test_auto_mode_native_event_resets_the_missed_count(tmp_path):
+    log_file = device_log(tmp_path)
+    monitor, submitted = auto_monitor(tmp_path)
+    monitor.poller.poll(DAY)
+    
+    def scan(native):
+        append(log_file, '1\n')
+        monitor.poller.poll(DAY)
+        if native:
+            monitor._on_native_event(str(log_file))
+    
+    scan(native=False)
+    scan(native=False)
+    assert monitor.missed == {str(tmp_path / '2025-11-19' / 'DC-01'): 1}
+    assert submitted == [str(log_file)]
+    
+    # The last change is reported late, before the next scan: the subtree recovers
+    monitor._on_native_event(str(log_file))
+    for native in [False, True] * 3:
+        scan(native)
+    assert monitor.missed == {}
+    assert monitor.polled_subtrees == set()
+
+
+def wait_idle(scheduler, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while (scheduler.pending or scheduler.running) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_burst_for_one_path_runs_the_callback_once_or_twice():
+    calls = []
+    scheduler = CoalescingScheduler(calls.append, delay=0.05, max_workers=2)
+    scheduler.start()
+    try:
+        for _ in range(500):
+            scheduler.submit('/logs/sau-me-01.txt')
+        wait_idle(scheduler)
+    finally:
+        scheduler.stop()
+    
+    # Once, or twice if the run started while the burst was still arriving
+    assert 1 <= len(calls) <= 2
+    assert scheduler.events_received == 500
+    assert scheduler.events_coalesced == 500 - len(calls)
+
+
+def test_event_during_a_run_schedules_one_more_run():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    
+    def callback(path):
+        calls.append(path)
+        started.set()
+        release.wait(5)
+    
+    scheduler = CoalescingScheduler(callback, delay=0.01)
+    scheduler.start()
+    try:
+        scheduler.submit('/logs/sau-me-01.txt')
+        assert started.wait(5)
+        for _ in range(10):
+            scheduler.submit('/logs/sau-me-01.txt')
+        assert scheduler.pending == 1
+        release.set()
+        wait_idle(scheduler)
+    finally:
+        scheduler.stop()
+    
+    assert len(calls) == 2
+    assert (scheduler.events_received, scheduler.events_coalesced) == (11, 9)
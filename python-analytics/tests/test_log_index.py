@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+from log_index import UNKNOWN_BRICK_TYPE, LogIndex
+
+
+DATE = '2025-11-19'
+
+
+def write_log(directory, name, hours):
+    """One reading at the start of each hour"""
+    directory.mkdir(parents=True, exist_ok=True)
+    log_file = directory / name
+    log_file.write_text(''.join(f'[{DATE}T{h:02d}:00:00.000Z] Count: {h}\n' for h in hours))
+    return log_file
+
+
+def device_dir(tmp_path, line='DC-01', brick_type='300x600', position='sau-me'):
+    return tmp_path / DATE / line / brick_type / position
+
+
+def at(hour, minute=0):
+    return datetime(2025, 11, 19, hour, minute, tzinfo=timezone.utc)
+
+
+def test_rotation_to_a_newer_file_and_removal_fallback(tmp_path):
+    directory = device_dir(tmp_path)
+    first = write_log(directory, 'sau-me-01_20251119T080000.txt', [8, 9])
+    index = LogIndex(tmp_path)
+    index.refresh(DATE)
+    assert index.latest_files(DATE) == [first]
+    
+    # Rotated: the newer timestamped file becomes the active one
+    second = write_log(directory, 'sau-me-01_20251119T100000.txt', [10])
+    index.refresh(DATE)
+    assert index.latest_files(DATE) == [second]
+    assert [f.path for f in index.device_files(DATE, 'DC-01', '300x600', 'sau-me', 'sau-me-01')] == [
+        first, second]
+    
+    # The active file is removed: the previous one is the latest again
+    second.unlink()
+    index.refresh(DATE)
+    assert index.latest_files(DATE) == [first]
+    
+    first.unlink()
+    index.refresh(DATE)
+    assert index.latest_files(DATE) == []
+
+
+def test_old_and_new_layouts_side_by_side(tmp_path):
+    new = write_log(device_dir(tmp_path), 'sau-me-01.txt', [8])
+    old = write_log(tmp_path / DATE / 'DC-02' / 'truoc-lo', 'truoc-lo-01.txt', [8])
+    # Neither layout: not a device log
+    write_log(tmp_path / DATE / 'DC-03', 'notes.txt', [8])
+    index = LogIndex(tmp_path)
+    index.refresh(DATE)
+    
+    assert sorted(index.latest_files(DATE)) == sorted([new, old])
+    assert index.device_files(DATE, 'DC-01', '300x600', 'sau-me', 'SAU-ME-01')[0].path == new
+    assert index.device_files(DATE, 'DC-02', UNKNOWN_BRICK_TYPE, 'truoc-lo',
+                              'TRUOC-LO-01')[0].path == old
+
+
+def test_files_between_skips_files_outside_the_window(tmp_path):
+    directory = device_dir(tmp_path)
+    morning = write_log(directory, 'sau-me-01_20251119T060000.txt', [6, 7])
+    noon = write_log(directory, 'sau-me-01_20251119T110000.txt', [11, 12])
+    evening = write_log(directory, 'sau-me-01_20251119T180000.txt', [18, 19])
+    active = write_log(directory, 'sau-me-01_20251119T230000.txt', [])  # no records yet
+    index = LogIndex(tmp_path)
+    
+    assert [f.path for f in index.files_between(at(11, 30), at(17))] == [noon]
+    assert [f.path for f in index.files_between(at(7), at(18))] == [morning, noon, evening]
+    assert index.files_between(at(8), at(10, 59)) == []
+    
+    # The active file is re-read once it grows
+    assert index.files_between(at(22), at(23, 30)) == []
+    with open(active, 'a') as f:
+        f.write(f'[{DATE}T23:00:00.000Z] Count: 23\n')
+    assert [f.path for f in index.files_between(at(22), at(23, 30))] == [active]
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+from log_parser import LogParser
+
+
+def device_log(tmp_path, text):
+    directory = tmp_path / '2025-11-19' / 'DC-01' / '300x600' / 'sau-me'
+    directory.mkdir(parents=True)
+    log_file = directory / 'sau-me-01.txt'
+    log_file.write_text(text)
+    return log_file
+
+
+def test_entries_since_filters_before_building_entries(tmp_path):
+    # Out of order on purpose: the filter is on timestamps, not a position in the file
+    seconds = [0, 5, 20, 10, 30, 25, 40]
+    log_file = device_log(tmp_path, ''.join(
+        f'[2025-11-19T08:00:{s:02d}.000Z] Count: {i}\n' for i, s in enumerate(seconds)))
+    parser = LogParser(tmp_path)
+    since = datetime(2025, 11, 19, 8, 0, 10, tzinfo=timezone.utc)
+    
+    entries = parser.get_entries_since(log_file, since)
+    
+    reference = [e for e in parser.parse_lines(log_file.read_text().splitlines(), log_file)
+                 if e.timestamp >= since]
+    assert entries == reference
+    assert [e.count for e in entries] == [2, 3, 4, 5, 6]
+    assert parser.get_entries_since(log_file, datetime(2025, 11, 20, tzinfo=timezone.utc)) == []
+
+
+def test_columnar_parser_matches_regex_parser(tmp_path):
+    lines = [
+        '[2025-11-19T08:00:00.000Z] Count: 0',
+        '[2025-11-19T08:00:01.250Z] Count: 3',
+        'garbage line',
+        '',
+        '[2025-11-19T08:00:02.000Z] Count: 12345678',
+        '[2025-11-19T08:00:03.999Z] Count: 7\r',
+        '[2025-11-19T08:00:04.000Z] Count: 9',
+    ]
+    log_file = device_log(tmp_path, '\n'.join(lines) + '\n')
+    parser = LogParser(tmp_path)
+    
+    columns = parser.parse_log_file_columnar(log_file)
+    
+    assert columns.to_entries() == parser.parse_lines(lines, log_file)
+    assert (columns.production_line, columns.brick_type, columns.position, columns.device_id) == (
+        'DC-01', '300x600', 'sau-me', 'SAU-ME-01')
+
+
+def test_tail_of_columns(tmp_path):
+    log_file = device_log(tmp_path, ''.join(
+        f'[2025-11-19T08:00:{s:02d}.000Z] Count: {s}\n' for s in range(5)))
+    columns = LogParser(tmp_path).parse_log_file_columnar(log_file)
+    
+    assert list(columns.tail(2).counts) == [3, 4]
+    assert list(columns.tail(10).counts) == [0, 1, 2, 3, 4]
+    for n in (0, -1):
+        tail = columns.tail(n)
+        assert len(tail) == 0 and len(tail.timestamps) == 0
+        assert tail.device_id == 'SAU-ME-01'
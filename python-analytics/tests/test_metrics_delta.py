@@ -0,0 +1,97 @@
+import copy
+import random
+from metrics_delta import MetricsDeltaTracker
+
+
+def device(device_id, count, idle=0.0, running=True):
+    return {'deviceId': device_id, 'currentCount': count, 'isRunning': running,
+            'idleTimeSeconds': idle}
+
+
+def line(name, devices):
+    return {'productionLine': name, 'totalProducedToday': sum(d['currentCount'] for d in devices),
+            'devices': devices}
+
+
+def aggregate(total, timestamp='2025-11-19T08:00:00Z'):
+    return {'totalProducedToday': total, 'timestamp': timestamp}
+
+
+def apply(state, deltas):
+    """What a subscriber does with a delta: line name -> {field, 'devices': {id: fields}}"""
+    for name, delta in deltas.items():
+        if delta.get('removed'):
+            del state[name]
+            continue
+        current = state.setdefault(name, {'devices': {}})
+        for device_id, fields in delta.get('devices', {}).items():
+            current['devices'].setdefault(device_id, {}).update(fields)
+        for device_id in delta.get('removedDevices', []):
+            del current['devices'][device_id]
+        current.update({k: v for k, v in delta.items() if k not in ('devices', 'removedDevices')})
+
+
+def as_state(line_dicts):
+    return {name: {**{k: v for k, v in d.items() if k != 'devices'},
+                   'devices': {x['deviceId']: x for x in d['devices']}}
+            for name, d in line_dicts.items()}
+
+
+def test_only_changed_devices_and_fields_are_sent():
+    tracker = MetricsDeltaTracker(60)
+    tracker.reset({'DC-01': line('DC-01', [device('ME-01', 1), device('ME-02', 2)])}, aggregate(3))
+    
+    deltas, aggregate_changed = tracker.diff(
+        {'DC-01': line('DC-01', [device('ME-01', 1, idle=10.0), device('ME-02', 5)])},
+        aggregate(6, timestamp='2025-11-19T08:00:10Z'))
+    
+    # ME-01 only idled longer: not sent. ME-02's idle time rides along with its count
+    assert deltas == {'DC-01': {'totalProducedToday': 6,
+                                'devices': {'ME-02': {'currentCount': 5, 'idleTimeSeconds': 0.0}}}}
+    assert aggregate_changed
+
+
+def test_removed_devices_and_lines():
+    tracker = MetricsDeltaTracker(60)
+    tracker.reset({'DC-01': line('DC-01', [device('ME-01', 1), device('ME-02', 0)]),
+                   'DC-02': line('DC-02', [device('ME-03', 4)])}, aggregate(5))
+    
+    # Partial: DC-02 was not recalculated, it is not removed
+    deltas, _ = tracker.diff({'DC-01': line('DC-01', [device('ME-01', 1)])}, aggregate(5),
+                             partial=True)
+    assert deltas == {'DC-01': {'removedDevices': ['ME-02']}}
+    
+    deltas, aggregate_changed = tracker.diff({'DC-01': line('DC-01', [device('ME-01', 1)])},
+                                             aggregate(5, timestamp='later'))
+    assert deltas == {'DC-02': {'removed': True}}
+    assert not aggregate_changed
+
+
+def test_applying_deltas_rebuilds_the_published_state():
+    rng = random.Random(7)
+    tracker = MetricsDeltaTracker(60)
+    counts = {(name, f'ME-{i:02d}'): 0 for name in ('DC-01', 'DC-02', 'DC-03') for i in range(6)}
+    
+    def tick():
+        for key in rng.sample(sorted(counts), 5):
+            counts[key] += rng.randint(0, 3)
+        present = [key for key in sorted(counts) if rng.random() < 0.9]
+        by_line = {}
+        for name, device_id in present:
+            by_line.setdefault(name, []).append(
+                device(device_id, counts[(name, device_id)], idle=rng.random()))
+        return {name: line(name, devices) for name, devices in by_line.items()}
+    
+    first = tick()
+    tracker.reset(first, aggregate(0))
+    state = copy.deepcopy(as_state(first))
+    for _ in range(200):
+        line_dicts = tick()
+        deltas, _ = tracker.diff(line_dicts, aggregate(0))
+        apply(state, deltas)
+        expected = as_state(line_dicts)
+        # Clock-driven fields are only exact when something else changed
+        for name in expected:
+            for device_id, fields in expected[name]['devices'].items():
+                fields['idleTimeSeconds'] = state[name]['devices'][device_id]['idleTimeSeconds']
+        assert state == expected
@@ -0,0 +1,122 @@
+import numpy as np
+from log_parser import parse_buffer_arrays
+from parse_cache import HEADER, ParseCache
+
+
+def reading(second, count, end='\n'):
+    return f'[2025-11-19T08:00:{second:02d}.000Z] Count: {count}{end}'
+
+
+def device_log(tmp_path, text):
+    directory = tmp_path / '2025-11-19' / 'DC-01' / '300x600' / 'sau-me'
+    directory.mkdir(parents=True)
+    log_file = directory / 'sau-me-01.txt'
+    log_file.write_text(text)
+    return log_file
+
+
+def assert_uncached(columns, log_file):
+    """Same arrays as parsing the whole file without the cache"""
+    timestamps, counts = parse_buffer_arrays(log_file.read_bytes())
+    np.testing.assert_array_equal(columns[0], timestamps)
+    np.testing.assert_array_equal(columns[1], counts)
+
+
+class Counting(ParseCache):
+    """ParseCache recording which path each load took"""
+    
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.calls = []
+    
+    def _rebuild(self, *args):
+        self.calls.append('rebuild')
+        return super()._rebuild(*args)
+    
+    def _extend(self, *args):
+        self.calls.append('extend')
+        return super()._extend(*args)
+
+
+def test_appends_extend_the_cache(tmp_path):
+    log_file = device_log(tmp_path, ''.join(reading(s, s) for s in range(10)))
+    cache = Counting(tmp_path / 'cache')
+    
+    assert_uncached(cache.load(log_file), log_file)
+    assert_uncached(cache.load(log_file), log_file)
+    with open(log_file, 'a') as f:
+        f.write(reading(10, 10) + reading(11, 11))
+    assert_uncached(cache.load(log_file), log_file)
+    assert cache.calls == ['rebuild', 'extend']
+
+
+def test_last_line_without_newline_is_returned_but_not_cached(tmp_path):
+    log_file = device_log(tmp_path, reading(0, 0) + reading(1, 1) + reading(2, 2, end=''))
+    cache = Counting(tmp_path / 'cache')
+    
+    for _ in range(2):
+        timestamps, counts = cache.load(log_file)
+        assert list(counts) == [0, 1, 2]
+    # The unterminated line is not part of the cached records
+    assert HEADER.unpack(cache.cache_path(log_file).read_bytes()[:HEADER.size])[-1] == 2
+    
+    # The line grows: its final value is read, not the cached partial one
+    with open(log_file, 'a') as f:
+        f.write('3\n' + reading(3, 3, end=''))
+    timestamps, counts = cache.load(log_file)
+    assert list(counts) == [0, 1, 23, 3]
+    assert_uncached((timestamps, counts), log_file)
+    assert cache.calls == ['rebuild', 'extend']
+    
+    # A partially written line does not parse, with or without the cache
+    with open(log_file, 'a') as f:
+        f.write('\n[2025-11-19T08:00:04.000Z] Cou')
+    assert_uncached(cache.load(log_file), log_file)
+
+
+def test_truncated_or_replaced_source_rebuilds(tmp_path):
+    log_file = device_log(tmp_path, ''.join(reading(s, s) for s in range(10)))
+    cache = Counting()  # sidecar next to the log file
+    cache.load(log_file)
+    
+    log_file.write_text(reading(0, 100))
+    assert list(cache.load(log_file)[1]) == [100]
+    
+    replacement = log_file.with_name('rotated.txt')
+    replacement.write_text(reading(0, 200) + reading(1, 201))
+    with open(log_file):  # kept open so the inode is not reused
+        replacement.replace(log_file)
+        assert list(cache.load(log_file)[1]) == [200, 201]
+    assert cache.calls == ['rebuild', 'rebuild', 'rebuild']
+    
+    cache.invalidate(log_file)
+    assert not cache.cache_path(log_file).exists()
+    cache.invalidate(log_file)
+
+
+def test_corrupt_cache_file_is_rebuilt(tmp_path, capsys):
+    log_file = device_log(tmp_path, ''.join(reading(s, s) for s in range(10)))
+    cache = Counting(tmp_path / 'cache')
+    cache.load(log_file)
+    
+    cache_path = cache.cache_path(log_file)
+    cache_path.write_bytes(cache_path.read_bytes()[:HEADER.size + 16])
+    with open(log_file, 'a') as f:
+        f.write(reading(10, 10))
+    assert_uncached(cache.load(log_file), log_file)
+    assert 'Invalid parse cache' in capsys.readouterr().out
+    assert cache.calls == ['rebuild', 'extend', 'rebuild']
+
+
+def test_unwritable_cache_warns_once_per_file(tmp_path, capsys):
+    log_file = device_log(tmp_path, reading(0, 0))
+    cache = ParseCache(tmp_path / 'cache')
+    # Writing the temporary file fails like on a read-only mount
+    cache.cache_path(log_file).with_name(cache.cache_path(log_file).name + '.tmp').mkdir()
+    
+    for second in range(1, 4):
+        with open(log_file, 'a') as f:
+            f.write(reading(second, second))
+        assert_uncached(cache.load(log_file), log_file)
+    
+    assert capsys.readouterr().out.count('Could not write parse cache') == 1
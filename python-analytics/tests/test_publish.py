@@ -0,0 +1,21 @@
+import pytest
+import config
+from analytics_service import AnalyticsService
+from serializers import Serializer
+
+
+def test_unknown_output_mode_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'LOG_DIR', tmp_path)
+    monkeypatch.setattr(config, 'OUTPUT_MODE', 'stream')
+    with pytest.raises(ValueError, match='OUTPUT_MODE'):
+        AnalyticsService(live_mode=False)
+
+
+def test_serializer_subclasses_must_implement_dumps():
+    class Incomplete(Serializer):
+        name = 'incomplete'
+    
+    with pytest.raises(TypeError):
+        Incomplete()
+    with pytest.raises(TypeError):
+        Serializer()
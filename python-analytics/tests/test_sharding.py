@@ -0,0 +1,109 @@
+import json
+import threading
+import time
+import fakeredis
+import pytest
+from models import LineMetrics
+from sharding import AGGREGATE_SHARD, LEASE_KEY, SUMMARY_KEY, ShardCoordinator
+
+
+LINES = {f'line{i}' for i in range(12)}
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def coordinator(redis_client, worker_id, lease_ttl=30):
+    shard = ShardCoordinator(redis_client, worker_id, lease_ttl=lease_ttl)
+    shard.lines = set(LINES)
+    return shard
+
+
+def line(name, running=1, produced=10):
+    return LineMetrics(production_line=name, total_devices=running, running_devices=running,
+                       stopped_devices=0, total_produced_today=produced,
+                       average_speed_per_hour=0.0, devices=[])
+
+
+def execute(redis_client, commands):
+    """Send publish commands the way the service queues them"""
+    pipe = redis_client.pipeline(transaction=False)
+    for command, *args in commands:
+        getattr(pipe, command)(*args)
+    pipe.execute()
+
+
+def test_leases_split_lines_and_move_on_release(redis_client):
+    first, second = coordinator(redis_client, 'worker-1'), coordinator(redis_client, 'worker-2')
+    first.heartbeat()
+    assert first.owned == LINES | {AGGREGATE_SHARD}
+    
+    # The second worker only gets its lines once the first one released them
+    second.heartbeat()
+    assert second.owned == set()
+    first.heartbeat()
+    second.heartbeat()
+    assert first.owned | second.owned == LINES | {AGGREGATE_SHARD}
+    assert not first.owned & second.owned
+    assert second.owned
+    for name in second.owned:
+        assert redis_client.get(LEASE_KEY.format(name)) == 'worker-2'
+    
+    second.stop()
+    assert all(redis_client.get(LEASE_KEY.format(name)) is None for name in LINES - first.owned)
+    first.heartbeat()
+    assert first.owned == LINES | {AGGREGATE_SHARD}
+
+
+def test_owns_stops_before_the_lease_expires(redis_client):
+    shard = coordinator(redis_client, 'worker-1', lease_ttl=3)
+    shard.heartbeat()
+    assert shard.owns('line0')
+    
+    shard.valid_until = time.monotonic() + 0.9
+    assert 'line0' in shard.owned
+    assert not shard.owns('line0')
+    assert not shard.publishes_aggregate
+
+
+def test_gone_lines_are_dropped_from_summaries(redis_client):
+    first, second = coordinator(redis_client, 'worker-1'), coordinator(redis_client, 'worker-2')
+    execute(redis_client, first.summary_commands({'line0': line('line0'), 'line1': line('line1')}))
+    assert set(redis_client.hgetall(SUMMARY_KEY)) == {'line0', 'line1'}
+    
+    # line1 moved to the second worker, which published it first: its totals stay
+    execute(redis_client, second.summary_commands({'line1': line('line1', produced=20)}))
+    execute(redis_client, first.summary_commands({}))
+    summaries = redis_client.hgetall(SUMMARY_KEY)
+    assert set(summaries) == {'line1'}
+    assert json.loads(summaries['line1']) == {
+        'runningDevices': 1, 'totalProducedToday': 20, 'worker': 'worker-2'}
+    assert first.summary_commands({}) == []
+
+
+def test_merged_totals_leave_out_own_stale_lines(redis_client):
+    shard = coordinator(redis_client, 'worker-1')
+    shard.summaries = {
+        'line0': {'runningDevices': 1, 'totalProducedToday': 5, 'worker': 'worker-1'},
+        'line1': {'runningDevices': 2, 'totalProducedToday': 7, 'worker': 'worker-2'},
+    }
+    assert shard.merged_totals({'line2': line('line2')}) == {
+        'line1': {'runningDevices': 2, 'totalProducedToday': 7, 'worker': 'worker-2'},
+        'line2': {'runningDevices': 1, 'totalProducedToday': 10},
+    }
+
+
+def test_leases_are_not_released_during_a_publish(redis_client):
+    shard = coordinator(redis_client, 'worker-1')
+    shard.heartbeat()
+    
+    stopper = threading.Thread(target=shard.stop)
+    with shard.publish_lock:
+        stopper.start()
+        stopper.join(0.2)
+        assert stopper.is_alive()
+        assert redis_client.get(LEASE_KEY.format('line0')) == 'worker-1'
+    stopper.join()
+    assert redis_client.get(LEASE_KEY.format('line0')) is None
@@ -0,0 +1,90 @@
+from log_parser import LogParser
+from production_buckets import MinuteBuckets
+from tail_cache import TailCache
+
+
+def reading(second, count):
+    return f'[2025-11-19T08:00:{second:02d}.000Z] Count: {count}\n'
+
+
+def device_log(tmp_path, seconds):
+    directory = tmp_path / '2025-11-19' / 'DC-01' / '300x600' / 'sau-me'
+    directory.mkdir(parents=True)
+    log_file = directory / 'sau-me-01.txt'
+    log_file.write_text(''.join(reading(s, s * 2) for s in range(seconds)))
+    return log_file
+
+
+def test_get_tail_refreshes_once(tmp_path):
+    log_file = device_log(tmp_path, 20)
+    cache = TailCache(LogParser(tmp_path), tail_size=5)
+    cache.get_tail(log_file)
+    
+    with open(log_file, 'a') as f:
+        f.write(reading(20, 40) + reading(21, 42))
+    files_read = cache.files_read
+    accumulator, entries = cache.get_tail(log_file)
+    
+    assert cache.files_read == files_read + 1
+    assert [e.count for e in entries] == [34, 36, 38, 40, 42]
+    assert accumulator.size == 5
+    assert accumulator.latest()[1] == 42
+
+
+def test_partial_last_line_is_held_back(tmp_path):
+    log_file = device_log(tmp_path, 3)
+    with open(log_file, 'a') as f:
+        f.write('[2025-11-19T08:00:03.000Z] Cou')
+    cache = TailCache(LogParser(tmp_path), tail_size=5)
+    
+    assert [e.count for e in cache.get_entries(log_file)] == [0, 2, 4]
+    with open(log_file, 'a') as f:
+        f.write('nt: 6\n[2025-11-19T08:00:04.000Z] Count: 8')
+    assert [e.count for e in cache.get_entries(log_file)] == [0, 2, 4, 6]
+    with open(log_file, 'a') as f:
+        f.write('\n')
+    assert [e.count for e in cache.get_entries(log_file)] == [0, 2, 4, 6, 8]
+
+
+def test_truncated_file_is_read_again(tmp_path):
+    log_file = device_log(tmp_path, 20)
+    cache = TailCache(LogParser(tmp_path), tail_size=5)
+    cache.get_tail(log_file)
+    
+    log_file.write_text(reading(0, 100) + reading(1, 101))
+    accumulator, entries = cache.get_tail(log_file)
+    assert [e.count for e in entries] == [100, 101]
+    assert accumulator.size == 2
+
+
+def test_cold_read_counts_tail_production_once(tmp_path):
+    # The last two readings share a millisecond, the second one with a lower count
+    log_file = device_log(tmp_path, 30)
+    with open(log_file, 'a') as f:
+        f.write(reading(30, 61) + reading(30, 60))
+    cache = TailCache(LogParser(tmp_path), tail_size=5)
+    accumulator = cache.get_accumulator(log_file)
+    
+    reference = MinuteBuckets(60)
+    for entry in cache.log_parser.parse_log_file(log_file):
+        reference.push(int(entry.timestamp.timestamp() * 1000), entry.count)
+    now_ms = accumulator.latest()[0]
+    assert accumulator.buckets.totals(now_ms) == reference.totals(now_ms)
+
+
+def test_rotated_or_rewritten_file_is_read_again(tmp_path):
+    log_file = device_log(tmp_path, 5)
+    cache = TailCache(LogParser(tmp_path), tail_size=5)
+    cache.get_tail(log_file)
+    
+    # Replaced by a longer file (new inode; old one kept open so it is not reused)
+    replacement = tmp_path / 'rotated.txt'
+    replacement.write_text(''.join(reading(s, 100 + s) for s in range(8)))
+    with open(log_file):
+        replacement.replace(log_file)
+        assert [e.count for e in cache.get_entries(log_file)] == [103, 104, 105, 106, 107]
+    
+    # Rewritten in place past the stored offset (same inode, lines no longer aligned)
+    with open(log_file, 'w') as f:
+        f.write(''.join(reading(s, 2000 + s) for s in range(10)))
+    assert [e.count for e in cache.get_entries(log_file)] == [2005, 2006, 2007, 2008, 2009]